@@ -1,5 +1,7 @@
+import os, re, tempfile, atexit, shutil
 from collections import OrderedDict
 from TwoDAlphabet.helpers import roofit_form_to_TF1
+import ROOT
 from ROOT import RooRealVar, RooFormulaVar, RooArgList, RooParametricHist2D, RooConstVar, TFormula, RooAddition
 from TwoDAlphabet.binning import copy_hist_with_new_bins
 import itertools
@@ -25,15 +27,18 @@ class Generic2D(object):
         binArgLists (dict): Dict mapping of the subspaces (LOW, SIG, HIGH) to the RooArgList of the RooAbsArgs in the subspace.
         rph (dict): Dict mapping of the subspaces (LOW, SIG, HIGH) to the RooParametricHist2D objects of the subspaces.
         forcePositive (bool): Option to ensure bin values cannot be negative.
+        compiled (bool): If True, the bins of each subspace are views of one compiled
+            TwoDAlphabetCategoryFunc (stored in `catFuncs`) which evaluates all of them at once.
     '''
     
-    def __init__(self,name,binning,forcePositive=True):
+    def __init__(self,name,binning,forcePositive=True,compiled=False):
         '''Constructor.
 
         Args:
             name (str): Unique name of object which will be prepended to all associated RooFit objects.
             binning (TwoDAlphabet.Binning): Binning scheme object.
             forcePositive (bool, optional). Defaults to True in which case the bin values will be lower bound by 1e-9.
+            compiled (bool, optional). Defaults to False in which case each bin is its own RooFit object.
         '''
         self.name = name
         self.binning = binning
@@ -43,7 +48,66 @@ class Generic2D(object):
         self.binArgLists = {c:None for c in self.subspaces}
         self.rph = {c:None for c in self.subspaces}
         self.forcePositive = forcePositive
-        self._varStorage = [] # only used by AddShapeTemplates
+        self.compiled = compiled
+        self.catFuncs = {}
+        self._varStorage = [] # keeps the RooFit objects that bins use (but do not own) alive
+
+    def _buildCategoryFunc(self,cat,formula,pars,a=None,b=None,forcePositive=None):
+        '''Create the TwoDAlphabetCategoryFunc of subspace `cat` and fill
+        `binVars` with one TwoDAlphabetCategoryBin per bin.
+
+        Args:
+            cat (str): Subspace name ("LOW", "SIG", or "HIGH").
+            formula (str): TFormula expression in x, y (mapped bin centers), z and t
+                (the bins of `a` and `b`) and the parameters [0], [1], ...
+            pars (RooArgList): Parameters of the formula.
+            a (RooArgList, optional): Input bins of the first object (see `_categoryInput`). Defaults to None.
+            b (RooArgList, optional): Input bins of the second object. Defaults to None.
+            forcePositive (bool, optional): Defaults to None in which case `self.forcePositive` is used.
+
+        Raises:
+            ValueError: If the formula cannot be compiled.
+        '''
+        load_category_func()
+        cat_name = self.name+'_'+cat
+        x, y = ROOT.std.vector('double')(), ROOT.std.vector('double')()
+        for yc in self.binning.GetBinCentersY(mapped=True):
+            for xc in self.binning.GetBinCentersX(cat, mapped=True):
+                x.push_back(float(xc))
+                y.push_back(float(yc))
+
+        func = ROOT.TwoDAlphabetCategoryFunc(
+                    cat_name+'_func', cat_name+'_func', formula, pars,
+                    a if a is not None else RooArgList(),
+                    b if b is not None else RooArgList(),
+                    x, y, self.forcePositive if forcePositive is None else forcePositive)
+        if not func.isValid():
+            raise ValueError('Could not compile the formula "%s" for %s.'%(formula,cat_name))
+        self.catFuncs[cat] = func
+
+        ibin = 0
+        for ybin in range(1,len(self.binning.ybinList)):
+            for xbin in range(1,len(self.binning.xbinByCat[cat])):
+                bin_name = '%s_bin_%s-%s'%(cat_name,xbin,ybin)
+                self.binVars[bin_name] = ROOT.TwoDAlphabetCategoryBin(bin_name, bin_name, func, ibin)
+                ibin += 1
+
+    def _categoryInput(self,cat):
+        '''
+        Args:
+            cat (str): Subspace name ("LOW", "SIG", or "HIGH").
+
+        Returns:
+            RooArgList: The TwoDAlphabetCategoryFunc of the subspace if this object
+            is compiled. Otherwise, the bins of the subspace in TwoDAlphabetCategoryFunc order.
+        '''
+        if self.compiled:
+            return RooArgList(self.catFuncs[cat])
+        out = RooArgList()
+        for ybin in range(1,len(self.binning.ybinList)):
+            for xbin in range(1,len(self.binning.xbinByCat[cat])):
+                out.add(self.binVars['%s_bin_%s-%s'%(self.name+'_'+cat,xbin,ybin)])
+        return out
 
     def _manipulate(self,name,other,operator=''):
         '''Base method to create a new Generic2D object. When combining
@@ -55,6 +119,9 @@ class Generic2D(object):
         If attempting to add, subtract, multiply, or divide,
         use the dedicated methods. More complex use cases could be built here.
 
+        If either object is compiled, the output is also compiled and each subspace
+        is one TwoDAlphabetCategoryFunc evaluating `a<operator>b` for all bins.
+
         Args:
             name (str): Unique name for the new output Generic2D object.
             other (Generic2D): Object to combine with self.
@@ -64,8 +131,14 @@ class Generic2D(object):
         Returns:
             Generic2D: Object containing the combination of `self` and `other`.
         '''
-        out = Generic2D(name,self.binning,self.forcePositive)
+        out = Generic2D(name,self.binning,self.forcePositive,compiled=self.compiled or other.compiled)
         for cat in self.subspaces:
+            if out.compiled:
+                out._buildCategoryFunc(cat, 'z%st'%operator, RooArgList(),
+                                       self._categoryInput(cat), other._categoryInput(cat),
+                                       forcePositive=False)
+                continue
+
             new_cat_name = name+'_'+cat
             for ybin in range(1,len(self.binning.ybinList)):
                 for xbin in range(1,len(self.binning.xbinByCat[cat])):
@@ -196,7 +269,7 @@ class Generic2D(object):
             
 
 class ParametricFunction(Generic2D):
-    def __init__(self,name,binning,formula,constraints={},forcePositive=True):
+    def __init__(self,name,binning,formula,constraints={},forcePositive=True,compiled=False,sharedFormula=False):
         '''Represents parametric functions as a group of RooFormulaVars which
         create a binned distribution and which change
         as the underlying function parameters change. Set parameter specific
@@ -223,28 +296,76 @@ class ParametricFunction(Generic2D):
                 and the range of the parameter will be [-1000,1000]. 
             
         @param forcePositive (bool, optional). Defaults to True in which case the bin values will be lower bound by 1e-9.
+        @param compiled (bool, optional). Defaults to False. If True, each subspace is one compiled
+                TwoDAlphabetCategoryFunc which evaluates the formula for all of its bins in one call
+                instead of one RooFormulaVar per bin (see `load_category_func`).
+        @param sharedFormula (bool, optional). Defaults to False in which case the bin centers are written
+                into each bin's formula. If True, the bin centers are passed as RooConstVar arguments
+                so that all bins share one formula string (and one compiled TFormula). Ignored if `compiled` is True.
         '''
-        super(ParametricFunction,self).__init__(name,binning,forcePositive)
+        super(ParametricFunction,self).__init__(name,binning,forcePositive,compiled)
         self.formula = formula
         self.nuisances = self._createFuncVars(constraints)
         self.arglist = RooArgList()
         for n in self.nuisances: self.arglist.add(n['obj'])
+        if sharedFormula:
+            shared_formula, params, use_x, use_y = self._sharedFormula()
+            shared_args = RooArgList()
+            for i in params: shared_args.add(self.nuisances[i]['obj'])
 
         for cat in self.subspaces:
+            if compiled:
+                self._buildCategoryFunc(cat, roofit_form_to_TF1(self.formula), self.arglist)
+                continue
+
             cat_name = name+'_'+cat
+            if sharedFormula:
+                xConsts = [RooConstVar('%s_x_%s'%(cat_name,i+1),'%s_x_%s'%(cat_name,i+1),float(c)) for i,c in enumerate(self.binning.GetBinCentersX(cat,mapped=True))]
+                yConsts = [RooConstVar('%s_y_%s'%(cat_name,i+1),'%s_y_%s'%(cat_name,i+1),float(c)) for i,c in enumerate(self.binning.GetBinCentersY(mapped=True))]
+                self._varStorage.extend(xConsts+yConsts)
+
             for ybin in range(1,len(self.binning.ybinList)):
                 for xbin in range(1,len(self.binning.xbinByCat[cat])):
                     bin_name = '%s_bin_%s-%s'%(cat_name,xbin,ybin)
-                    xConst,yConst = self.mappedBinCenter(xbin,ybin,cat)
-                    if forcePositive: final_formula = "max(1e-9,%s)"%(self._replaceXY(xConst,yConst))
-                    else:             final_formula = self._replaceXY(xConst,yConst)
+                    if sharedFormula:
+                        final_formula = shared_formula
+                        arglist = RooArgList(shared_args)
+                        if use_x: arglist.add(xConsts[xbin-1])
+                        if use_y: arglist.add(yConsts[ybin-1])
+                    else:
+                        xConst,yConst = self.mappedBinCenter(xbin,ybin,cat)
+                        final_formula = self._replaceXY(xConst,yConst)
+                        arglist = self.arglist
+
+                    if forcePositive: final_formula = "max(1e-9,%s)"%final_formula
 
                     self.binVars[bin_name] = RooFormulaVar(
                         bin_name, bin_name,
                         final_formula,
-                        self.arglist
+                        arglist
                     )
 
+    def _sharedFormula(self):
+        '''Renumber the @indices of the input formula to the parameters it uses (in order)
+        and replace "x" and "y" with the indices that follow them ("x" first).
+
+        Returns:
+            tuple: (0) formula string (str), (1) index in self.nuisances of each of the renumbered
+                parameters (list), (2) whether "x" is used (bool), and (3) whether "y" is used (bool).
+        '''
+        params = sorted({int(i) for i in re.findall(r'@(\d+)', self.formula)})
+        new_idx = {p:i for i,p in enumerate(params)}
+        f = re.sub(r'@(\d+)', lambda m: '@%s'%new_idx[int(m.group(1))], self.formula)
+        idx = len(params)
+        use_x = re.search(r'\bx\b', f) is not None
+        use_y = re.search(r'\by\b', f) is not None
+        if use_x:
+            f = re.sub(r'\bx\b', '@%s'%idx, f)
+            idx += 1
+        if use_y:
+            f = re.sub(r'\by\b', '@%s'%idx, f)
+        return f, params, use_x, use_y
+
     def _replaceXY(self,x,y):
         '''Find and replace "x" and "y" in the input formula
         with this method's arguments (floats) which should
@@ -313,19 +434,7 @@ class ParametricFunction(Generic2D):
         Returns:
             tuple of floats: x and y values, respectively.
         '''
-        x_center = self.binning.GetBinCenterX(xbin,cat)
-        y_center = self.binning.GetBinCenterY(ybin)
-
-        x_min = self.binning.xbinList[0]
-        y_min = self.binning.ybinList[0]
-        x_range = self.binning.xbinList[-1] - x_min
-        y_range = self.binning.ybinList[-1] - y_min
-        
-        # Remap to [-1,1]
-        x_center_mapped = float(x_center - x_min)/x_range #float cast prevents returning zero if bin edges are ints
-        y_center_mapped = float(y_center - y_min)/y_range
-
-        return x_center_mapped,y_center_mapped
+        return self.binning.GetMappedBinCenter(xbin,ybin,cat)
 
     def setFuncParam(self,parIdx,value):
         '''Set the value of a given ROOT.RooRealVar object within a ParametricFunction
@@ -481,6 +590,51 @@ class BinnedDistribution(Generic2D):
                     nzeros += 1
         return nzeros
 
+_cpp_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cpp')
+_category_func_loaded = False
+
+def load_category_func(build_dir=None):
+    '''Compile (with ACLiC) and load the TwoDAlphabetCategoryFunc and TwoDAlphabetCategoryBin
+    classes used by compiled Generic2D objects. Only done once per session.
+
+    Args:
+        build_dir (str, optional): Directory for the compiled library. Defaults to None
+            in which case a new temporary directory is made for this process (and removed
+            when it exits) so that jobs running in parallel do not write to the same library.
+
+    Raises:
+        RuntimeError: If the compilation fails.
+    '''
+    global _category_func_loaded
+    if _category_func_loaded:
+        return
+    if build_dir is None:
+        build_dir = tempfile.mkdtemp(prefix='TwoDAlphabet_')
+        atexit.register(shutil.rmtree, build_dir, True)
+    elif not os.path.isdir(build_dir):
+        os.makedirs(build_dir)
+
+    ROOT.gSystem.AddIncludePath('-I%s'%_cpp_dir)
+    source = os.path.join(_cpp_dir, 'TwoDAlphabetCategoryFunc.cxx')
+    if not ROOT.gSystem.CompileMacro(source, 'kO', '', build_dir):
+        raise RuntimeError('Could not compile %s.'%source)
+    _category_func_loaded = True
+
+def import_category_func_code(workspace):
+    '''Store the source of the compiled Generic2D classes in `workspace` so that
+    Combine can compile them when reading the workspace. Does nothing if the
+    workspace does not hold any object of these classes.
+
+    Args:
+        workspace (RooWorkspace): Workspace to store the source in.
+    '''
+    if not any(arg.ClassName().startswith('TwoDAlphabetCategory') for arg in workspace.components()):
+        return
+    ROOT.RooWorkspace.addClassDeclImportDir(_cpp_dir)
+    ROOT.RooWorkspace.addClassImplImportDir(_cpp_dir)
+    if not workspace.importClassCode('TwoDAlphabetCategory*', True):
+        raise RuntimeError('Could not import the source of %s/TwoDAlphabetCategoryFunc.cxx into workspace %s.'%(_cpp_dir,workspace.GetName()))
+
 def singleBinInterp(name, nuis, binVar, upVal, downVal, forcePositive):
     '''Create a RooFormulaVar containing the nuisance parameter that can
     morph the initial `binVar` value between the values of `upVal` and `downVal`.
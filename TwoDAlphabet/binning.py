@@ -1,5 +1,9 @@
-import ROOT, array
+import ROOT, array, bisect, json
+import numpy as np
 from math import sqrt
+from TwoDAlphabet.helpers import hist2array, hist2sumw2, array2hist
+from TwoDAlphabet import kernels
+from TwoDAlphabet.kernels import rebin_positions, rebin_arrays, zero_nonpositive
 
 class Binning:
     '''Class to handle information on and manipulations of binning schemes.'''
@@ -21,13 +25,99 @@ class Binning:
             
         self.xtitle = binning_dict['X']['TITLE']
         self.ytitle = binning_dict['Y']['TITLE']
+        self.xname = binning_dict['X']['NAME']
+        self.yname = binning_dict['Y']['NAME']
         self.xbinByCat, self.ybinList = parse_binning_info(binning_dict, self.boundaries)
+        self._buildTables()
         self.ySlices,self.ySliceIdx = self._getYslices(binning_dict)
         self.xSlices,self.xSliceIdx = self._getXslices(binning_dict) 
         self._checkBinning('X',start_template)
         self._checkBinning('Y',start_template)
-        self.xVars, self.yVar = self.CreateRRVs(binning_dict['X'], binning_dict['Y']) 
+        self._xVars, self._yVar = None, None # made on first use (see xVars and yVar)
         print(f"X Binning of {self.name}: ", self.xbinList)
+
+    def __setstate__(self, state):
+        state = dict(state)
+        if 'xVars' in state: # pickled before the RooRealVars were made lazily
+            state['_xVars'], state['_yVar'] = state.pop('xVars'), state.pop('yVar')
+        self.__dict__.update(state)
+        # Rebuilt rather than unpickled so that the arrays stay read-only (and for pickles from before the tables existed)
+        self._buildTables()
+
+    _persisted = ['name','boundaries','xtitle','ytitle','xname','yname','xbinByCat','ybinList','xSlices','xSliceIdx','ySlices','ySliceIdx']
+    def ToDict(self):
+        '''
+        Returns:
+            dict: JSON serializable edges, slices, and axis titles and names from which
+            FromDict() can rebuild the Binning (without any ROOT objects).
+        '''
+        return {k: getattr(self,k) for k in Binning._persisted}
+
+    @classmethod
+    def FromDict(cls, d):
+        '''Rebuild a Binning from the output of ToDict() without redoing the checks
+        against the input histograms. The RooRealVars are made on first use.
+
+        Args:
+            d (dict): Output of ToDict().
+
+        Raises:
+            KeyError: If a stored attribute is missing from `d`.
+
+        Returns:
+            Binning: New Binning.
+        '''
+        out = cls.__new__(cls)
+        for k in Binning._persisted:
+            if k not in d:
+                raise KeyError('Stored binning is missing "%s".'%k)
+            setattr(out, k, d[k])
+        out._xVars, out._yVar = None, None
+        out._buildTables()
+        return out
+
+    @property
+    def xVars(self):
+        '''dict: Category name to the RooRealVar of its X axis. Made on first access.'''
+        if self._xVars is None:
+            self._xVars, self._yVar = self.CreateRRVs({'NAME':self.xname,'TITLE':self.xtitle}, {'NAME':self.yname,'TITLE':self.ytitle})
+        return self._xVars
+
+    @property
+    def yVar(self):
+        '''RooRealVar: Y axis RooRealVar. Made on first access.'''
+        if self._yVar is None:
+            self.xVars
+        return self._yVar
+
+    def _buildTables(self):
+        '''Compute the bin edge, bin center, and category offset tables once so
+        that bin lookups do not rebuild them from xbinByCat. The NumPy arrays are read-only.
+        Call again if xbinByCat or ybinList are changed.
+        '''
+        self._xbinList = concat_bin_dicts(self.xbinByCat)
+        self._xedges = _frozen_array(self._xbinList)
+        self._yedges = _frozen_array(self.ybinList)
+        self._xcats = list(self.xbinByCat.keys())
+        self._xcatEnds = [] # global index of the last bin of each category
+        self._xoffsets = {} # number of global bins before each category
+        nbins = 0
+        for c in self._xcats:
+            self._xoffsets[c] = nbins
+            nbins += len(self.xbinByCat[c]) - 1
+            self._xcatEnds.append(nbins)
+
+        xmin, xrange = self._xedges[0], self._xedges[-1] - self._xedges[0]
+        ymin, yrange = self._yedges[0], self._yedges[-1] - self._yedges[0]
+        self._xcenters, self._xcentersMapped = {}, {}
+        for c in self._xcats:
+            edges = np.array(self.xbinByCat[c], dtype=float)
+            centers = (edges[1:]+edges[:-1])/2
+            self._xcenters[c] = _frozen_array(centers)
+            self._xcentersMapped[c] = _frozen_array((centers - xmin)/xrange)
+        self._ycenters = _frozen_array((self._yedges[1:]+self._yedges[:-1])/2)
+        self._ycentersMapped = _frozen_array((self._ycenters - ymin)/yrange)
+
     def CreateRRVs(self,xdict,ydict):
         '''Create the RooRealVars representing the X and Y axes.
         For the X axis, three RooRealVars are returned in a dictionary with
@@ -139,15 +229,26 @@ class Binning:
         Returns:
             int: Global index
         '''
-        return self.xbinList.index(self.xbinByCat[c][xbin])
+        if xbin < 0:
+            xbin += len(self.xbinByCat[c])
+        return self._xoffsets[c] + xbin
 
     def xcatFromGlobal(self,xbin):
-        bin_total_len = 0
-        for c in self.xbinByCat:
-            bin_len = self.xbinByCat[c] 
-            if bin_total_len <= xbin  and xbin < (bin_total_len +  bin_len):
-                return xbin - bin_total_len, c
-            bin_total_len += (bin_len - 1) 
+        '''Find the category that contains a bin of the full X axis.
+
+        Args:
+            xbin (int): Global bin index (starting at 1).
+
+        Raises:
+            ValueError: If the bin is outside of the X axis.
+
+        Returns:
+            tuple: (0) Bin index in the category (starting at 1) and (1) category name.
+        '''
+        if xbin < 1 or xbin > self._xcatEnds[-1]:
+            raise ValueError('X bin %s is outside of the X axis (bins 1 to %s).'%(xbin, self._xcatEnds[-1]))
+        c = self._xcats[bisect.bisect_left(self._xcatEnds, xbin)]
+        return xbin - self._xoffsets[c], c
 
     @property
     def xbinList(self):
@@ -156,17 +257,54 @@ class Binning:
             list: X axis binning dict converted from a dictionary of the regions to
             a continuous list of bin edges for the full X axis.
         '''
-        return concat_bin_dicts(self.xbinByCat)
+        return list(self._xbinList)
 
     def GetBinCenterBase(self,ibin,binlist):
         if ibin < 1: raise ValueError('Binning is indexed at 1 for compatibility with ROOT.')
         return (binlist[ibin]+binlist[ibin-1])/2
 
     def GetBinCenterX(self,ibin,cat):
-        return self.GetBinCenterBase(ibin,self.xbinByCat[cat])
+        if ibin < 1: raise ValueError('Binning is indexed at 1 for compatibility with ROOT.')
+        return float(self._xcenters[cat][ibin-1])
 
     def GetBinCenterY(self,ibin):
-        return self.GetBinCenterBase(ibin,self.ybinList)
+        if ibin < 1: raise ValueError('Binning is indexed at 1 for compatibility with ROOT.')
+        return float(self._ycenters[ibin-1])
+
+    def GetMappedBinCenter(self,xbin,ybin,cat):
+        '''Get the bin center where each axis has been mapped to the range [0,1].
+
+        Args:
+            xbin (int): X axis bin index in the category (starting at 1).
+            ybin (int): Y axis bin index (starting at 1).
+            cat (str): Category name.
+
+        Returns:
+            tuple of floats: x and y values, respectively.
+        '''
+        if xbin < 1 or ybin < 1: raise ValueError('Binning is indexed at 1 for compatibility with ROOT.')
+        return float(self._xcentersMapped[cat][xbin-1]), float(self._ycentersMapped[ybin-1])
+
+    def GetBinCentersX(self,cat,mapped=False):
+        '''
+        Args:
+            cat (str): Category name.
+            mapped (bool, optional): Map the X axis to the range [0,1]. Defaults to False.
+
+        Returns:
+            np.ndarray: Read-only bin centers of the category (index 0 is bin 1).
+        '''
+        return self._xcentersMapped[cat] if mapped else self._xcenters[cat]
+
+    def GetBinCentersY(self,mapped=False):
+        '''
+        Args:
+            mapped (bool, optional): Map the Y axis to the range [0,1]. Defaults to False.
+
+        Returns:
+            np.ndarray: Read-only bin centers (index 0 is bin 1).
+        '''
+        return self._ycentersMapped if mapped else self._ycenters
 
     def CreateHist(self,name,cat=''):
         if cat != '':
@@ -181,6 +319,40 @@ class Binning:
                         array.array('d',self.ybinList)
         )
 
+def save_binnings(binnings, filename):
+    '''Save a dictionary of Binning objects to JSON (see Binning.ToDict()).
+
+    Args:
+        binnings (dict): Binning name to Binning.
+        filename (str): Path to the JSON file.
+
+    Returns:
+        None
+    '''
+    with open(filename,'w') as f:
+        json.dump({k: b.ToDict() for k,b in binnings.items()}, f, indent=2)
+
+def load_binnings(filename):
+    '''Load the dictionary of Binning objects saved by save_binnings().
+
+    Args:
+        filename (str): Path to the JSON file.
+
+    Returns:
+        dict: Binning name to Binning.
+    '''
+    with open(filename) as f:
+        return {k: Binning.FromDict(d) for k,d in json.load(f).items()}
+
+def _frozen_array(values):
+    '''
+    Returns:
+        np.ndarray: Read-only float array of `values`.
+    '''
+    out = np.array(values, dtype=float)
+    out.setflags(write=False)
+    return out
+
 def create_RRV_base(name,title,bins):
     '''Generically create a RooRealVar with the specified bin edges.
 
@@ -383,19 +555,9 @@ def stitch_hists_in_x(name,binning,histList,blinded=[]):
     if histListBins != get_bins_from_hist("X",stitched_hist):
         raise ValueError('X axis bins stitched together from histList are not the same as the input template.\n%s vs %s'%(histListBins,get_bins_from_hist("X",stitched_hist)))
     # Stitch
-    bin_jump = 0
-    for i,h in enumerate(histList):
-        if i in blinded:
-            bin_jump += histList[i].GetNbinsX()
-            continue
-        
-        for ybin in range(1,h.GetNbinsY()+1):
-            for xbin in range(1,h.GetNbinsX()+1):
-                stitched_xindex = xbin + bin_jump
-                stitched_hist.SetBinContent(stitched_xindex,ybin,h.GetBinContent(xbin,ybin))
-                stitched_hist.SetBinError(stitched_xindex,ybin,h.GetBinError(xbin,ybin))
-
-        bin_jump += histList[i].GetNbinsX()
+    contents = [hist2array(h) for h in histList]
+    content, sumw2 = kernels.stitch(contents, [hist2sumw2(h) for h in histList], blinded)
+    array2hist(stitched_hist, content, sumw2, entries=sum(c.size for i,c in enumerate(contents) if i not in blinded)) # entries as if each stitched bin was set
 
     return stitched_hist
 
@@ -424,12 +586,8 @@ def make_blinded_hist(h,sigregion):
     if len(sigregion) != 2:
         raise IndexError('Signal region must be specified by list of length 2.')
 
-    for binY in range(1,h.GetNbinsY()+1):
-        for binX in range(1,h.GetNbinsX()+1):
-            if h.GetXaxis().GetBinUpEdge(binX) <= sigregion[0] or h.GetXaxis().GetBinLowEdge(binX) >= sigregion[1]:
-                if h.GetBinContent(binX,binY) > 0:
-                    blindedHist.SetBinContent(binX,binY,h.GetBinContent(binX,binY))
-                    blindedHist.SetBinError(binX,binY,h.GetBinError(binX,binY))
+    content, sumw2 = kernels.blind(hist2array(h), hist2sumw2(h), get_bins_from_hist("X",h), sigregion)
+    array2hist(blindedHist, content, sumw2, entries=np.count_nonzero(content > 0)) # entries as if each kept bin was set
 
     return blindedHist
 
@@ -462,6 +620,12 @@ def copy_hist_with_new_bins(copyName,XorY,inHist,new_bins):
     rebin_array = array.array('f',new_bins)
     rebin_nbins = len(rebin_array)-1 
 
+    # Compare against the edges as they are stored by the new axis (float precision)
+    positions = rebin_positions(get_bins_from_hist(axis_to_rebin,inHist), list(rebin_array), axis_to_rebin)
+    content, errors = hist2array(inHist, return_errors=True)
+    new_content, new_sumw2 = rebin_arrays([content, errors**2], positions, 1 if XorY == "X" else 0)
+    new_content, new_sumw2 = zero_nonpositive(new_content, new_sumw2)
+
     # Use copyName with _temp to avoid overwriting if inHist has the same name
     # We can do this at the end but not before we're finished with inHist
     if XorY == "X":
@@ -471,55 +635,108 @@ def copy_hist_with_new_bins(copyName,XorY,inHist,new_bins):
     hist_copy.Sumw2()
     hist_copy.GetXaxis().SetName(inHist.GetXaxis().GetName())
     hist_copy.GetYaxis().SetName(inHist.GetYaxis().GetName())
-    old_axis = getattr(inHist,'Get%saxis'%axis_to_rebin)()
-    rebin_axis = getattr(hist_copy,'Get%saxis'%axis_to_rebin)()
-
-    # Loop through the old bins
-    for static_bin in range(1,static_nbins+1):
-        # print 'Bin y: ' + str(binY)
-        for rebin in range(1,rebin_nbins+1):
-            new_bin_content = 0
-            new_bin_errorsq = 0
-            new_bin_min = rebin_axis.GetBinLowEdge(rebin)
-            new_bin_max = rebin_axis.GetBinUpEdge(rebin)
-
-            # print '\t New bin x: ' + str(newBinX) + ', ' + str(newBinXlow) + ', ' + str(newBinXhigh)
-            for old_bin in range(1,old_axis.GetNbins()+1):
-                old_bin_min = old_axis.GetBinLowEdge(old_bin)
-                old_bin_max = old_axis.GetBinUpEdge(old_bin)
-                if old_bin_min >= new_bin_max:
-                    break
-                elif old_bin_min >= new_bin_min and old_bin_min < new_bin_max:
-                    if old_bin_max <= new_bin_max:
-                        if axis_to_rebin == "X":
-                            new_bin_content += inHist.GetBinContent(old_bin,static_bin)
-                            new_bin_errorsq += inHist.GetBinError(old_bin,static_bin)**2
-                        else:
-                            new_bin_content += inHist.GetBinContent(static_bin,old_bin)
-                            new_bin_errorsq += inHist.GetBinError(static_bin,old_bin)**2
-                    elif old_bin_max > new_bin_max:
-                        raise ValueError(
-                            '''The requested %s rebinning does not align bin edges with the input bin edge.
-                            Cannot split input bin [%s,%s] with output bin [%s,%s]'''%(axis_to_rebin,old_bin_min,old_bin_max,new_bin_min,new_bin_max))
-                elif old_bin_min <= new_bin_min and old_bin_max > new_bin_min:
-                    raise ValueError(
-                        '''The requested %s rebinning does not align bin edges with the input bin edge.
-                        Cannot split input bin [%s,%s] with output bin [%s,%s]'''%(axis_to_rebin,old_bin_min,old_bin_max,new_bin_min,new_bin_max))
-
-            # print '\t Setting content ' + str(newBinContent) + '+/-' + str(sqrt(newBinErrorSq))
-            if new_bin_content > 0:
-                if axis_to_rebin == "X":
-                    hist_copy.SetBinContent(rebin,static_bin,new_bin_content)
-                    hist_copy.SetBinError(rebin,static_bin,sqrt(new_bin_errorsq))
-                else:
-                    hist_copy.SetBinContent(static_bin,rebin,new_bin_content)
-                    hist_copy.SetBinError(static_bin,rebin,sqrt(new_bin_errorsq))
+    array2hist(hist_copy, new_content, new_sumw2, entries=np.count_nonzero(new_content > 0)) # entries as if each filled bin was set
 
     # Will now set the copyName which will overwrite inHist if it has the same name
     hist_copy.SetName(copyName)
     hist_copy.SetTitle(copyName)
     return hist_copy
 
+def rebin_hist_2d(copyName,inHist,xbinByCat,ybins,split=True):
+    '''Rebin a 2D histogram in Y and X in one pass and split the result along X into
+    the categories of xbinByCat. Equivalent to calling copy_hist_with_new_bins() for Y
+    then X (only for the axes that need it) followed by split_hist_in_x().
+    If neither axis needs rebinning, inHist itself is renamed and returned as the full histogram.
+
+    Args:
+        copyName (str): Name of the full histogram. Should contain "_FULL" so the categories can be named.
+        inHist (TH2): Input histogram to rebin.
+        xbinByCat (dict): X bin edges per category (see Binning.xbinByCat).
+        ybins (list): New list of Y bin edges.
+        split (bool, optional): Whether to split the result into the categories. Defaults to True.
+
+    Raises:
+        ValueError: If the requested rebinning does not align bin edges with the available input bin edges.
+
+    Returns:
+        tuple: (0) TH2 over the full X axis and (1) dict of category name to TH2 (empty if split is False).
+    '''
+    xbins = concat_bin_dicts(xbinByCat)
+    old_xbins = get_bins_from_hist("X",inHist)
+    old_ybins = get_bins_from_hist("Y",inHist)
+    rebinY = old_ybins != ybins
+    if rebinY: # X edges are stored as floats once the Y axis has been rebinned
+        old_xbins = [float(b) for b in np.array(old_xbins, dtype=np.float32)]
+    rebinX = old_xbins != xbins
+
+    if not (rebinX or rebinY):
+        full = inHist
+        full.SetName(copyName)
+    else:
+        content, errors = hist2array(inHist, return_errors=True)
+        sumw2 = errors**2
+        if rebinY:
+            positions = rebin_positions(old_ybins, np.array(ybins, dtype=np.float32), "Y")
+            content, sumw2 = zero_nonpositive(*rebin_arrays([content, sumw2], positions, 0))
+            content = content.astype(np.float32) # as stored by the intermediate TH2F
+        if rebinX:
+            positions = rebin_positions(old_xbins, np.array(xbins, dtype=np.float32), "X")
+            content, sumw2 = zero_nonpositive(*rebin_arrays([content, sumw2], positions, 1))
+
+        full = _make_float_hist(copyName,
+                                xbins if rebinX else old_xbins,
+                                ybins if rebinY else old_ybins,
+                                inHist)
+        array2hist(full, content, sumw2, entries=np.count_nonzero(content > 0)) # as from copy_hist_with_new_bins()
+
+    return full, split_hist_in_x(full, xbinByCat) if split else {}
+
+def split_hist_in_x(h,xbinByCat):
+    '''Split a 2D histogram along X into the categories of xbinByCat. Equivalent to
+    calling copy_hist_with_new_bins() on h for each category but the contents of the
+    full histogram are read only once and each category is a slice of that array.
+    The categories are named by replacing "_FULL" in the name of h with the category name.
+
+    Args:
+        h (TH2): Histogram over the full X axis.
+        xbinByCat (dict): X bin edges per category (see Binning.xbinByCat).
+
+    Raises:
+        ValueError: If the category bin edges do not align with the bin edges of h.
+
+    Returns:
+        dict: Category name to TH2.
+    '''
+    content, errors = hist2array(h, return_errors=True)
+    sumw2 = errors**2
+    xbins = get_bins_from_hist("X",h)
+    ybins = get_bins_from_hist("Y",h)
+
+    out = {}
+    for cat, catbins in xbinByCat.items():
+        positions = rebin_positions(xbins, np.array(catbins, dtype=np.float32), "X")
+        if np.all(np.diff(positions) == 1): # category is a continuous slice of the full axis
+            cat_content, cat_sumw2 = zero_nonpositive(content[:, positions[0]:positions[-1]], sumw2[:, positions[0]:positions[-1]])
+        else: # merged bins are summed before the non-positive ones are dropped
+            cat_content, cat_sumw2 = zero_nonpositive(*rebin_arrays([content, sumw2], positions, 1))
+
+        name = h.GetName().replace('_FULL','_'+cat)
+        out[cat] = _make_float_hist(name, catbins, ybins, h)
+        array2hist(out[cat], cat_content, cat_sumw2, entries=np.count_nonzero(cat_content > 0)) # as from copy_hist_with_new_bins()
+
+    return out
+
+def _make_float_hist(name,xbins,ybins,axisNameHist):
+    '''Create an empty TH2F with float bin edges (as in copy_hist_with_new_bins())
+    and the axis names of axisNameHist.'''
+    xarray = array.array('f',xbins)
+    yarray = array.array('f',ybins)
+    hist = ROOT.TH2F(name,name,len(xarray)-1,xarray,len(yarray)-1,yarray)
+    hist.Sumw2()
+    hist.GetXaxis().SetName(axisNameHist.GetXaxis().GetName())
+    hist.GetYaxis().SetName(axisNameHist.GetYaxis().GetName())
+    return hist
+
 def get_min_bin_width(hist):
     '''Get the minimum width among all bins in a 1D histogram.
 
@@ -534,11 +751,22 @@ def get_min_bin_width(hist):
     '''
     if hist.GetDimension() != 1:
         raise TypeError('Only 1D histograms can be analyzed for minimum bin width.')
-    use_width = 10**6
-    for ibin in range(1,hist.GetNbinsX()+1):
-        if hist.GetBinWidth(ibin) < use_width:
-            use_width = hist.GetBinWidth(ibin)
-    return int(use_width)
+    return kernels.min_bin_width(get_bin_widths(hist))
+
+def get_bin_widths(hist):
+    '''Get the widths of the X axis bins of a histogram as TH1::GetBinWidth() computes them.
+
+    Args:
+        hist (TH1): Histogram to analyze.
+
+    Returns:
+        np.ndarray: Bin widths.
+    '''
+    axis = hist.GetXaxis()
+    if axis.IsVariableBinSize():
+        edges = np.ndarray((axis.GetNbins()+1,), dtype='f8', buffer=axis.GetXbins().GetArray())
+        return np.diff(edges)
+    return np.full(axis.GetNbins(), axis.GetBinWidth(1))
 
 def convert_to_events_per_unit(hist,width=None):
     '''Convert the bin contents of a 1D histogram so they are normalized to the
@@ -563,16 +791,9 @@ def convert_to_events_per_unit(hist,width=None):
         use_width = width
 
     converted = hist.Clone()
-    for ibin in range(1,hist.GetNbinsX()+1):
-        if hist.GetBinWidth(ibin) == use_width:
-            continue
-        else:
-            factor = use_width/hist.GetBinWidth(ibin)
-            new_content = factor * converted.GetBinContent(ibin)
-            new_error = factor * converted.GetBinError(ibin)
-            converted.SetBinContent(ibin,new_content)
-            converted.SetBinError(ibin,new_error)
-    
+    widths = get_bin_widths(hist)
+    content, sumw2 = kernels.events_per_unit(hist2array(hist), hist2sumw2(hist), widths, use_width)
+    array2hist(converted, content, sumw2, entries=np.count_nonzero(widths != use_width)) # entries as if each scaled bin was set
     return converted
 
 def zero_negative_bins(name,inhist):
@@ -586,11 +807,9 @@ def zero_negative_bins(name,inhist):
         TH2: Clone of input histogram with negative bins set to zero.
     '''
     outhist = inhist.Clone(name)
-    for ix in range(1,inhist.GetNbinsX()+1):
-        for iy in range(1,inhist.GetNbinsY()+1):
-            if inhist.GetBinContent(ix,iy) < 0:
-                outhist.SetBinContent(ix,iy,0)
-                outhist.SetBinError(ix,iy,0)
+    content = hist2array(inhist)
+    if (content < 0).any():
+        array2hist(outhist, *kernels.zero_negative(content, hist2sumw2(inhist)), entries=np.count_nonzero(content < 0)) # entries as if each zeroed bin was set
 
     return outhist
 
@@ -605,14 +824,7 @@ def remap_binlist(binList,new_min=0.0,new_max=1.0):
     Returns:
         list(float): List of bin edges mapped to new range.
     '''
-    minimum = binList[0]
-    new_min = float(new_min); new_max = float(new_max)
-    new_length = new_max - new_min
-    scale = (binList[-1]-binList[0]) / new_length
-    new_vals = []
-    for old_val in binList:
-        new_vals.append( (old_val-minimum)/scale + new_min )
-    return new_vals
+    return kernels.remap_edges(binList, new_min, new_max).tolist()
 
 def remap_hist_axis(hist,new_min=0,new_max=1):
     '''Remap axes of a 2D histogram to [new_min, new_max].
@@ -641,10 +853,7 @@ def remap_hist_axis(hist,new_min=0,new_max=1):
 
     remap = ROOT.TH2F(hist.GetName()+'_unit',hist.GetName()+'_unit',len(xbins)-1,xbins,len(ybins)-1,ybins)
     remap.Sumw2()
-
-    for xbin in range(1,hist.GetNbinsX()+1):
-        for ybin in range(1,hist.GetNbinsY()+1):
-            remap.SetBinContent(xbin,ybin,hist.GetBinContent(xbin,ybin))
-            remap.SetBinError(xbin,ybin,hist.GetBinError(xbin,ybin))
+    content = hist2array(hist)
+    array2hist(remap, content, hist2sumw2(hist), entries=content.size) # entries as if each bin was set
 
     return remap
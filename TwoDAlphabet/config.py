@@ -1,12 +1,14 @@
 from collections import OrderedDict
-import ROOT, json, os, pandas, re, warnings, itertools
+import ROOT, json, os, pandas, re, warnings, itertools, multiprocessing, tempfile, hashlib, glob, sys
 import math
 from numpy import nan
+import numpy as np
 import pprint
 pp = pprint.PrettyPrinter(indent=4)
 from TwoDAlphabet.plotstyle import mpl_to_root_colors, root_to_matplotlib_color
-from TwoDAlphabet.helpers import copy_update_dict, open_json, parse_arg_dict, replace_multi
-from TwoDAlphabet.binning import Binning, copy_hist_with_new_bins, get_bins_from_hist
+from TwoDAlphabet.helpers import copy_update_dict, open_json, parse_arg_dict, replace_multi, hist2array, hist2sumw2, open_tfile_for_writing
+from TwoDAlphabet.binning import Binning, rebin_hist_2d, split_hist_in_x
+from TwoDAlphabet.histstore import ArrayStore
 
 _protected_keys = ["PROCESSES","SYSTEMATICS","REGIONS","BINNING","OPTIONS","GLOBAL","SCALE","COLOR","TYPE","X","Y","TITLE","BINS","NBINS","LOW","HIGH"]
 _syst_col_defaults = {
@@ -19,27 +21,76 @@ _syst_col_defaults = {
     'direction': nan,
     'variation_alias': nan
 }
+_lazy_cache_size = 64 # number of split lazy sub-regions kept in memory by OrganizedHists
+_config_cache_version = 2 # increment when the contents of FullTable() change to invalidate old caches
+_interned_columns = ['process','region','process_type','variation','syst_type','source_filename','color'] # repeated on many FullTable() rows
 class Config:
     '''Class to handle the reading and manipulation of data provided 
     in 2DAlphabet JSON configuration files. Constructor initializes
     a Config object for a given set of JSON files and performs
     all initial checks and manipulations.
 
+    If `cacheDir` is provided, the expanded config, `iterWorkspaceObjs`, and the table from
+    FullTable() are read from `cacheDir`/config_cache/ when a cache exists for the same
+    JSON text, find-replace pairs, external options, and TwoDAlphabet source. Otherwise, they
+    are saved there by SaveCache() as JSON (see _table_to_json()).
+
     Args:
         jsonPath (str): File name and path.
         findreplace (dict, optional): Find-replace pairs. Defaults to {}.
+        cacheDir (str, optional): Project directory in which to cache the parsed config. Defaults to None (no caching).
+        externalOpts (dict, optional): External options, only used to key the cache. Defaults to {}.
 
     Attributes:
         config (dict): JSON config opened as a dict.
         nsignals (int): Number of signal processes. Zero before running Construct().
         nbkgs (int): Number of signal processes. Zero before running Construct().
     '''
-    def __init__(self,jsonPath,findreplace={}):
+    def __init__(self,jsonPath,findreplace={},cacheDir=None,externalOpts={}):
+        self._addedConfigs = []
+        self._table = None
+        self._cacheName = None if cacheDir == None else cacheDir+'config_cache/%s.json'%_config_cache_key(jsonPath, findreplace, externalOpts)
+        self._fromCache = self._loadCache()
+        if self._fromCache:
+            return
+
         self.config = open_json(jsonPath)
         self._addFindReplace(findreplace)
         self.iterWorkspaceObjs = {}
         if 'GLOBAL' in self.config.keys(): self._varReplacement()
-        self._addedConfigs = []
+
+    def _loadCache(self):
+        '''Load the expanded config, iterWorkspaceObjs, and FullTable() from the cache if it exists.
+
+        Returns:
+            bool: True if the cache was loaded.
+        '''
+        if self._cacheName == None or not os.path.exists(self._cacheName):
+            return False
+        try:
+            with open(self._cacheName) as f:
+                cache = json.load(f)
+            self.config, self.iterWorkspaceObjs = cache['config'], cache['iterWorkspaceObjs']
+            self._table = intern_strings(_table_from_json(cache['table']))
+        except (OSError, ValueError, KeyError, TypeError) as e: # ex. a truncated file
+            print ('WARNING: Could not read config cache %s (%s). Parsing the config again.'%(self._cacheName, e))
+            return False
+        print ('Using cached config table %s'%self._cacheName)
+        return True
+
+    def SaveCache(self):
+        '''Save the expanded config, iterWorkspaceObjs, and FullTable() to the cache
+        (if a cache directory was provided and the cache was not already used).
+
+        Returns:
+            None
+        '''
+        if self._cacheName == None or self._fromCache:
+            return
+        os.makedirs(os.path.dirname(self._cacheName), exist_ok=True)
+        cache = {'config': self.config, 'iterWorkspaceObjs': self.iterWorkspaceObjs, 'table': _table_to_json(self.FullTable())}
+        with open(self._cacheName,'w') as f:
+            json.dump(cache, f)
 
     def _section(self,key):
         '''Derive the dictionary for a given section of the configuration file
@@ -82,6 +133,22 @@ class Config:
             None.
         '''
         print ("Doing GLOBAL variable replacement in input json...")
+        if any(isinstance(v,dict) for v in self._section('GLOBAL').values()):
+            # Nested replacements are inserted by reference so do them one at a time
+            for old_string in self._section('GLOBAL'):
+                if old_string == "HELP":
+                    print ('WARNING: The HELP entry is deprecated and checking for it will be removed in the future. Please remove it from your config.')
+                    continue
+                new_obj = self._section('GLOBAL')[old_string]
+                if isinstance(new_obj,list):
+                    self.iterWorkspaceObjs[old_string] = new_obj
+                else:
+                    self.config = config_loop_replace(self.config, old_string, new_obj)
+            return
+
+        # A GLOBAL value is substituted by the GLOBAL keys before it so evaluate
+        # each value as it would be when its own replacement is done.
+        replacer = MultiReplacer()
         for old_string in self._section('GLOBAL'):
             if old_string == "HELP":
                 print ('WARNING: The HELP entry is deprecated and checking for it will be removed in the future. Please remove it from your config.')
@@ -90,7 +157,8 @@ class Config:
             if isinstance(new_obj,list):
                 self.iterWorkspaceObjs[old_string] = new_obj
             else:
-                self.config = config_loop_replace(self.config, old_string, new_obj)
+                replacer.Add(old_string, replacer.Replace(new_obj))
+        self.config = replacer.ReplaceInConfig(self.config)
 
     def SaveOut(self, projPath): # pragma: no cover
         '''Save the histogram table to the `projPath` directory in csv
@@ -112,6 +180,9 @@ class Config:
         Returns:
             pandas.DataFrame: Table
         '''
+        if self._table is not None and not verbose:
+            return self._table.copy()
+
         regions = self._regionTable()
         processes = self._processTable()
         systematics = self._systematicsTable()
@@ -137,6 +208,8 @@ class Config:
         final = regions.merge(proc_syst,right_index=True,left_on='process',how='left')
         final = _keyword_replace(final, ['source_filename', 'source_histname']).reset_index(drop=True)
         _df_sanity_checks(final)
+        final = intern_strings(final)
+        self._table = final.copy()
         return final
 
     def _regionTable(self):
@@ -190,32 +263,29 @@ class Config:
 
             return out
 
-        out_df = pandas.DataFrame(columns=['process','region','binning'])
-        for r in self._section('REGIONS'):
+        regions = self._section('REGIONS')
+        records = []
+        for r in regions:
             data_key = _data_not_included(r)
             if data_key:
-                new_row = pandas.DataFrame([{
+                records.append({
                     'process': data_key,
                     'region': r,
-                    'binning': self._section('REGIONS')[r]['BINNING']
-                }])
-                out_df = pandas.concat([out_df, new_row], ignore_index=True)
+                    'binning': regions[r]['BINNING']
+                })
 
-
-            for p in self._section('REGIONS')[r]['PROCESSES']:
+            for p in regions[r]['PROCESSES']:
                 if p not in self._section('PROCESSES') and len([kglobal for kglobal in self._section('GLOBAL') if kglobal in p]) == 0:
                     raise RuntimeError('Process "%s" listed for region "%s" not defined in PROCESSES section.'%(p,r))
 
-                row_format = lambda c: pandas.DataFrame([{
+                row_format = lambda c: {
                     'process': c['PROCESS'],
                     'region': c['REGION'],
-                    'binning': self._section('REGIONS')[c['REGION']]['BINNING']
-                }])
-                rows_to_append = self._iterObjReplaceProducer({'PROCESS':p, 'REGION':r}, row_format)
-                for new_row in rows_to_append:
-                    out_df = pandas.concat([out_df,new_row],ignore_index=True)
-  
-        return out_df
+                    'binning': regions[c['REGION']]['BINNING']
+                }
+                records.extend(self._iterObjReplaceProducer({'PROCESS':p, 'REGION':r}, row_format))
+
+        return pandas.DataFrame(records, columns=['process','region','binning'], dtype=object)
 
     def _processTable(self):
         '''Generate the table of process information based on the JSON config.
@@ -225,7 +295,7 @@ class Config:
         Returns:
             pandas.DataFrame
         '''
-        out_df = pandas.DataFrame(columns=['color','process_type','scale','variation','source_filename','source_histname','alias','title','combine_idx'])
+        records, names = [], []
         for p in self._section('PROCESSES'):
             this_proc_info = self._section('PROCESSES')[p]
             this_proc_info['NAME'] = p
@@ -233,7 +303,7 @@ class Config:
                 raise RuntimeError('Any process of type DATA must have section key "data_obs".')
             for s in this_proc_info['SYSTEMATICS']+['nominal']:
                 this_proc_info['VARIATION'] = s
-                row_format = lambda info: pandas.Series(
+                row_format = lambda info: (info['NAME'],
                     {'color': nan if 'COLOR' not in info else info['COLOR'],
                     'process_type': info['TYPE'],
                     'scale': 1.0 if 'SCALE' not in info else info['SCALE'],
@@ -242,14 +312,15 @@ class Config:
                     'alias': info['NAME'] if 'ALIAS' not in info.keys() else info['ALIAS'], #in file name
                     'title': info['NAME'] if 'TITLE' not in info.keys() else info['TITLE'], #in legend entry
                     'variation': info['VARIATION'],
-                    }, name=info['NAME']
+                    }
                 )
-                rows_to_append = self._iterObjReplaceProducer(this_proc_info, row_format)
-                for new_row in rows_to_append:
-                    new_row = new_row.to_frame().T
-                    out_df = pandas.concat([out_df, new_row], ignore_index=False)
+                for name, record in self._iterObjReplaceProducer(this_proc_info, row_format):
+                    names.append(name)
+                    records.append(record)
 
-        return out_df
+        return pandas.DataFrame(records, index=pandas.Index(names, dtype=object),
+                                columns=['color','process_type','scale','variation','source_filename','source_histname','alias','title','combine_idx'],
+                                dtype=object)
 
     def _systematicsTable(self):
         '''Generate the table of process information based on the JSON config.
@@ -261,23 +332,27 @@ class Config:
         Returns:
             pandas.DataFrame
         '''
-        out_df = pandas.DataFrame(columns=_syst_col_defaults.keys())
+        records, names = [], []
         for s in self._section('SYSTEMATICS'):
             iterations_to_process = self._iterObjReplaceProducer(self._section('SYSTEMATICS')[s], lambda c: c)
             for iteration in iterations_to_process:
                 for syst in _get_syst_attrs(s, iteration):
-                    syst = syst.to_frame().T
-                    out_df = pandas.concat([out_df,syst])
-        
-        return out_df
+                    names.append(s)
+                    records.append(syst)
+
+        return pandas.DataFrame(records, index=pandas.Index(names, dtype=object), columns=list(_syst_col_defaults.keys()), dtype=object)
 
     def _iterObjReplaceProducer(self, obj_package, func):
         '''Pre-processes input to DataFrame in the case that the inputs
-        can take multiple values with keyword replacement.
+        can take multiple values with keyword replacement. Generator so that the
+        combinations are made one at a time as the table builders consume them.
 
         Args:
-            obj_package ([type]): [description]
-            func ([type]): [description]
+            obj_package (dict): Objects (ex. the config entry for a process) in which to do the replacement.
+            func (function): Function applied to each dict of replaced objects to make the output.
+
+        Yields:
+            The output of func for each combination of replacements.
         '''
         def _iterativeReplace(base,find_replace_map):
             out = base
@@ -310,12 +385,9 @@ class Config:
                 to_vary[objKey] = [obj]
 
         # Use func to plug everything back together
-        out = []
+        keys = list(to_vary.keys())
         for varied_set in itertools.product(*(to_vary.values())):
-            varied_set_map = {key: varied_set[i] for i,key in enumerate(to_vary.keys())}
-            out.append(func(varied_set_map))
-        
-        return out
+            yield func(dict(zip(keys, varied_set)))
 
     def Add(self,cNew,onlyOn=['process','region']):
         raise NotImplementedError('Multiple config support is currently a work in progress. Only the first config will be used.')
@@ -369,76 +441,405 @@ class OrganizedHists():
     '''Class to store histograms in a consistent data structure and with accompanying
     methods to access the histograms.
 
+    Histograms are stored either in a TFile (`backend="root"`, `organized_hists.root`) or
+    in a memory-mapped array file with a JSON name index (`backend="mmap"`, `organized_hists.dat`,
+    see ArrayStore). With the latter, GetArrays() returns zero-copy views and TH2s are only
+    built when requested with Get().
+
     Attributes:
         name (str): Name, taken from input configObj.
-        filename (str): Path to `organized_hists.root`.
+        filename (str): Path to `organized_hists.root` (or `organized_hists.dat`).
         hists (dict): Three-level nested dictionary organized as [process][region][systematic variation].
         binning (Binning): Binning object, taken from configObj.
         rebinned (bool): Flag to denote if a rebinning has already occured.
-        file (ROOT.TFile): TFile to store histograms on disk.
+        file (ROOT.TFile or ArrayStore): Store of the histograms on disk.
 
     Args:
         configObj (Config): Config object.
     '''
-    def __init__(self,projPath,binnings,hist_map,readOnly=False):
-        self.filename = projPath + 'organized_hists.root'
+    def __init__(self,projPath,binnings,hist_map,readOnly=False,nworkers=1,backend='root',lazy=False,compression={}):
+        if backend not in ['root','mmap']:
+            raise ValueError('Histogram backend "%s" not accepted. Options are "root" and "mmap".'%backend)
+        self.backend = backend
+        self.filename = projPath + ('organized_hists.root' if backend == 'root' else 'organized_hists.dat')
+        self.manifestname = projPath + 'organized_hists_manifest.json'
+        self.sparsename = projPath + 'organized_hists_sparse.json'
+        self.lazyname = projPath + 'organized_hists_lazy.json'
         self.hist_map = hist_map
-
+        self.nworkers = nworkers
+        self.lazy = lazy
+        self.compression = compression
+        self._xbinByCat = {name: b.xbinByCat for name,b in binnings.items()}
+        self._binnings = {}
+        for histdf in hist_map.values():
+            self._indexBinnings(histdf)
+
+        self._sparse = {}
+        self._lazy, self._lazyCache = {}, OrderedDict()
         if os.path.exists(self.filename) and readOnly:
-            self.file = ROOT.TFile.Open(self.filename,"OPEN")
+            self._openStore('r')
+            if os.path.exists(self.sparsename):
+                with open(self.sparsename) as f:
+                    self._sparse = json.load(f)
+            if os.path.exists(self.lazyname):
+                with open(self.lazyname) as f:
+                    self._lazy = json.load(f)
+        else:
+            previous = self._stashPrevious()
+            try:
+                self._openStore('w')
+                self.Add(binnings, previous)
+                self._saveLazy()
+                self.file.Close()
+            except BaseException:
+                self._discardPartial()
+                if previous != None:
+                    self._restorePrevious(previous)
+                raise
+            if previous != None:
+                for _, prev in self._stashPairs():
+                    if os.path.exists(prev):
+                        os.remove(prev)
+            self._openStore('r')
+
+    def _openStore(self, mode):
+        '''Open self.filename as the active store (self.file) and index the names it contains.
+
+        Args:
+            mode (str): "r" (read), "w" (recreate), or "a" (update).
+
+        Returns:
+            None
+        '''
+        self.file = self._open(mode)
+        self._names = dict.fromkeys(self._keys()) if mode != 'w' else {}
+
+    def _indexBinnings(self, histdf):
+        '''Add the output histogram names of a histogram map DataFrame to the name to binning index.
+        The first binning registered for a name is kept (as for a lookup in the concatenated map).
+
+        Args:
+            histdf (pandas.DataFrame): DataFrame with columns `out_histname` and `binning`.
+
+        Returns:
+            None
+        '''
+        for histname, binning in zip(histdf.out_histname, histdf.binning):
+            self._binnings.setdefault(histname, binning)
+
+    def _open(self, mode, filename=None):
+        '''Open the histogram store with the configured backend. ROOT files opened for writing
+        use the compression settings in self.compression and a write cache (see open_tfile_for_writing()).
+
+        Args:
+            mode (str): "r" (read), "w" (recreate), or "a" (update).
+            filename (str, optional): Defaults to None in which case self.filename is used.
+
+        Returns:
+            ROOT.TFile or ArrayStore
+        '''
+        filename = self.filename if filename == None else filename
+        if self.backend == 'mmap':
+            return ArrayStore(filename, mode)
+        if mode == 'r':
+            return ROOT.TFile.Open(filename, 'OPEN')
+        return open_tfile_for_writing(filename, {'w':'RECREATE','a':'UPDATE'}[mode], **self.compression)
+
+    def _storeFiles(self, filename):
+        '''
+        Returns:
+            list(str): All files on disk that make up the store `filename`.
+        '''
+        if self.backend == 'mmap':
+            return [filename, ArrayStore.IndexName(filename)]
+        return [filename]
+
+    def _write(self, h, name=None):
+        '''Write a histogram to the opened store.
+
+        Args:
+            h (TH2): Histogram to write.
+            name (str, optional): Defaults to None in which case the histogram name is used.
+
+        Returns:
+            None
+        '''
+        name = h.GetName() if name == None else name
+        if self.backend == 'mmap':
+            self.file.WriteHist(h, name)
         else:
-            self.file = ROOT.TFile.Open(self.filename,"RECREATE")
-            self.Add(binnings)
+            self.file.WriteTObject(h, name)
+        self._names[name] = None
+
+    def _keys(self, store=None):
+        '''
+        Returns:
+            list(str): Names of the histograms in `store` (defaults to the opened store).
+        '''
+        store = self.file if store == None else store
+        if self.backend == 'mmap':
+            return store.GetNames()
+        return [k.GetName() for k in store.GetListOfKeys()]
+
+    def _stashPairs(self):
+        '''
+        Returns:
+            list(tuple): Pairs of (current, stashed) paths for the store files and the
+            sparse and lazy indices (see _stashPrevious()).
+        '''
+        prevname = '_prev'.join(os.path.splitext(self.filename))
+        pairs = list(zip(self._storeFiles(self.filename), self._storeFiles(prevname)))
+        return pairs + [(f, '_prev'.join(os.path.splitext(f))) for f in [self.sparsename, self.lazyname]]
+
+    def _stashPrevious(self):
+        '''Move an existing organized_hists.root (with its sparse and lazy indices) out of the
+        way so that unchanged histograms can be copied from it by Add().
+        The manifest is removed so that an interrupted rebuild is never reused.
+        The caller removes the stashed files once the rebuild succeeds or puts them
+        back with _restorePrevious() if it fails.
+
+        Returns:
+            tuple: (0) Path to the previous file and (1) its manifest dict.
+                None if there is no previous file with a manifest.
+        '''
+        for current, prev in self._stashPairs(): # left by a run that was killed
+            if os.path.exists(prev):
+                os.remove(prev)
+
+        if not (all(os.path.exists(f) for f in self._storeFiles(self.filename)) and os.path.exists(self.manifestname)):
+            for f in [self.sparsename, self.lazyname]:
+                if os.path.exists(f):
+                    os.remove(f)
+            return None
+        with open(self.manifestname) as f:
+            manifest = json.load(f)
+        os.remove(self.manifestname)
+        for current, prev in self._stashPairs():
+            if os.path.exists(current):
+                os.replace(current, prev)
+        return '_prev'.join(os.path.splitext(self.filename)), manifest
+
+    def _restorePrevious(self, previous):
+        '''Put the files moved by _stashPrevious() (and the manifest) back after a failed
+        rebuild so that the last good histograms are kept and reused by the next run.
+
+        Args:
+            previous (tuple): Output of _stashPrevious().
+
+        Returns:
+            None
+        '''
+        for current, prev in self._stashPairs():
+            if os.path.exists(prev):
+                os.replace(prev, current)
+        with open(self.manifestname,'w') as f:
+            json.dump(previous[1], f)
+
+    def _discardPartial(self):
+        '''Close and remove a partially written store after a failed rebuild so that
+        it is not opened by a later read-only run.
+
+        Returns:
+            None
+        '''
+        if getattr(self, 'file', None) != None:
             self.file.Close()
-            self.file = ROOT.TFile.Open(self.filename,"OPEN")
+        for f in self._storeFiles(self.filename) + [self.manifestname, self.sparsename, self.lazyname]:
+            if os.path.exists(f):
+                os.remove(f)
 
-    def Add(self, binnings):
+    def Add(self, binnings, previous=None):
         '''Manipulate all histograms in self.hist_map and save them to organized_hists.root.
+        If self.nworkers > 1, the input files are processed in a pool of worker processes
+        which each write to a temporary shard file. The shards are then copied to
+        organized_hists.root in the order of self.hist_map so the output is the same
+        as when running serially.
+
+        A manifest of the inputs of each histogram (source file path, modification time and size,
+        histogram name, scale, color, and binning) is saved next to organized_hists.root.
+        If `previous` is provided, histograms whose inputs are unchanged are copied from
+        the previous file instead of being ingested again.
+
+        Args:
+            binnings (dict): Binning name to Binning object.
+            previous (tuple, optional): Path to the previous organized_hists.root and its manifest
+                (see _stashPrevious()). Defaults to None.
 
         Returns:
             None
         '''
+        edges = {name: (b.xbinByCat, b.ybinList) for name,b in binnings.items()}
+        manifest = {}
         for infilename,histdf in self.hist_map.items():
-            infilename = infilename[0] #Gets extracted as tuple for some reason
-            infile = ROOT.TFile.Open(infilename)
             for row in histdf.itertuples():
-                if row.source_histname not in [k.GetName() for k in infile.GetListOfKeys()]:
-                    raise NameError('Histogram name %s does not exist in file %s.'%(row.source_histname,infile.GetName()))
-                h = infile.Get(row.source_histname)
-                h.SetDirectory(0)
-                h.Scale(row.scale)
-                binning = binnings[row.binning]
-
-                if get_bins_from_hist("Y", h) != binning.ybinList:
-                    h = copy_hist_with_new_bins(row.out_histname+'_rebinY','Y',h,binning.ybinList)
-                if get_bins_from_hist("X", h) != binning.xbinList:
-                    h = copy_hist_with_new_bins(row.out_histname,'X',h,binning.xbinList)
-                else:
-                    h.SetName(row.out_histname)
+                manifest[row.out_histname] = _manifest_entry(infilename[0], row, edges)
 
-                h.SetTitle(row.out_histname)
-                if row.color not in mpl_to_root_colors.keys():
-                    available_colors = '", "'.join(mpl_to_root_colors.keys())
-                    raise ValueError(f'Color "{row.color}" not defined. Please add the ROOT TColor code to the "mpl_to_root_colors" dictionary defined in TwoDAlphabet.plotstyle. Available default colors are: "{available_colors}"')
-                else:
-                    h.SetFillColor(mpl_to_root_colors[row.color])
+        hist_map = self.hist_map
+        if previous != None:
+            hist_map = self._copyUnchanged(previous, manifest, edges)
+
+        infiles = self._openSources(hist_map)
+        if self.nworkers > 1 and len(infiles) > 1:
+            for infile in infiles.values():
+                infile.Close()
+            self._addParallel(hist_map, edges)
+        else:
+            self._addSerial(hist_map, edges, infiles)
+
+        with open(self.manifestname,'w') as f:
+            json.dump(manifest, f)
+
+    def _copyUnchanged(self, previous, manifest, edges):
+        '''Copy the histograms (full and sub-regions) whose manifest entry is unchanged
+        from the previous organized_hists.root.
+
+        Args:
+            previous (tuple): Path to the previous organized_hists.root and its manifest.
+            manifest (dict): Manifest of the current inputs.
+            edges (dict): Binning name to tuple of (xbinByCat, ybinList).
 
-                self.file.WriteTObject(h, row.out_histname)
-                self.CreateSubRegions(h, binning)
+        Returns:
+            dict: The subset of self.hist_map that still needs to be ingested.
+        '''
+        prevname, prevmanifest = previous
+        prevfile = self._open('r', prevname)
+        prevkeys = set(self._keys(prevfile))
+
+        stale, ncopied = {}, 0
+        for infilename,histdf in self.hist_map.items():
+            unchanged = []
+            for row in histdf.itertuples():
+                names = [row.out_histname]
+                if not self.lazy:
+                    names += [row.out_histname.replace('_FULL','_'+sub) for sub in edges[row.binning][0]]
+                unchanged.append(
+                    manifest[row.out_histname] != None and
+                    prevmanifest.get(row.out_histname) == manifest[row.out_histname] and
+                    all(n in prevkeys for n in names)
+                )
+                if unchanged[-1]:
+                    for n in names:
+                        self._write(prevfile.Get(n), n)
+                    if self.lazy:
+                        self._addLazy(row.out_histname, row.binning)
+                    ncopied += 1
+
+            if not all(unchanged):
+                stale[infilename] = histdf[[not u for u in unchanged]]
+
+        prevfile.Close()
+        print ('Reusing %s histograms from the previous %s. Ingesting %s.'%(ncopied, self.filename, sum(len(df) for df in stale.values())))
+        return stale
+
+    def _addSerial(self, hist_map, edges, infiles):
+        '''Ingest the input files one at a time with this process.
+
+        Args:
+            hist_map (dict): Input file name to DataFrame of histograms to ingest.
+            edges (dict): Binning name to tuple of (xbinByCat, ybinList).
+            infiles (dict): Input file name to open TFile (see _openSources()).
+
+        Returns:
+            None
+        '''
+        for infilename,histdf in hist_map.items():
+            infilename = infilename[0] #Gets extracted as tuple for some reason
+            infile = infiles[infilename]
+            for h, subregions in _ingest_hists(infile, histdf, edges, split=not self.lazy):
+                self._write(h)
+                if self.lazy:
+                    self._addLazy(h.GetName(), self._binnings[h.GetName()])
+                else:
+                    self._writeSubRegions(subregions)
 
             infile.Close()
 
-    def AddMCStatShapes(self, df, binnings, threshold=10, include_signal=False, excluded_procs=[], alpha_min=0.1, name_prefix='mcstat', verbose=True):
+    def _addParallel(self, hist_map, edges):
+        '''Ingest the input files with self.nworkers processes, each writing
+        the rebinned histograms of one input file to a shard, and copy the shards
+        to organized_hists.root with this (single) process.
+
+        Args:
+            hist_map (dict): Input file name to DataFrame of histograms to ingest.
+            edges (dict): Binning name to tuple of (xbinByCat, ybinList).
+
+        Returns:
+            None
+        '''
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(self.filename))) as sharddir:
+            tasks = [(infilename[0], histdf, edges, '%s/shard_%s.root'%(sharddir,i), not self.lazy)
+                     for i,(infilename,histdf) in enumerate(hist_map.items())]
+            # Fork so that user scripts without a __main__ guard are not re-executed
+            with multiprocessing.get_context('fork').Pool(min(self.nworkers, len(tasks))) as pool:
+                for (infilename, histdf, _, _, _), shardname in zip(tasks, pool.imap(_ingest_shard, tasks)):
+                    full_names = set(histdf.out_histname)
+                    shard = ROOT.TFile.Open(shardname)
+                    for key in shard.GetListOfKeys():
+                        h = key.ReadObj()
+                        if h.GetName() in full_names:
+                            self._write(h)
+                            if self.lazy:
+                                self._addLazy(h.GetName(), self._binnings[h.GetName()])
+                        else:
+                            self._writeSubRegions({h.GetName(): h})
+                    shard.Close()
+                    os.remove(shardname)
+
+    def _openSources(self, hist_map):
+        '''Open each input file in hist_map once and check that all of the
+        requested histograms exist using an index of the file keys.
+
+        Args:
+            hist_map (dict): Input file name to DataFrame of histograms to ingest.
+
+        Raises:
+            NameError: If any of the requested histograms (or files) do not exist.
+                All missing histograms are reported together.
+
+        Returns:
+            dict: Input file name to open TFile.
+        '''
+        infiles, missing = {}, []
+        for infilename,histdf in hist_map.items():
+            infilename = infilename[0]
+            infile = ROOT.TFile.Open(infilename)
+            if not infile or infile.IsZombie():
+                missing.append('File %s could not be opened.'%infilename)
+                continue
+            infiles[infilename] = infile
+            keys = {k.GetName() for k in infile.GetListOfKeys()}
+            for histname in histdf.source_histname.unique():
+                if histname not in keys:
+                    missing.append('Histogram name %s does not exist in file %s.'%(histname,infile.GetName()))
+
+        if missing:
+            for infile in infiles.values():
+                infile.Close()
+            raise NameError('%s missing input(s):\n\t%s'%(len(missing),'\n\t'.join(missing)))
+
+        return infiles
+
+    def AddMCStatShapes(self, df, binnings, threshold=10, include_signal=False, excluded_procs=[], alpha_min=0.1, name_prefix='mcstat', verbose=True, sparse=False):
         '''
         Generate autoMCStats-style per-bin shape templates from the rebinned nominal
         background hists, write them to organized_hists.root, register
         them in hist_map for BinningLookup(), and return rows to append to the ledger.
 
+        The per-bin quantities (total content, quadrature error, N_eff, alpha) and the
+        BB-lite/per-process decisions are computed for all bins of a region at once
+        from the stacked nominal arrays. Templates are only made for the selected bins.
+
         Call after self.Add(binnings). Returns list[dict] (syst_type='shapes').
         Set verbose=True for a per-bin report in the style of Combine's autoMCStats.
+
+        With sparse=True, no templates are written. Each template is instead recorded as
+        (nominal histogram, bin, factor) for the full X axis and for the one sub-region that
+        contains the bin, and saved to organized_hists_sparse.json. The templates are built
+        by Get() when requested. The ledger rows then carry the sub-region in a `subregion`
+        column so that the nuisance is only applied to that channel in the card.
         '''
         self.file.Close()
-        self.file = ROOT.TFile.Open(self.filename, 'UPDATE')
+        self._openStore('a')
 
         types = ['BKG', 'SIGNAL'] if include_signal else ['BKG'] # normally we don't want to add MC stat unc on signal, but keep it just in case
         bkg = df[df.process_type.isin(types)]
@@ -448,13 +849,12 @@ class OrganizedHists():
             print(f'\tExcluded processes: {", ".join(excluded_procs)}')
             print('='*100+'\n')
             return []
-        existing = self.GetHistNames()
         new_rows = []
         hist_map_rows = []
         n_bblite = n_perproc = n_skipped = 0
 
         # Loop over all regions in the workspace and get the nominal histograms for all unique processes.
-        # Store them in a {process: TH2} dict called `nominal`.
+        # Store them in a {process: TH2} dict called `nominal` and their contents and errors in {process: array} dicts.
         # Avoid any processes specified by the user in the JSON, passed here as `excluded_procs` list.
         for region in df.region.unique():
             procs = list(bkg[bkg.region.eq(region) & ~bkg.process.isin(excluded_procs)].process.unique())
@@ -468,30 +868,45 @@ class OrganizedHists():
             binning_name = df[df.region.eq(region)].binning.iloc[0]
             binning = binnings[binning_name]
 
+            contents, errors = {}, {}
+            for p in df[df.region.eq(region) & df.process_type.ne('DATA')].process.unique():
+                hname = '%s_%s_FULL' % (p, region)
+                if hname in self._names:
+                    content, sumw2 = self.GetArrays(hname)
+                    contents[p] = np.asarray(content, dtype=np.float64)
+                    errors[p] = np.sqrt(sumw2) # as from TH1::GetBinError()
             nominal = {}
             for p in procs:
-                hname = '%s_%s_FULL' % (p, region)
-                if hname in existing:
-                    h = self.file.Get(hname); h.SetDirectory(0)
+                if p in contents:
+                    h = self.file.Get('%s_%s_FULL' % (p, region)); h.SetDirectory(0)
                     nominal[p] = h
             if not nominal:
                 continue
 
-            # For verbose output in the style of Combine: load the excluded non-data nominal histos, for the "total sum" line
-            all_nominal = dict(nominal)
-            for p in df[df.region.eq(region) & df.process_type.ne('DATA')].process.unique():
-                if p in all_nominal:
-                    continue
-                hname = '%s_%s_FULL' % (p, region)
-                if hname in existing:
-                    h = self.file.Get(hname); h.SetDirectory(0)
-                    all_nominal[p] = h
+            # For verbose output in the style of Combine: the excluded non-data nominal histos are used for the "total sum" line
+            all_nominal = list(nominal) + [p for p in contents if p not in nominal]
             excluded = [p for p in all_nominal if p not in nominal]
             meta_data = {p: df[df.process.eq(p) & df.region.eq(region) & df.variation.eq('nominal')].iloc[0] for p in nominal}
-            sample = next(iter(nominal.values()))
-            nx, ny = sample.GetNbinsX(), sample.GetNbinsY()
+
+            # Stack the nominal arrays, indexed as [process, y, x]
+            c_i = np.stack([contents[p] for p in nominal])
+            e_i = np.stack([errors[p] for p in nominal])
+            n_tot = c_i.sum(axis=0)
+            e_tot = np.sqrt((e_i**2).sum(axis=0))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                N_eff_tot = np.where(e_tot > 0, np.rint(n_tot * n_tot / (e_tot * e_tot)), 0).astype(np.int64)
+                alpha = np.where(N_eff_tot > 0, n_tot / N_eff_tot, 0.0)
+                N_eff_i = np.where((c_i > 0) & (e_i > 0), np.rint(c_i * c_i / (e_i * e_i)), 0).astype(np.int64)
+                width_i = np.where((c_i > 0) & (e_i > 0), e_i / c_i, 0.0)
+
+            zero_error = e_tot == 0.0
+            low_alpha = ~zero_error & (alpha < alpha_min)
+            bblite = ~zero_error & ~low_alpha & (N_eff_tot > threshold)
+            n_skipped += int(zero_error.sum())
 
             if verbose:
+                na = np.stack([contents[p] for p in all_nominal]).sum(axis=0)
+                ea = np.sqrt((np.stack([errors[p] for p in all_nominal])**2).sum(axis=0))
                 print('\n' + '=' * 64)
                 print('Analyzing bin errors for region: %s' % region)
                 print('Poisson cut-off: %d' % threshold)
@@ -506,18 +921,23 @@ class OrganizedHists():
                 This bin is shifted up and down by some multiplicative factor `rel`, and the down variation is bounded below at zero. 
                 The factor `rel` is determined based on the number of effective events. 
                 '''
-                c = nominal[proc].GetBinContent(bx, by) # Nominal bin contents
+                c = contents[proc][by-1, bx-1] # Nominal bin contents
                 for direction, factor in (('Up', 1.0 + rel), ('Down', max(0.0, 1.0 - rel))):
-                    h = nominal[proc].Clone('%s_%s_FULL_%s%s' % (proc, region, variation, direction))
-                    h.SetDirectory(0)
-                    h.SetBinContent(bx, by, c * factor)
-                    h.SetTitle(h.GetName())
-                    self.file.WriteTObject(h, h.GetName())
-                    self.CreateSubRegions(h, binning)
+                    hname = '%s_%s_FULL_%s%s' % (proc, region, variation, direction)
+                    if sparse:
+                        self._sparse[hname] = {'nominal': nominal[proc].GetName(), 'bx': bx, 'by': by, 'factor': factor}
+                        self._sparse[hname.replace('_FULL', '_'+cat)] = {'nominal': nominal[proc].GetName().replace('_FULL', '_'+cat), 'bx': cat_bx, 'by': by, 'factor': factor}
+                    else:
+                        h = nominal[proc].Clone(hname)
+                        h.SetDirectory(0)
+                        h.SetBinContent(bx, by, c * factor)
+                        h.SetTitle(h.GetName())
+                        self._write(h)
+                        self.CreateSubRegions(h, binning)
                     # register the "FULL" template so BinningLookup() can resolve it later. This way, 2DA does the RooDataHist creation for us
                     hist_map_rows.append({
-                        'source_histname': h.GetName(),
-                        'out_histname':    h.GetName(),
+                        'source_histname': hname,
+                        'out_histname':    hname,
                         'scale':           1.0,
                         'color':           meta_data[proc].get('color', 0),
                         'binning':         binning_name,
@@ -531,130 +951,115 @@ class OrganizedHists():
                     row['shapes'] = 1.0
                     row['lnN'] = nan
                     row['mcstat'] = True
+                    if sparse:
+                        row['subregion'] = cat
                     new_rows.append(row.to_dict())
 
-            # Loop over all bins, and all nominal MC processes in this region. Perform the BB/BB-lite algorithm
-            for bx in range(1, nx + 1):
-                for by in range(1, ny + 1):
-                    tag = f'{region} ({bx}, {by})' #'bx%d_by%d' % (bx, by)
-                    n_tot, e2 = 0.0, 0.0
-                    for p in nominal:
-                        n_tot += nominal[p].GetBinContent(bx, by)
-                        e2    += nominal[p].GetBinError(bx, by) ** 2
-                    e_tot = math.sqrt(e2)
+            # Loop over the bins (in order of bx then by) that need a report or a template. Perform the BB/BB-lite algorithm
+            to_visit = np.ones_like(zero_error) if verbose else ~zero_error
+            for ix, iy in np.argwhere(to_visit.T):
+                bx, by = int(ix) + 1, int(iy) + 1
+                cat_bx, cat = binning.xcatFromGlobal(bx)
+                tag = f'{region} ({bx}, {by})' #'bx%d_by%d' % (bx, by)
+                if verbose:
+                    print('-' * 64)
+                    print('%-12s  %14.6f  %14.6f  %s (%s)' % (tag, na[iy, ix], ea[iy, ix], 'total sum', ', '.join(all_nominal)))
+                    print('%-12s  %14.6f  %14.6f  %s (%s)' % (tag, n_tot[iy, ix], e_tot[iy, ix], 'excluding marked processes', ', '.join(excluded)))
+
+                if zero_error[iy, ix]:
                     if verbose:
-                        na, e2a = 0.0, 0.0
-                        for p in all_nominal:
-                            na  += all_nominal[p].GetBinContent(bx, by)
-                            e2a += all_nominal[p].GetBinError(bx, by) ** 2
-                        print('-' * 64)
-                        print('%-12s  %14.6f  %14.6f  %s (%s)' % (tag, na, math.sqrt(e2a), 'total sum', ', '.join([p for p in all_nominal])))
-                        print('%-12s  %14.6f  %14.6f  %s (%s)' % (tag, n_tot, e_tot, 'excluding marked processes', ', '.join(excluded)))
-
-                    if e_tot == 0.0:
-                        n_skipped += 1
-                        if verbose:
-                            print('  => Error is zero, ignore')
-                        continue
-
-                    N_eff_tot = int(round(n_tot * n_tot / (e_tot * e_tot)))
-
-                    alpha = n_tot / N_eff_tot if N_eff_tot > 0 else 0.0
-                    if alpha < alpha_min:
-                        print('%-12s  %14.6f  %14.6f  %s' % (
-                              tag, float(N_eff_tot), math.sqrt(N_eff_tot),
-                              'Effective events, alpha=%.6f' % alpha))
-                        print('  => alpha < alpha_min: %.3f < %.3f'%(alpha, alpha_min))
-                        print('  => No MC statistical uncertainty parameters will be calculated')
-                        continue
+                        print('  => Error is zero, ignore')
+                    continue
+
+                N_eff = int(N_eff_tot[iy, ix])
+                if low_alpha[iy, ix]:
+                    print('%-12s  %14.6f  %14.6f  %s' % (
+                          tag, float(N_eff), math.sqrt(N_eff),
+                          'Effective events, alpha=%.6f' % alpha[iy, ix]))
+                    print('  => alpha < alpha_min: %.3f < %.3f'%(alpha[iy, ix], alpha_min))
+                    print('  => No MC statistical uncertainty parameters will be calculated')
+                    continue
+                if verbose:
+                    print('%-12s  %14.6f  %14.6f  %s' % (
+                        tag, float(N_eff), math.sqrt(N_eff),
+                        'Effective events, alpha=%.6f' % alpha[iy, ix]))
+
+                ##################################################################################################
+                # Case 1: n_tot^eff > threshold
+                # In this case, we make a single Gaussian-constrained NP that scales the total yield in the bin.
+                # Since we're doing this with shape templates instead of whatever Combine does, we have to ensure
+                # that every process in this bin shares the same nuisance parameter name (histogram name), and that 
+                # every process has the same scaling value `rel`. In Case 1, we use `rel = e_tot / n_tot`
+                #
+                # This means that, in a given bin, process `i` contributes n_i * (1 + v*rel) for nuisance value `v`.
+                # For all processes in this bin, we get:
+                #   \Sum_i n_i * (1 + v * rel) = (1 + v * rel) * \Sum_i n_i
+                #                              = (1 + v * e_tot / n_tot) * n_tot
+                #                              = n_tot + v * e_tot
+                # 
+                # Thus, we're left with +/- e_tot at for v = +/-1. 
+                # Since e_tot = sqrt(\Sum_i e_i^2), we get the combined MC stat uncertainty in this given bin. 
+                ##################################################################################################
+                if bblite[iy, ix]:
+                    variation = '%s_%s_bx%d_by%d' % (name_prefix, region, bx, by)
+                    rel = e_tot[iy, ix] / n_tot[iy, ix]
                     if verbose:
-                        print('%-12s  %14.6f  %14.6f  %s' % (
-                            tag, float(N_eff_tot), math.sqrt(N_eff_tot),
-                            'Effective events, alpha=%.6f' % alpha))
-
-                    ##################################################################################################
-                    # Case 1: n_tot^eff > threshold
-                    # In this case, we make a single Gaussian-constrained NP that scales the total yield in the bin.
-                    # Since we're doing this with shape templates instead of whatever Combine does, we have to ensure
-                    # that every process in this bin shares the same nuisance parameter name (histogram name), and that 
-                    # every process has the same scaling value `rel`. In Case 1, we use `rel = e_tot / n_tot`
-                    #
-                    # This means that, in a given bin, process `i` contributes n_i * (1 + v*rel) for nuisance value `v`.
-                    # For all processes in this bin, we get:
-                    #   \Sum_i n_i * (1 + v * rel) = (1 + v * rel) * \Sum_i n_i
-                    #                              = (1 + v * e_tot / n_tot) * n_tot
-                    #                              = n_tot + v * e_tot
-                    # 
-                    # Thus, we're left with +/- e_tot at for v = +/-1. 
-                    # Since e_tot = sqrt(\Sum_i e_i^2), we get the combined MC stat uncertainty in this given bin. 
-                    ##################################################################################################
-                    if N_eff_tot > threshold:
-                        variation = '%s_%s_bx%d_by%d' % (name_prefix, region, bx, by)
-                        rel = e_tot / n_tot
-                        if verbose:
-                            print('  => N_eff > %d : shared gaussian shape %r (rel=%.6f) shared by [%s]'
-                                % (threshold, variation, rel, ', '.join(nominal.keys())))
-                        for p in nominal:
-                            _make_mcstat_template(p, variation, bx, by, rel)
-                        n_bblite += 1
-
-                    ##################################################################################################
-                    # Case 2: n_tot^eff < threshold
-                    # In this case, the number of effective events is less than the threshold. Now, we simply make a 
-                    # new TH2 for each process, where every bin is kept the same except for (bx, by) which is shifted
-                    # up and down by +/-1 sigma. 
-                    # Here, we use `rel == width = e_i / n_i`, where "i" represents the process. Thus, in a given bin,
-                    # a process "i" has a yield (governed by the value `v` of the nuisance parameter):
-                    #       yield_i(v) = n_i + v * e_i 
-                    #                  = n_i·(1 + v * width)
-                    #
-                    # Since we are providing Combine the +/-1 sigma variation histograms, it will automatically 
-                    # assign this nuisance parameter a unit-Gaussian prior. 
-                    # NOTE: this is not strictly what Combine does, as Combine will implement a Poisson-constrained 
-                    # parameter. However, there's no good/easy way to do this with the TH2/RooDataHist implementation 
-                    # of 2DAlphabet, and in general a Gaussian is going to be good enough anyway. 
-                    ##################################################################################################
-                    else:
+                        print('  => N_eff > %d : shared gaussian shape %r (rel=%.6f) shared by [%s]'
+                            % (threshold, variation, rel, ', '.join(nominal.keys())))
+                    for p in nominal:
+                        _make_mcstat_template(p, variation, bx, by, rel)
+                    n_bblite += 1
+
+                ##################################################################################################
+                # Case 2: n_tot^eff < threshold
+                # In this case, the number of effective events is less than the threshold. Now, we simply make a 
+                # new TH2 for each process, where every bin is kept the same except for (bx, by) which is shifted
+                # up and down by +/-1 sigma. 
+                # Here, we use `rel == width = e_i / n_i`, where "i" represents the process. Thus, in a given bin,
+                # a process "i" has a yield (governed by the value `v` of the nuisance parameter):
+                #       yield_i(v) = n_i + v * e_i 
+                #                  = n_i·(1 + v * width)
+                #
+                # Since we are providing Combine the +/-1 sigma variation histograms, it will automatically 
+                # assign this nuisance parameter a unit-Gaussian prior. 
+                # NOTE: this is not strictly what Combine does, as Combine will implement a Poisson-constrained 
+                # parameter. However, there's no good/easy way to do this with the TH2/RooDataHist implementation 
+                # of 2DAlphabet, and in general a Gaussian is going to be good enough anyway. 
+                ##################################################################################################
+                else:
+                    if verbose:
+                        print('  => N_eff <= %d : per-process (Poisson approximated as gaussian)' % threshold)
+                    made_one = False # the below-threshold bin where every process has zero content/error doesn't get counted as a per-process bin
+                    for i, p in enumerate(nominal):
+                        c, e = c_i[i, iy, ix], e_i[i, iy, ix]
                         if verbose:
-                            print('  => N_eff <= %d : per-process (Poisson approximated as gaussian)' % threshold)
-                        made_one = False # the below-threshold bin where every process has zero content/error doesn't get counted as a per-process bin
-                        for p in nominal:
-                            c = nominal[p].GetBinContent(bx, by)
-                            e = nominal[p].GetBinError(bx, by)
-                            if verbose:
-                                print('  ' + '-' * 58)
-                                print('    %-18s %14.6f %14.6f' % (p, c, e))
-                            if c <= 0.0 or e <= 0.0:
-                                if verbose:
-                                    print('      => Content or error is zero, ignore')
-                                continue
-                            N_eff_i = int(round(c * c / (e * e)))
-                            width = e / c
-                            variation = '%s_%s_%s_bx%d_by%d' % (name_prefix, region, p, bx, by)
-
-                            alpha_i = c / N_eff_i if N_eff_i > 0 else 0.0
-                            if alpha < alpha_min:
-                                print('%-12s  %14.6f  %14.6f  %s' % (
-                                    tag, float(N_eff_tot), math.sqrt(N_eff_tot),
-                                    'Effective events, alpha=%.6f' % alpha))
-                                print('  => alpha < alpha_min: %.3f < %.3f'%(alpha, alpha_min))
-                                print('  => No MC statistical uncertainty parameters will be calculated')
-                                continue
+                            print('  ' + '-' * 58)
+                            print('    %-18s %14.6f %14.6f' % (p, c, e))
+                        if c <= 0.0 or e <= 0.0:
                             if verbose:
-                                print('    %-18s %14.6f %14.6f  %s' % (
-                                    '', float(N_eff_i), math.sqrt(N_eff_i),
-                                    'Effective events, alpha=%.6f' % alpha_i))
-                                print('      => %r [1.00,%.2f,%.2f] to be gaussian constrained (width=%.6f)'
-                                    % (variation, max(0.0, 1.0 - 7.0 * width), 1.0 + 7.0 * width, width))
-                            _make_mcstat_template(p, variation, bx, by, width)
-                            made_one = True
-                        if made_one:
-                            n_perproc += 1
+                                print('      => Content or error is zero, ignore')
+                            continue
+                        N_eff_p = int(N_eff_i[i, iy, ix])
+                        width = width_i[i, iy, ix]
+                        variation = '%s_%s_%s_bx%d_by%d' % (name_prefix, region, p, bx, by)
+
+                        alpha_p = c / N_eff_p if N_eff_p > 0 else 0.0
+                        if verbose:
+                            print('    %-18s %14.6f %14.6f  %s' % (
+                                '', float(N_eff_p), math.sqrt(N_eff_p),
+                                'Effective events, alpha=%.6f' % alpha_p))
+                            print('      => %r [1.00,%.2f,%.2f] to be gaussian constrained (width=%.6f)'
+                                % (variation, max(0.0, 1.0 - 7.0 * width), 1.0 + 7.0 * width, width))
+                        _make_mcstat_template(p, variation, bx, by, width)
+                        made_one = True
+                    if made_one:
+                        n_perproc += 1
 
         if hist_map_rows:
             self.hist_map['__mcstat__'] = pandas.concat(
                 [self.hist_map.get('__mcstat__'), pandas.DataFrame(hist_map_rows)],
                 ignore_index=True) if '__mcstat__' in self.hist_map else pandas.DataFrame(hist_map_rows)
+            self._indexBinnings(pandas.DataFrame(hist_map_rows))
             hist_map_rows = []
 
         if verbose:
@@ -667,8 +1072,13 @@ class OrganizedHists():
             print('  distinct nuisances  : %d  (%d shape templates)' % (n_nuis, len(new_rows)))
             print('=' * 64 + '\n')
 
+        if sparse:
+            with open(self.sparsename,'w') as f:
+                json.dump(self._sparse, f)
+        self._saveLazy()
+
         self.file.Close()
-        self.file = ROOT.TFile.Open(self.filename, 'OPEN')
+        self._openStore('r')
         return new_rows
 
     def Get(self,histname='',process='',region='',systematic='',subspace='FULL'):
@@ -681,55 +1091,355 @@ class OrganizedHists():
             process (str, optional): Name of process to search for. Must be used in conjunction with `region` and `systematic` options. Overridden by `histname`. Defaults to ''.
             region (str, optional): Name of region to search for. Must be used in conjunction with `process` and `systematic` options. Overridden by `histname`. Defaults to ''.
             systematic (str, optional): Name of systematic to search for. Must be used in conjunction with `process` and `region` options. Overridden by `histname`. Defaults to ''.
-            subspace (str, optional): Name of subspace. Default is 'FULL' with other options being 'LOW', 'SIG', and 'HIGH'.
+            subspace (str, optional): Name of subspace. Default is 'FULL' with other options being the sub-regions of the binning (ex. 'Region0').
 
         Raises:
-            NameError: If subspace option is not 'FULL','LOW','SIG', or 'HIGH'.
+            NameError: If subspace option is not 'FULL' or a sub-region name.
 
         Returns:
             TH2F: Histogram from file.
         '''
-        if subspace not in ['FULL','LOW','SIG','HIGH']:
-            raise NameError("Subspace '%s' not accepted. Options are 'FULL','LOW','SIG','HIGH'.")
+        return self._getHist(self._histName(histname,process,region,systematic,subspace))
+
+    def _getHist(self,histname):
+        '''Get a histogram by name, building it if it is a sparse MC-stat template
+        (see AddMCStatShapes()) or a lazy sub-region (see _buildLazy()).
+
+        Args:
+            histname (str): Name of the histogram.
+
+        Returns:
+            TH2: Histogram.
+        '''
+        if histname in self._sparse:
+            return self._buildSparse(histname)
+        if histname in self._lazy:
+            return self._buildLazy(histname)
+        return self.file.Get(histname)
+
+    def GetArrays(self,histname='',process='',region='',systematic='',subspace='FULL',include_overflow=False):
+        '''Get the bin contents and sum of weights squared of a histogram as NumPy arrays
+        indexed as [y, x]. The histogram is specified in the same way as for Get().
+        With the "mmap" backend, the arrays are read-only views of the memory-mapped file.
+
+        Args:
+            histname (str, optional): Name of histogram to get. Overrides other three options if specified. Defaults to ''.
+            process (str, optional): Name of process to search for. Defaults to ''.
+            region (str, optional): Name of region to search for. Defaults to ''.
+            systematic (str, optional): Name of systematic to search for. Defaults to ''.
+            subspace (str, optional): Name of subspace. Defaults to 'FULL'.
+            include_overflow (bool, optional): Whether or not to include the under/overflow bins. Defaults to False.
+
+        Returns:
+            tuple: (0) bin contents and (1) sum of weights squared.
+        '''
+        histname = self._histName(histname,process,region,systematic,subspace)
+        if histname in self._sparse or histname in self._lazy:
+            h = self._getHist(histname)
+            return hist2array(h, include_overflow), hist2sumw2(h, include_overflow)
+        if self.backend == 'mmap':
+            return self.file.GetArrays(histname, include_overflow)
+        h = self.file.Get(histname)
+        return hist2array(h, include_overflow), hist2sumw2(h, include_overflow)
+
+    def _histName(self,histname='',process='',region='',systematic='',subspace='FULL'):
+        '''Build the histogram name for Get() and GetArrays() and check that it exists.
+
+        Raises:
+            NameError: If subspace option is not 'FULL' or a sub-region name.
+            NameError: If the histogram does not exist.
+
+        Returns:
+            str: Histogram name.
+        '''
+        subspaces = ['FULL'] + sorted({c for xbinByCat in self._xbinByCat.values() for c in xbinByCat})
+        if subspace not in subspaces:
+            raise NameError("Subspace '%s' not accepted. Options are '%s'."%(subspace, "','".join(subspaces)))
         if histname == '':
             histname = '_'.join([process,region,subspace])
             if systematic != '':
                 histname+='_'+systematic
 
-        all_histnames = [k.GetName() for k in self.file.GetListOfKeys()]
-        if histname not in all_histnames:
+        if histname not in self._names and histname not in self._sparse and histname not in self._lazy:
             raise NameError('Histogram %s does not exist.'%(histname))
 
-        return self.file.Get(histname)
+        return histname
 
     def GetHistNames(self):
-        return [hkey.GetName() for hkey in self.file.GetListOfKeys()]
+        return list(self._names) + list(self._lazy) + list(self._sparse)
+
+    def _buildSparse(self,histname):
+        '''Build a sparse MC-stat template (see AddMCStatShapes()) from its nominal histogram.
+
+        Args:
+            histname (str): Name of the template.
+
+        Returns:
+            TH2: New histogram (not attached to any directory).
+        '''
+        entry = self._sparse[histname]
+        h = self._getHist(entry['nominal']).Clone(histname)
+        h.SetDirectory(0)
+        h.SetBinContent(entry['bx'], entry['by'], h.GetBinContent(entry['bx'], entry['by']) * entry['factor'])
+        h.SetTitle(histname)
+        return h
 
     def BinningLookup(self,histname):
-        all_hists = pandas.concat([v[['out_histname','binning']] for v in self.hist_map.values()])
-        return all_hists.loc[all_hists.out_histname.eq(histname)].iloc[0].binning
+        return self._binnings[histname]
 
     def CreateSubRegions(self,h,binning):
         '''Sub-divide input histogram along the X axis into the regions specified in the config
         and write the new histogram to organized_hists.root.
 
+        In lazy mode, only the names of the sub-regions are recorded (see _buildLazy()).
+
+        Returns:
+            None
+        '''
+        if self.lazy:
+            self._addLazy(h.GetName(), binning.name)
+        else:
+            self._writeSubRegions(split_hist_in_x(h, binning.xbinByCat))
+
+    def _writeSubRegions(self,subregions):
+        '''Write the sub-region histograms (from split_hist_in_x()) to organized_hists.root.
+
+        Args:
+            subregions (dict): Sub-region name to TH2.
+
+        Returns:
+            None
+        '''
+        for hsub in subregions.values():
+            _finalize_subregion(hsub)
+            self._write(hsub)
+
+    def _addLazy(self,histname,binning):
+        '''Record the sub-regions of a full histogram without making them (lazy mode).
+
+        Args:
+            histname (str): Name of the histogram over the full X axis.
+            binning (str): Name of the binning of the histogram.
+
+        Returns:
+            None
+        '''
+        for cat in self._xbinByCat[binning]:
+            self._lazy[histname.replace('_FULL','_'+cat)] = {'full': histname, 'cat': cat, 'binning': binning}
+
+    def _buildLazy(self,histname):
+        '''Split a lazy sub-region out of its full histogram. The splits of the
+        `_lazy_cache_size` most recently requested sub-regions are cached and a copy
+        is returned so that callers can modify it without changing the cache.
+
+        Args:
+            histname (str): Name of the sub-region histogram.
+
+        Returns:
+            TH2: Sub-region histogram (not attached to any directory).
+        '''
+        if histname in self._lazyCache:
+            self._lazyCache.move_to_end(histname)
+        else:
+            entry = self._lazy[histname]
+            hsub = split_hist_in_x(self._getHist(entry['full']), {entry['cat']: self._xbinByCat[entry['binning']][entry['cat']]})[entry['cat']]
+            hsub.SetDirectory(0)
+            _finalize_subregion(hsub)
+            self._lazyCache[histname] = hsub
+            if len(self._lazyCache) > _lazy_cache_size:
+                self._lazyCache.popitem(last=False)
+        h = self._lazyCache[histname].Clone()
+        h.SetDirectory(0)
+        return h
+
+    def _saveLazy(self):
+        '''Save the lazy sub-region index next to organized_hists.root (lazy mode only).
+
         Returns:
             None
         '''
-        for sub in binning.xbinByCat.keys():
-            hsub = h.Clone()
-            hsub = copy_hist_with_new_bins(h.GetName().replace('_FULL','_'+sub),'X',h,binning.xbinByCat[sub])
-            hsub.SetTitle(hsub.GetName())
-            if hsub.Integral() <= 0:
-                print ('WARNING: %s has zero or negative events - %s'%(hsub.GetName(), hsub.Integral()))
-                for b in range(1,hsub.GetNbinsX()*hsub.GetNbinsY()+1):
-                    hsub.SetBinContent(b,1e-6)
-            self.file.WriteObject(hsub, hsub.GetName())
+        if self.lazy:
+            with open(self.lazyname,'w') as f:
+                json.dump(self._lazy, f)
+
+def _finalize_subregion(hsub):
+    '''Title a sub-region histogram with its name and set all bins to 1e-6
+    if it has zero or negative events (in place).
+
+    Args:
+        hsub (TH2): Sub-region histogram.
+
+    Returns:
+        None
+    '''
+    hsub.SetTitle(hsub.GetName())
+    if hsub.Integral() <= 0:
+        print ('WARNING: %s has zero or negative events - %s'%(hsub.GetName(), hsub.Integral()))
+        for b in range(1,hsub.GetNbinsX()*hsub.GetNbinsY()+1):
+            hsub.SetBinContent(b,1e-6)
+
+def _ingest_hists(infile,histdf,edges,split=True):
+    '''Read, scale and rebin the histograms of one input file.
+
+    Args:
+        infile (TFile): Opened input file.
+        histdf (pandas.DataFrame): Rows of the histogram map for infile.
+        edges (dict): Binning name to tuple of (xbinByCat, ybinList).
+        split (bool, optional): Whether to also make the sub-region histograms. Defaults to True.
+
+    Raises:
+        ValueError: If the requested color is not defined.
+
+    Yields:
+        tuple: (0) TH2 over the full X axis and (1) dict of sub-region name to TH2.
+    '''
+    for row in histdf.itertuples():
+        h = infile.Get(row.source_histname)
+        h.SetDirectory(0)
+        h.Scale(row.scale)
+        xbinByCat, ybinList = edges[row.binning]
+
+        h, subregions = rebin_hist_2d(row.out_histname,h,xbinByCat,ybinList,split)
+
+        h.SetTitle(row.out_histname)
+        if row.color not in mpl_to_root_colors.keys():
+            available_colors = '", "'.join(mpl_to_root_colors.keys())
+            raise ValueError(f'Color "{row.color}" not defined. Please add the ROOT TColor code to the "mpl_to_root_colors" dictionary defined in TwoDAlphabet.plotstyle. Available default colors are: "{available_colors}"')
+        else:
+            h.SetFillColor(mpl_to_root_colors[row.color])
+
+        yield h, subregions
+
+def _manifest_entry(infilename,row,edges):
+    '''Summarize the inputs of one histogram map row for the organized_hists.root manifest.
+
+    Args:
+        infilename (str): Input file of the row.
+        row (namedtuple): Row of the histogram map.
+        edges (dict): Binning name to tuple of (xbinByCat, ybinList).
+
+    Returns:
+        dict: Manifest entry. None if the source file cannot be checked for changes (ex. remote files).
+    '''
+    if not os.path.exists(infilename):
+        return None
+    stat = os.stat(infilename)
+    xbinByCat, ybinList = edges[row.binning]
+    return {
+        'source_filename': os.path.abspath(infilename),
+        'mtime': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'source_histname': row.source_histname,
+        'scale': float(row.scale),
+        'color': row.color,
+        'xbins': {k: [float(b) for b in v] for k,v in xbinByCat.items()},
+        'ybins': [float(b) for b in ybinList]
+    }
+
+def _ingest_shard(task):
+    '''Worker for OrganizedHists._addParallel(). Ingest one input file and write
+    the histograms to a shard file.
+
+    Args:
+        task (tuple): Input file name, histogram map rows, binning edges, shard file name, and whether to make the sub-regions.
+
+    Returns:
+        str: Shard file name.
+    '''
+    infilename, histdf, edges, shardname, split = task
+    infile = ROOT.TFile.Open(infilename)
+    shard = open_tfile_for_writing(shardname)
+    for h, subregions in _ingest_hists(infile, histdf, edges, split):
+        shard.WriteTObject(h, h.GetName())
+        for hsub in subregions.values():
+            shard.WriteTObject(hsub, hsub.GetName())
+    shard.Close()
+    infile.Close()
+    return shardname
+
+def _config_cache_key(jsonPath,findreplace,externalOpts):
+    '''Hash the inputs of a Config to key its cache.
+
+    Args:
+        jsonPath (str): File name and path of the JSON config.
+        findreplace (dict): Find-replace pairs.
+        externalOpts (dict): External options.
+
+    Returns:
+        str: Hex digest.
+    '''
+    with open(jsonPath) as f:
+        text = f.read()
+    inputs = json.dumps([_config_cache_version, _source_hash(), text, findreplace, externalOpts], sort_keys=True, default=str)
+    return hashlib.sha256(inputs.encode()).hexdigest()
+
+def _source_hash():
+    '''Hash the Python source of the TwoDAlphabet package so that a config cache
+    made by a different version of the code is not used.
+
+    Returns:
+        str: Hex digest.
+    '''
+    h = hashlib.sha256()
+    for filename in sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), '*.py'))):
+        with open(filename,'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+def _table_to_json(df):
+    '''Convert the FullTable() DataFrame to a JSON-serializable dict which keeps
+    the dtype of each column and the type of each value in object columns.
+
+    Args:
+        df (pandas.DataFrame): Table with a default index.
+
+    Returns:
+        dict: Column names, dtypes, and rows.
+    '''
+    rows = [[v.item() if isinstance(v, np.generic) else v for v in row] for row in df.astype(object).values.tolist()]
+    return {'columns': list(df.columns), 'dtypes': [str(dt) for dt in df.dtypes], 'data': rows}
+
+def _table_from_json(d):
+    '''Inverse of _table_to_json().
+
+    Args:
+        d (dict): Column names, dtypes, and rows.
+
+    Returns:
+        pandas.DataFrame
+    '''
+    df = pandas.DataFrame(d['data'], columns=d['columns'], dtype=object)
+    return df.astype(dict(zip(d['columns'], d['dtypes'])))
+
+def intern_strings(df):
+    '''Intern the strings of the object columns in _interned_columns (ex. process, region, variation).
+    Rows with the same value then point to one string object instead of each holding a copy
+    (as when read from a file), which keeps the memory of a large Ledger table low while the columns
+    stay plain object columns that any value can be assigned to. Done once when a table is made
+    or loaded (see Config.FullTable() and LoadLedger()) since subsets of the table share the strings.
+    Columns of the pandas `str` dtype are already stored compactly and are not changed.
+
+    Args:
+        df (pandas.DataFrame): Table.
+
+    Returns:
+        pandas.DataFrame: New table with the same index.
+    '''
+    interned = {}
+    for c in _interned_columns:
+        if c not in df.columns or df[c].dtype != object:
+            continue
+        values = np.empty(len(df), dtype=object)
+        values[:] = [sys.intern(v) if type(v) == str else v for v in df[c]]
+        interned[c] = pandas.Series(values, index=df.index, name=c, dtype=object)
+    return df.assign(**interned)
 
 def _keyword_replace(df,col_strs):
     '''Given a DataFrame and list of column names,
     find and replace the three keywords ("$process", "$region$", "$syst") with their
-    respective values in the row for the DataFrame.
+    respective values in the row for the DataFrame. The replacement is done once
+    per unique combination of the column value and the three keyword values and
+    then mapped back onto the rows.
 
     Args:
         df (pandas.DataFrame): DataFrame in which to do the find-replace and to find the per-row keyword matches.
@@ -738,19 +1448,14 @@ def _keyword_replace(df,col_strs):
     Returns:
         pandas.DataFrame: The manipulated DataFrame copy.
     '''
-    def _batch_replace(row,s=None):
-        if pandas.isna(row[s]):
-            return nan
-        else:
-            return replace_multi(
-                row[col_str],
-                {'$process': row.alias,
-                 '$region':  row.region,
-                 '$syst':    row.variation_alias}
-            )
-
     for col_str in col_strs:
-        df[col_str] = df.apply(_batch_replace, axis='columns', s=col_str)
+        keys = df[[col_str,'alias','region','variation_alias']]
+        codes = keys.groupby(list(keys.columns), sort=False, dropna=False).ngroup().to_numpy() # numbered in order of first appearance
+        replaced = np.array([
+            nan if pandas.isna(v) else replace_multi(v, {'$process': alias, '$region': region, '$syst': syst})
+            for v, alias, region, syst in keys.drop_duplicates().itertuples(index=False)
+        ], dtype=object)
+        df[col_str] = pandas.Series(replaced[codes].tolist(), index=df.index) # same dtype inference as DataFrame.apply
     return df
 
 def _get_syst_attrs(name,syst_dict):
@@ -766,7 +1471,7 @@ def _get_syst_attrs(name,syst_dict):
         RuntimeError: Systematic variation type could not be determined.
 
     Returns:
-        list(pands.Series): List of new rows to append to the main systematics DataFrame.
+        list(dict): List of new rows (with all of the systematics columns) to append to the main systematics DataFrame.
     '''
     if 'VAL' in syst_dict:
         out = [{
@@ -804,7 +1509,7 @@ def _get_syst_attrs(name,syst_dict):
     else:
         raise RuntimeError('Systematic variation type could not be determined for "%s".'%name)
 
-    out = [pandas.Series(copy_update_dict(_syst_col_defaults, d), name=name) for d in out]
+    out = [copy_update_dict(_syst_col_defaults, d) for d in out]
     return out
 
 def _df_condense_nameinfo(df,baseColName):
@@ -819,7 +1524,8 @@ def _df_condense_nameinfo(df,baseColName):
     Returns:
         pandas.DataFrame: Condensed DataFrame.
     '''
-    df[baseColName] = df.apply(lambda row: row[baseColName+'_syst'] if pandas.notna(row[baseColName+'_syst']) else row[baseColName], axis='columns')
+    syst_col = df[baseColName+'_syst'].to_numpy(object)
+    df[baseColName] = pandas.Series(np.where(pandas.notna(syst_col), syst_col, df[baseColName].to_numpy(object)).tolist(), index=df.index) # same dtype inference as DataFrame.apply
     df.drop(baseColName+'_syst',axis='columns',inplace=True)
     return df
 
@@ -838,6 +1544,98 @@ def _df_sanity_checks(df):
     if dupes.shape[0] > 0:
         raise RuntimeError('Duplicates exist. Printing them...\n%s'%dupes)
       
+class MultiReplacer():
+    '''Apply an ordered list of find-replace pairs (ex. the "GLOBAL" section) to a nested
+    dictionary or list in a single walk. The result is the same as calling config_loop_replace()
+    once per pair, in order, except that dictionary keys are renamed in place
+    (config_loop_replace() cannot rename a key while iterating over the dictionary).
+
+    All "finds" are compiled into one alternation so that strings which do not contain
+    any of them are skipped with a single search. Strings that do contain one have the
+    pairs applied in order (so a replacement can itself be substituted by a later pair).
+    The finds are matched literally.
+
+    Attributes:
+        pairs (list(tuple)): (find, replace, whole word pattern) in order.
+    '''
+    def __init__(self):
+        self.pairs = []
+        self._any = None
+
+    def Add(self,old,new):
+        '''Add a find-replace pair after the existing ones.
+
+        Args:
+            old (str): String to find.
+            new (non-nested obj): Replacement (of type string, int, float, etc - no lists or dictionaries).
+
+        Returns:
+            None
+        '''
+        self.pairs.append((old, new, re.compile(r'\b%s\b'%re.escape(old))))
+        self._any = re.compile('|'.join(re.escape(p[0]) for p in sorted(self.pairs, key=lambda p: -len(p[0]))))
+
+    def Replace(self,v,inList=False):
+        '''Apply the pairs to one non-nested value. Strings have whole-word matches replaced if
+        the replacement is a string (or if `inList`). Otherwise, the value is only replaced if it
+        matches in its entirety.
+
+        Args:
+            v (non-nested obj): Value to do the replacement on.
+            inList (bool, optional): Whether v is a list entry or dictionary key. Defaults to False.
+
+        Returns:
+            non-nested obj: The new value.
+        '''
+        if not isinstance(v,str) or self._any == None or not self._any.search(v):
+            return v # none of the finds are in v (non-strings never match a find)
+        for old, new, pattern in self.pairs:
+            if not isinstance(v,str):
+                break
+            if isinstance(new,str) or inList:
+                if old in v:
+                    v = pattern.sub(lambda m: new, v)
+            elif old == v:
+                v = new
+        return v
+
+    def ReplaceInConfig(self,config,inGLOBAL=False):
+        '''Self-calling function to apply the pairs to a nested dictionary or list (in place).
+        Keys of a "GLOBAL" dictionary are not replaced.
+
+        Args:
+            config (dict,list): Nested dictionary or list.
+            inGLOBAL (bool, optional): Whether config is the "GLOBAL" dictionary. Defaults to False.
+
+        Raises:
+            TypeError: If input is not a dict or list.
+
+        Returns:
+            dict,list: Modified dict/list.
+        '''
+        if isinstance(config,dict):
+            for k,v in config.items():
+                if isinstance(v,dict) or isinstance(v,list):
+                    self.ReplaceInConfig(v, inGLOBAL=(k == 'GLOBAL' and isinstance(v,dict)))
+                else:
+                    config[k] = self.Replace(v)
+            if not inGLOBAL:
+                new_keys = [self.Replace(k,inList=True) for k in config]
+                if new_keys != list(config.keys()):
+                    items = list(zip(new_keys, config.values()))
+                    config.clear()
+                    config.update(items)
+        elif isinstance(config,list):
+            for i,v in enumerate(config):
+                if isinstance(v,dict) or isinstance(v,list):
+                    self.ReplaceInConfig(v)
+                else:
+                    config[i] = self.Replace(v,inList=True)
+        else:
+            raise TypeError('Type "%s" not accepted in MultiReplacer.ReplaceInConfig.'%type(config))
+
+        return config
+
 def config_loop_replace(config,old,new,inGLOBAL=False):
     '''Self-calling function loop to find-replace one pair (old,new)
     in a nested dictionary or list (config). If old, new, and the config entry
@@ -0,0 +1,113 @@
+#include "TwoDAlphabetCategoryFunc.h"
+
+#include <algorithm>
+#include <stdexcept>
+#include <string>
+
+ClassImp(TwoDAlphabetCategoryFunc);
+ClassImp(TwoDAlphabetCategoryBin);
+
+TwoDAlphabetCategoryFunc::TwoDAlphabetCategoryFunc(const char *name, const char *title, const char *formula,
+                                                   const RooArgList &pars, const RooArgList &a, const RooArgList &b,
+                                                   const std::vector<double> &x, const std::vector<double> &y,
+                                                   bool forcePositive)
+    : RooAbsReal(name, title),
+      _formula((std::string(name) + "_formula").c_str(), formula, false),
+      _pars("pars", "Parameters", this),
+      _a("a", "First input", this),
+      _b("b", "Second input", this),
+      _x(x),
+      _y(y),
+      _forcePositive(forcePositive)
+{
+    if (x.size() != y.size())
+        throw std::invalid_argument(std::string(name) + ": x and y bin center tables have different lengths.");
+    for (const RooArgList *operand : {&a, &b}) {
+        if (operand->getSize() > 1 && operand->getSize() != (int)x.size())
+            throw std::invalid_argument(std::string(name) + ": input list does not have one entry per bin.");
+    }
+    _pars.add(pars);
+    _a.add(a);
+    _b.add(b);
+}
+
+TwoDAlphabetCategoryFunc::TwoDAlphabetCategoryFunc(const TwoDAlphabetCategoryFunc &other, const char *name)
+    : RooAbsReal(other, name),
+      _formula(other._formula),
+      _pars("pars", this, other._pars),
+      _a("a", this, other._a),
+      _b("b", this, other._b),
+      _x(other._x),
+      _y(other._y),
+      _forcePositive(other._forcePositive)
+{
+}
+
+void TwoDAlphabetCategoryFunc::operandValues(const RooListProxy &operand, std::vector<double> &out) const
+{
+    out.clear();
+    if (operand.getSize() == 0) return;
+
+    auto whole = dynamic_cast<const TwoDAlphabetCategoryFunc *>(operand.at(0));
+    if (operand.getSize() == 1 && whole) {
+        whole->getVal();
+        for (int i = 0; i < whole->nBins(); ++i) out.push_back(whole->binVal(i));
+    } else {
+        for (int i = 0; i < operand.getSize(); ++i)
+            out.push_back(static_cast<const RooAbsReal *>(operand.at(i))->getVal());
+    }
+}
+
+double TwoDAlphabetCategoryFunc::fill() const
+{
+    _p.resize(_pars.getSize());
+    for (int i = 0; i < _pars.getSize(); ++i) _p[i] = static_cast<const RooAbsReal *>(_pars.at(i))->getVal();
+    operandValues(_a, _aVals);
+    operandValues(_b, _bVals);
+
+    const std::size_t n = _x.size();
+    _vals.resize(n);
+    double sum = 0;
+    double xx[4] = {0, 0, 0, 0};
+    for (std::size_t i = 0; i < n; ++i) {
+        xx[0] = _x[i];
+        xx[1] = _y[i];
+        if (!_aVals.empty()) xx[2] = _aVals[i];
+        if (!_bVals.empty()) xx[3] = _bVals[i];
+        double v = _formula.EvalPar(xx, _p.data());
+        if (_forcePositive) v = std::max(1e-9, v);
+        _vals[i] = v;
+        sum += v;
+    }
+    return sum;
+}
+
+double TwoDAlphabetCategoryFunc::evaluate() const
+{
+    return fill();
+}
+
+double TwoDAlphabetCategoryFunc::binVal(int i) const
+{
+    // The bin table is transient so it is empty after reading from a file
+    // even if the cached value of the object itself is still clean.
+    if (_vals.size() != _x.size()) fill();
+    return _vals[i];
+}
+
+TwoDAlphabetCategoryBin::TwoDAlphabetCategoryBin(const char *name, const char *title, TwoDAlphabetCategoryFunc &cat, int index)
+    : RooAbsReal(name, title), _cat("cat", "Category", this, cat), _index(index)
+{
+}
+
+TwoDAlphabetCategoryBin::TwoDAlphabetCategoryBin(const TwoDAlphabetCategoryBin &other, const char *name)
+    : RooAbsReal(other, name), _cat("cat", this, other._cat), _index(other._index)
+{
+}
+
+double TwoDAlphabetCategoryBin::evaluate() const
+{
+    const auto &cat = static_cast<const TwoDAlphabetCategoryFunc &>(_cat.arg());
+    cat.getVal();
+    return cat.binVal(_index);
+}
@@ -0,0 +1,73 @@
+#ifndef TWODALPHABET_CATEGORYFUNC_H
+#define TWODALPHABET_CATEGORYFUNC_H
+
+#include "RooAbsReal.h"
+#include "RooListProxy.h"
+#include "RooRealProxy.h"
+#include "TFormula.h"
+
+#include <vector>
+
+// Evaluates every bin of one category ("LOW", "SIG", or "HIGH") of a
+// TwoDAlphabet Generic2D object in one call. The bin values come from a
+// TFormula in x (x[0]), y (x[1]), and, for combinations of two objects,
+// the bins a (x[2]) and b (x[3]) of the two inputs. Parameters are [0], [1], ...
+// The value of the object itself is the sum of the bins.
+class TwoDAlphabetCategoryFunc : public RooAbsReal {
+public:
+    TwoDAlphabetCategoryFunc() {}
+    TwoDAlphabetCategoryFunc(const char *name, const char *title, const char *formula,
+                             const RooArgList &pars, const RooArgList &a, const RooArgList &b,
+                             const std::vector<double> &x, const std::vector<double> &y,
+                             bool forcePositive);
+    TwoDAlphabetCategoryFunc(const TwoDAlphabetCategoryFunc &other, const char *name = nullptr);
+    TObject *clone(const char *newname) const override { return new TwoDAlphabetCategoryFunc(*this, newname); }
+
+    // Value of bin i (index 0 is the first x bin of the first y bin, x changes fastest)
+    // for the parameter values of the last evaluation.
+    double binVal(int i) const;
+    int nBins() const { return _x.size(); }
+    bool isValid() const { return _formula.IsValid(); }
+
+protected:
+    double evaluate() const override;
+
+private:
+    double fill() const;
+    void operandValues(const RooListProxy &operand, std::vector<double> &out) const;
+
+    TFormula _formula;
+    RooListProxy _pars;
+    RooListProxy _a; // empty, one TwoDAlphabetCategoryFunc, or one RooAbsReal per bin
+    RooListProxy _b;
+    std::vector<double> _x;
+    std::vector<double> _y;
+    bool _forcePositive = true;
+
+    mutable std::vector<double> _vals;  //! bin values of the last evaluation
+    mutable std::vector<double> _p;     //! parameter buffer
+    mutable std::vector<double> _aVals; //!
+    mutable std::vector<double> _bVals; //!
+
+    ClassDefOverride(TwoDAlphabetCategoryFunc, 1)
+};
+
+// One bin of a TwoDAlphabetCategoryFunc, to fill the bin list of a RooParametricHist2D.
+class TwoDAlphabetCategoryBin : public RooAbsReal {
+public:
+    TwoDAlphabetCategoryBin() {}
+    TwoDAlphabetCategoryBin(const char *name, const char *title, TwoDAlphabetCategoryFunc &cat, int index);
+    TwoDAlphabetCategoryBin(const TwoDAlphabetCategoryBin &other, const char *name = nullptr);
+    TObject *clone(const char *newname) const override { return new TwoDAlphabetCategoryBin(*this, newname); }
+
+protected:
+    double evaluate() const override;
+
+private:
+    RooRealProxy _cat;
+    int _index = 0;
+
+    ClassDefOverride(TwoDAlphabetCategoryBin, 1)
+};
+
+#endif
@@ -6,6 +6,8 @@ from contextlib import contextmanager
 # Function stolen from https://root-forum.cern.ch/t/trying-to-convert-rdf-generated-histogram-into-numpy-array/53428/3
 def hist2array(hist, include_overflow=False, return_errors=False):
     '''Create a numpy array from a ROOT histogram without external tools like root_numpy.
+    The returned arrays are views of the histogram buffers (no copy is made) and are
+    indexed as [z, y, x].
 
     Args:
         hist (TH1): Input ROOT histogram
@@ -17,20 +19,15 @@ def hist2array(hist, include_overflow=False, return_errors=False):
         errors (np.ndarray): Array containing the sqrt of the sum of weights squared
     '''
     hist.BufferEmpty()
-    root_arr = hist.GetArray()
-    if isinstance(hist, ROOT.TH1):
-        shape = (hist.GetNbinsX() + 2,)
-    elif isinstance(hist, ROOT.TH2):
-        shape = (hist.GetNbinsY() + 2, hist.GetNbinsX() + 2)
-    elif isinstance(hist, ROOT.TH3):
-        shape = (hist.GetNbinsZ() + 2, hist.GetNbinsY() + 2, hist.GetNbinsX() + 2)
-    else:
-        raise TypeError(f'hist must be an instance of ROOT.TH1, ROOT.TH2, or ROOT.TH3')
+    shape = _hist_shape(hist)
 
     # Get the array and, optionally, errors
-    arr = np.ndarray(shape, dtype=np.float64, buffer=root_arr, order='C')
+    arr = np.ndarray(shape, dtype=_hist_dtype(hist), buffer=hist.GetArray(), order='C')
     if return_errors:
-        errors = np.sqrt(np.ndarray(shape, dtype='f8', buffer=hist.GetSumw2().GetArray()))
+        if hist.GetSumw2N() > 0:
+            errors = np.sqrt(np.ndarray(shape, dtype='f8', buffer=hist.GetSumw2().GetArray()))
+        else: # same as TH1::GetBinError() without Sumw2
+            errors = np.sqrt(np.abs(arr, dtype='f8'))
 
     if not include_overflow:
         arr = arr[tuple([slice(1, -1) for idim in range(arr.ndim)])]
@@ -42,6 +39,89 @@ def hist2array(hist, include_overflow=False, return_errors=False):
     else:
         return arr
 
+def hist2sumw2(hist, include_overflow=False):
+    '''Create a numpy array of the sum of weights squared of a ROOT histogram.
+    Same indexing as hist2array(). If the histogram does not store the sum of weights squared,
+    the absolute value of the bin contents is returned (consistent with TH1::GetBinError()).
+
+    Args:
+        hist (TH1): Input ROOT histogram
+        include_overflow (bool, optional): Whether or not to include the under/overflow bins. Defaults to False.
+
+    Returns:
+        np.ndarray: Sum of weights squared.
+    '''
+    shape = _hist_shape(hist)
+    if hist.GetSumw2N() > 0:
+        sumw2 = np.ndarray(shape, dtype='f8', buffer=hist.GetSumw2().GetArray(), order='C')
+    else:
+        sumw2 = np.abs(hist2array(hist, include_overflow=True), dtype='f8')
+
+    if not include_overflow:
+        sumw2 = sumw2[tuple([slice(1, -1) for idim in range(sumw2.ndim)])]
+    return sumw2
+
+def array2hist(hist, arr, sumw2=None, include_overflow=False, entries=0):
+    '''Write a numpy array (and optionally the sum of weights squared) into the buffers
+    of a ROOT histogram. Inverse of hist2array() with the same [z, y, x] indexing.
+    The bookkeeping is the same as after `entries` calls to SetBinContent():
+    the stored statistics are dropped so that GetStats() recomputes them from
+    the bins, and the number of entries is increased by `entries`.
+
+    Args:
+        hist (TH1): Histogram to fill. Binning must match the shape of arr.
+        arr (np.ndarray): Bin contents.
+        sumw2 (np.ndarray, optional): Sum of weights squared for each bin. Defaults to None
+            in which case the errors of hist are left untouched.
+        include_overflow (bool, optional): Whether arr includes the under/overflow bins. Defaults to False.
+        entries (int, optional): Number to add to the entries of hist. Defaults to 0.
+
+    Raises:
+        ValueError: If the shape of arr or sumw2 does not match the histogram.
+
+    Returns:
+        TH1: The filled input histogram.
+    '''
+    hist.BufferEmpty()
+    shape = _hist_shape(hist)
+    inner = tuple([slice(None) if include_overflow else slice(1, -1) for idim in range(len(shape))])
+
+    content = np.ndarray(shape, dtype=_hist_dtype(hist), buffer=hist.GetArray(), order='C')
+    if content[inner].shape != np.shape(arr):
+        raise ValueError('Array of shape %s does not match histogram %s of shape %s.'%(np.shape(arr), hist.GetName(), content[inner].shape))
+    content[inner] = arr
+
+    if sumw2 is not None:
+        if np.shape(sumw2) != np.shape(arr):
+            raise ValueError('Sumw2 array of shape %s does not match histogram %s of shape %s.'%(np.shape(sumw2), hist.GetName(), content[inner].shape))
+        if hist.GetSumw2N() == 0:
+            hist.Sumw2()
+        np.ndarray(shape, dtype='f8', buffer=hist.GetSumw2().GetArray(), order='C')[inner] = sumw2
+
+    hist.PutStats(np.zeros(13))
+    hist.SetEntries(hist.GetEntries() + entries)
+    return hist
+
+def _hist_shape(hist):
+    '''Shape of the bin buffer of hist, including under/overflow, in [z, y, x] order.'''
+    if isinstance(hist, ROOT.TH3):
+        shape = (hist.GetNbinsZ() + 2, hist.GetNbinsY() + 2, hist.GetNbinsX() + 2)
+    elif isinstance(hist, ROOT.TH2):
+        shape = (hist.GetNbinsY() + 2, hist.GetNbinsX() + 2)
+    elif isinstance(hist, ROOT.TH1):
+        shape = (hist.GetNbinsX() + 2,)
+    else:
+        raise TypeError(f'hist must be an instance of ROOT.TH1, ROOT.TH2, or ROOT.TH3')
+    return shape
+
+def _hist_dtype(hist):
+    '''Numpy dtype of the bin buffer of hist (ex. float32 for TH2F).'''
+    for arraytype, dtype in [('TArrayD', np.float64), ('TArrayF', np.float32),
+                             ('TArrayI', np.int32), ('TArrayS', np.int16), ('TArrayC', np.int8)]:
+        if isinstance(hist, getattr(ROOT, arraytype)):
+            return dtype
+    raise TypeError('Could not determine the storage type of histogram %s.'%hist.GetName())
+
 # Function stolen from https://stackoverflow.com/questions/9590382/forcing-python-json-module-to-work-with-ascii
 def open_json(f):
     '''Open a JSON file. Specify twoDconfig to true if this is a 2DAlphabet 
@@ -177,6 +257,41 @@ def make_RDH(myTH2,RAL_vars,altname=''):
     thisRDH = ROOT.RooDataHist(name,name,RAL_vars,myTH2)
     return thisRDH
 
+_compression_algorithms = {'zlib': 1, 'lzma': 2, 'lz4': 4, 'zstd': 5}
+
+def open_tfile_for_writing(filename, option='RECREATE', algorithm='', level=None, cachesize=32*1024*1024):
+    '''Open a TFile for writing with a write cache (TFileCacheWrite) so that the keys
+    are flushed to disk in blocks of `cachesize` bytes rather than with one write per object.
+    The cache is flushed when the file is closed.
+
+    Args:
+        filename (str): File name and path.
+        option (str, optional): TFile option. Defaults to 'RECREATE'.
+        algorithm (str, optional): Compression algorithm. Either "zlib", "lzma", "lz4", or "zstd".
+            Defaults to '' in which case the ROOT default is used.
+        level (int, optional): Compression level (0 for no compression to 9). Defaults to None in which case the ROOT default is used.
+        cachesize (int, optional): Size of the write cache in bytes. Defaults to 32 MB.
+
+    Raises:
+        ValueError: If the compression algorithm is not accepted.
+        IOError: If the file cannot be opened.
+
+    Returns:
+        TFile
+    '''
+    if algorithm != '' and algorithm not in _compression_algorithms:
+        raise ValueError('Compression algorithm "%s" not accepted. Options are "%s".'%(algorithm,'", "'.join(_compression_algorithms.keys())))
+    f = ROOT.TFile.Open(filename, option)
+    if not f or f.IsZombie():
+        raise IOError('File %s could not be opened for writing.'%filename)
+    if algorithm != '':
+        f.SetCompressionAlgorithm(_compression_algorithms[algorithm])
+    if level != None:
+        f.SetCompressionLevel(level)
+    cache = ROOT.TFileCacheWrite(f, cachesize)
+    ROOT.SetOwnership(cache, False) # owned (and deleted) by the TFile
+    return f
+
 # def make_RHP(myRDH,RAL_vars):
 #     name = myRDH.GetName()
 #     thisRAS = ROOT.RooArgSet(RAL_vars)
@@ -0,0 +1,182 @@
+import ROOT, array, json, os
+import numpy as np
+from TwoDAlphabet.helpers import hist2array, hist2sumw2, array2hist
+from TwoDAlphabet.binning import get_bins_from_hist
+
+class ArrayStore():
+    '''Memory-mapped store of 2D histograms as NumPy arrays. Alternative to a TFile
+    for OrganizedHists. The bin contents and sum of weights squared (including under/overflow)
+    of every histogram are appended to one flat float64 file and a JSON index maps
+    each histogram name to its location in that file, its bin edges, and the attributes
+    needed to rebuild the TH2 (class, title, fill color, axis names).
+
+    Arrays are read as zero-copy views of the memory map so that reading a histogram
+    only touches the pages it occupies. A TH2 is only built when one is requested with Get().
+
+    Attributes:
+        filename (str): Path to the data file.
+        indexname (str): Path to the JSON index.
+        mode (str): "r" (read), "w" (recreate), or "a" (update).
+        index (dict): Histogram name to index entry.
+
+    Args:
+        filename (str): Path to the data file.
+        mode (str, optional): "r" (read), "w" (recreate), or "a" (update). Defaults to "r".
+        buffersize (int, optional): Size in bytes of the write buffer of the data file. Defaults to 32 MB.
+    '''
+    def __init__(self, filename, mode='r', buffersize=32*1024*1024):
+        if mode not in ['r','w','a']:
+            raise ValueError('Mode "%s" not accepted. Options are "r", "w", and "a".'%mode)
+        self.filename = filename
+        self.indexname = ArrayStore.IndexName(filename)
+        self.mode = mode
+        self._map = None
+        self._out = None
+
+        if mode == 'w':
+            self.index = {}
+        else:
+            with open(self.indexname) as f:
+                self.index = json.load(f)
+        if mode != 'r': # one buffered handle for all writes
+            self._out = open(self.filename, 'wb' if mode == 'w' else 'ab', buffering=buffersize)
+
+    @staticmethod
+    def IndexName(filename):
+        '''
+        Returns:
+            str: Path of the JSON index that accompanies the data file `filename`.
+        '''
+        return os.path.splitext(filename)[0]+'_index.json'
+
+    def WriteHist(self, hist, name=None):
+        '''Append a TH2 to the store. A histogram with the same name is replaced
+        in the index (the old arrays are left in the data file).
+
+        Args:
+            hist (TH2): Histogram to store.
+            name (str, optional): Name to store the histogram under. Defaults to None in which case the histogram name is used.
+
+        Returns:
+            None
+        '''
+        name = hist.GetName() if name == None else name
+        content = hist2array(hist, include_overflow=True)
+        self.WriteArrays(name, content, hist2sumw2(hist, include_overflow=True),
+                         xbins=get_bins_from_hist('X',hist), ybins=get_bins_from_hist('Y',hist),
+                         cls=hist.ClassName(), title=hist.GetTitle(), fillcolor=hist.GetFillColor(),
+                         xname=hist.GetXaxis().GetName(), yname=hist.GetYaxis().GetName(), entries=hist.GetEntries())
+
+    def WriteArrays(self, name, content, sumw2, xbins, ybins, cls='TH2F', title=None, fillcolor=0, xname='xaxis', yname='yaxis', entries=0):
+        '''Append arrays (including the under/overflow bins) to the store.
+
+        Args:
+            name (str): Name of the histogram.
+            content (np.ndarray): Bin contents with shape (len(ybins)+1, len(xbins)+1).
+            sumw2 (np.ndarray): Sum of weights squared with the same shape as content.
+            xbins (list): X bin edges.
+            ybins (list): Y bin edges.
+            cls (str, optional): ROOT class used to rebuild the histogram. Defaults to "TH2F".
+            title (str, optional): Histogram title. Defaults to None in which case the name is used.
+            fillcolor (int, optional): Histogram fill color. Defaults to 0.
+            xname (str, optional): X axis name. Defaults to "xaxis".
+            yname (str, optional): Y axis name. Defaults to "yaxis".
+            entries (float, optional): Number of entries of the histogram. Defaults to 0.
+
+        Raises:
+            IOError: If the store is opened in read mode.
+            ValueError: If the array shapes do not match the bin edges.
+
+        Returns:
+            None
+        '''
+        if self.mode == 'r':
+            raise IOError('ArrayStore %s is opened in read mode.'%self.filename)
+        shape = (len(ybins)+1, len(xbins)+1)
+        if np.shape(content) != shape or np.shape(sumw2) != shape:
+            raise ValueError('Arrays for %s of shape %s and %s do not match the bin edges (%s).'%(name, np.shape(content), np.shape(sumw2), shape))
+
+        offset = self._out.tell()//8
+        self._out.write(np.ascontiguousarray(content, dtype=np.float64).tobytes())
+        self._out.write(np.ascontiguousarray(sumw2, dtype=np.float64).tobytes())
+        self._map = None # data file grew
+
+        self.index[name] = {
+            'offset': offset, 'shape': list(shape),
+            'xbins': [float(b) for b in xbins], 'ybins': [float(b) for b in ybins],
+            'class': cls, 'title': name if title == None else title, 'fillcolor': int(fillcolor),
+            'xname': xname, 'yname': yname, 'entries': float(entries)
+        }
+
+    def GetArrays(self, name, include_overflow=False):
+        '''Get read-only views of the stored arrays.
+
+        Args:
+            name (str): Name of the histogram.
+            include_overflow (bool, optional): Whether or not to include the under/overflow bins. Defaults to False.
+
+        Returns:
+            tuple: (0) bin contents and (1) sum of weights squared, indexed as [y, x].
+        '''
+        entry = self.index[name]
+        if self._map is None:
+            if self._out is not None:
+                self._out.flush()
+            self._map = np.memmap(self.filename, dtype=np.float64, mode='r')
+        size = entry['shape'][0]*entry['shape'][1]
+        start = entry['offset']
+        content = self._map[start:start+size].reshape(entry['shape'])
+        sumw2 = self._map[start+size:start+2*size].reshape(entry['shape'])
+        if not include_overflow:
+            content, sumw2 = content[1:-1,1:-1], sumw2[1:-1,1:-1]
+        return content, sumw2
+
+    def GetEdges(self, name):
+        '''
+        Returns:
+            tuple: (0) X and (1) Y bin edges of histogram `name`.
+        '''
+        return self.index[name]['xbins'], self.index[name]['ybins']
+
+    def Get(self, name):
+        '''Build the TH2 for a stored histogram.
+
+        Args:
+            name (str): Name of the histogram.
+
+        Returns:
+            TH2: New histogram (not attached to any directory).
+        '''
+        entry = self.index[name]
+        xbins = array.array('d', entry['xbins'])
+        ybins = array.array('d', entry['ybins'])
+        hist = getattr(ROOT, entry['class'])(name, entry['title'], len(xbins)-1, xbins, len(ybins)-1, ybins)
+        hist.SetDirectory(0)
+        hist.Sumw2()
+        hist.SetFillColor(entry['fillcolor'])
+        hist.GetXaxis().SetName(entry['xname'])
+        hist.GetYaxis().SetName(entry['yname'])
+        content, sumw2 = self.GetArrays(name, include_overflow=True)
+        array2hist(hist, content, sumw2, include_overflow=True, entries=entry.get('entries', 0))
+        return hist
+
+    def GetNames(self):
+        '''
+        Returns:
+            list(str): Names of the stored histograms in the order they were written.
+        '''
+        return list(self.index.keys())
+
+    def Close(self):
+        '''Flush the data file and write the index (if opened for writing) and release the memory map.
+
+        Returns:
+            None
+        '''
+        if self._out is not None:
+            self._out.close()
+            self._out = None
+        if self.mode != 'r':
+            with open(self.indexname,'w') as f:
+                json.dump(self.index, f)
+        self._map = None
@@ -0,0 +1,173 @@
+import numpy as np
+
+def rebin_positions(old_bins, new_bins, axis_name='X'):
+    '''Locate the new bin edges among the old bin edges. New edges inside the
+    old axis range must line up exactly with an old edge. New edges outside
+    of the old axis range are clamped to the first/last old edge so that the
+    corresponding bins are left empty.
+
+    Args:
+        old_bins (list): Input bin edges.
+        new_bins (list): Requested bin edges.
+        axis_name (str, optional): Axis name used in the error message. Defaults to "X".
+
+    Raises:
+        ValueError: If a new edge would split an input bin.
+
+    Returns:
+        np.ndarray: Index of each new edge in old_bins.
+    '''
+    old_bins = np.asarray(old_bins, dtype=np.float64)
+    new_bins = np.asarray(new_bins, dtype=np.float64)
+    positions = np.searchsorted(old_bins, new_bins, side='left')
+    inside = (new_bins > old_bins[0]) & (new_bins < old_bins[-1])
+    split = inside & (old_bins[np.minimum(positions, len(old_bins)-1)] != new_bins)
+    if split.any():
+        i = np.flatnonzero(split)[0]
+        new_bin = (new_bins[i-1], new_bins[i]) if i > 0 else (new_bins[0], new_bins[1])
+        raise ValueError(
+            '''The requested %s rebinning does not align bin edges with the input bin edge.
+            Cannot split input bin [%s,%s] with output bin [%s,%s]'''%(axis_name,old_bins[positions[i]-1],old_bins[positions[i]],new_bin[0],new_bin[1]))
+
+    return np.clip(positions, 0, len(old_bins)-1)
+
+def rebin_arrays(arrs, positions, axis):
+    '''Sum the bins of each array in arrs into the new bins given by positions
+    (see rebin_positions). Arrays should not include under/overflow bins.
+
+    Args:
+        arrs (list(np.ndarray)): Arrays to rebin (ex. content and sum of weights squared).
+        positions (np.ndarray): Index of each new edge in the old edges.
+        axis (int): Array axis to rebin (for arrays from hist2array, 1 is X and 0 is Y).
+
+    Returns:
+        list(np.ndarray): Rebinned float64 arrays.
+    '''
+    empty = positions[1:] == positions[:-1]
+    out = []
+    for arr in arrs:
+        arr = np.asarray(arr, dtype=np.float64)
+        # Pad with an empty bin so that a new edge at the end of the old axis is a valid index
+        pad = [(0,0)]*arr.ndim
+        pad[axis] = (0,1)
+        summed = np.add.reduceat(np.pad(arr, pad), positions, axis=axis)
+        summed = np.delete(summed, -1, axis=axis)
+        if empty.any():
+            index = [slice(None)]*arr.ndim
+            index[axis] = empty
+            summed[tuple(index)] = 0
+        out.append(summed)
+    return out
+
+def zero_nonpositive(content, sumw2):
+    '''Zero the content and sum of weights squared of all bins without positive content.
+
+    Args:
+        content (np.ndarray): Bin contents.
+        sumw2 (np.ndarray): Sum of weights squared.
+
+    Returns:
+        tuple: (0) new content and (1) new sum of weights squared.
+    '''
+    keep = content > 0
+    return np.where(keep, content, 0.), np.where(keep, sumw2, 0.)
+
+def zero_negative(content, sumw2):
+    '''Zero the content and sum of weights squared of all bins with negative content.
+
+    Args:
+        content (np.ndarray): Bin contents.
+        sumw2 (np.ndarray): Sum of weights squared.
+
+    Returns:
+        tuple: (0) new float64 content and (1) new float64 sum of weights squared.
+    '''
+    negative = content < 0
+    return np.where(negative, 0., np.asarray(content, dtype=np.float64)), np.where(negative, 0., np.asarray(sumw2, dtype=np.float64))
+
+def stitch(contents, sumw2s, blinded=[]):
+    '''Concatenate arrays along X (the last axis), leaving the pieces in `blinded` empty.
+
+    Args:
+        contents (list(np.ndarray)): Bin contents of each piece, in order along X.
+        sumw2s (list(np.ndarray)): Sum of weights squared of each piece.
+        blinded (list(int), optional): Indexes of the pieces to leave empty. Defaults to [].
+
+    Raises:
+        ValueError: If the pieces do not have the same shape along the other axes.
+
+    Returns:
+        tuple: (0) float64 content and (1) float64 sum of weights squared.
+    '''
+    if len(set(np.shape(c)[:-1] for c in contents)) > 1:
+        raise ValueError('Arrays to stitch in X have different shapes %s.'%[np.shape(c) for c in contents])
+    content = np.concatenate([np.asarray(c, dtype=np.float64) for c in contents], axis=-1)
+    sumw2 = np.concatenate([np.asarray(s, dtype=np.float64) for s in sumw2s], axis=-1)
+    start = 0
+    for i, c in enumerate(contents):
+        stop = start + np.shape(c)[-1]
+        if i in blinded:
+            content[..., start:stop] = 0
+            sumw2[..., start:stop] = 0
+        start = stop
+    return content, sumw2
+
+def blind(content, sumw2, xedges, sigregion):
+    '''Empty the bins in the X range [sigregion[0], sigregion[1]] and all bins
+    without positive content.
+
+    Args:
+        content (np.ndarray): Bin contents with X as the last axis.
+        sumw2 (np.ndarray): Sum of weights squared.
+        xedges (list): X bin edges.
+        sigregion (list(float)): Lower and upper X edges of the region to blind.
+
+    Returns:
+        tuple: (0) float64 content and (1) float64 sum of weights squared.
+    '''
+    xedges = np.asarray(xedges, dtype=np.float64)
+    outside = (xedges[1:] <= sigregion[0]) | (xedges[:-1] >= sigregion[1])
+    keep = outside & (np.asarray(content) > 0)
+    return np.where(keep, content, 0.), np.where(keep, sumw2, 0.)
+
+def remap_edges(edges, new_min=0.0, new_max=1.0):
+    '''Linearly map bin edges onto [new_min, new_max].
+
+    Args:
+        edges (list): Bin edges (including first and last).
+        new_min (float, optional): New minimum. Defaults to 0.0.
+        new_max (float, optional): New maximum. Defaults to 1.0.
+
+    Returns:
+        np.ndarray: Mapped float64 edges.
+    '''
+    edges = np.asarray(edges, dtype=np.float64)
+    scale = (edges[-1]-edges[0]) / (float(new_max) - float(new_min))
+    return (edges-edges[0])/scale + float(new_min)
+
+def min_bin_width(widths, cap=10**6):
+    '''Find the width of the narrowest bin, capped at `cap`.
+
+    Args:
+        widths (np.ndarray): Bin widths.
+        cap (int, optional): Largest width returned. Defaults to 10**6.
+
+    Returns:
+        int: Width of the narrowest bin (truncated to an int).
+    '''
+    return int(min(np.min(widths), cap)) if len(widths) else int(cap)
+
+def events_per_unit(content, sumw2, widths, width):
+    '''Scale the bins so they are normalized to a common bin width.
+
+    Args:
+        content (np.ndarray): Bin contents with X as the last axis.
+        sumw2 (np.ndarray): Sum of weights squared.
+        widths (np.ndarray): X bin widths.
+        width (float): Width to normalize to.
+
+    Returns:
+        tuple: (0) float64 content and (1) float64 sum of weights squared.
+    '''
+    factor = width/np.asarray(widths, dtype=np.float64)
+    return np.asarray(content, dtype=np.float64)*factor, np.asarray(sumw2, dtype=np.float64)*factor**2
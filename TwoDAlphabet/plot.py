@@ -743,13 +743,12 @@ def make_systematic_plots(twoD):
     for (p,r), _ in twoD.df.groupby(['process','region']):
         if p == 'data_obs': continue
 
-        nominal_full = twoD.organizedHists.Get(process=p, region=r, systematic='')
+        nominal_full = twoD.organizedHists.GetArrays(process=p, region=r, systematic='', include_overflow=True)[0]
         binning, _ = twoD.GetBinningFor(r)
         print(r, binning.xbinByCat)
         for axis in ['X','Y']:
 
-            nominal_hist = getattr(nominal_full,'Projection'+axis)('%s_%s_%s_%s'%(p,r,'nom','proj'+axis))
-            nominal = hist2array(nominal_hist)
+            nominal = _project_array(nominal_full, axis)
 
             # Get the bin edges from the 2DAlphabet binning object. Avoid edge duplication in the case of X-axis stitching
             if axis == 'X':
@@ -770,10 +769,8 @@ def make_systematic_plots(twoD):
             for s in twoD.ledger.GetShapeSystematics(drop_norms=True):
                 if s not in proc_vars: continue
 
-                up_hist = getattr(twoD.organizedHists.Get(process=p,region=r,systematic=s+'Up'),'Projection'+axis)('%s_%s_%s_%s'%(p,r,s+'Up','proj'+axis))
-                up = hist2array(up_hist)
-                down_hist = getattr(twoD.organizedHists.Get(process=p,region=r,systematic=s+'Down'),'Projection'+axis)('%s_%s_%s_%s'%(p,r,s+'Down','proj'+axis))
-                down = hist2array(down_hist)
+                up = _project_array(twoD.organizedHists.GetArrays(process=p,region=r,systematic=s+'Up',include_overflow=True)[0], axis)
+                down = _project_array(twoD.organizedHists.GetArrays(process=p,region=r,systematic=s+'Down',include_overflow=True)[0], axis)
 
                 # Begin plotting
                 labels = ['Nominal', r'$+1\sigma$', r'$-1\sigma$']
@@ -797,6 +794,19 @@ def make_systematic_plots(twoD):
                 plt.savefig(outname)
                 plt.close() # free up memory
 
+def _project_array(arr, axis):
+    '''Project a 2D array (indexed as [y, x] and including under/overflow bins) onto one axis.
+    Equivalent to TH2::ProjectionX()/ProjectionY() with the default (full) range of the other axis.
+
+    Args:
+        arr (np.ndarray): 2D array from OrganizedHists.GetArrays(..., include_overflow=True).
+        axis (str): "X" or "Y".
+
+    Returns:
+        np.ndarray: Projection without the under/overflow bins.
+    '''
+    return np.sum(arr, axis=0 if axis == 'X' else 1, dtype=np.float64)[1:-1]
+
 def _make_pull_plot(data, bkg, preVsPost=False):
     pull = data.Clone(data.GetName()+"_pull")
     pull.Add(bkg,-1)
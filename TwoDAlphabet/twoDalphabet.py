@@ -1,9 +1,9 @@
 import argparse, os, itertools, pandas, glob, pickle, sys, re, random, copy, numpy
 from collections import OrderedDict
-from TwoDAlphabet.config import Config, OrganizedHists
-from TwoDAlphabet.binning import Binning
-from TwoDAlphabet.helpers import CondorRunner, execute_cmd, parse_arg_dict, unpack_to_line, make_RDH, cd, _combineTool_impacts_fix
-from TwoDAlphabet.alphawrap import Generic2D
+from TwoDAlphabet.config import Config, OrganizedHists, intern_strings
+from TwoDAlphabet.binning import Binning, save_binnings, load_binnings
+from TwoDAlphabet.helpers import CondorRunner, execute_cmd, parse_arg_dict, unpack_to_line, make_RDH, cd, _combineTool_impacts_fix, hist2array, array2hist, open_tfile_for_writing
+from TwoDAlphabet.alphawrap import Generic2D, import_category_func_code
 from TwoDAlphabet import plot
 import ROOT
 
@@ -32,11 +32,12 @@ class TwoDAlphabet:
         if inJSON == '':
             raise RuntimeError('No JSONs were input and no existing ones could be found.')
 
-        config = Config(inJSON, findreplace)
+        config = Config(inJSON, findreplace, cacheDir=self.tag+'/', externalOpts=externalOpts)
         optdict = config._section('OPTIONS')
         optdict.update(externalOpts)
         self.options = self.LoadOptions(optdict)
         print("Running with options:", self.options)
+        self._compression = {'algorithm': self.options.compressionAlgorithm, 'level': self.options.compressionLevel}
         self.df = config.FullTable()
         self.subtagTracker = {}
         self.iterWorkspaceObjs = config.iterWorkspaceObjs
@@ -54,16 +55,24 @@ class TwoDAlphabet:
                 self.binnings[kbinning] = Binning(kbinning, config._section('BINNING')[kbinning], template)
             self.organizedHists = OrganizedHists(
                 self.tag+'/', self.binnings,
-                self.GetHistMap(), readOnly=False
+                self.GetHistMap(), readOnly=False,
+                nworkers=self.options.nworkers,
+                backend=self.options.histBackend,
+                lazy=self.options.lazySubregions,
+                compression=self._compression
             )
             # Handle MC statistical uncertainties. The threshold and include_signal options are controlled in the JSON. 
-            if self.options.mcstats:
+            # With mcstats_native, Combine's autoMCStats is used instead and templates are only made in Save() for regions that have an alpha object.
+            self._mcstatRegions = set()
+            if self.options.mcstats and not self.options.mcstats_native:
+                self._mcstatRegions.update(self.df.region.unique())
                 mcstat_rows = self.organizedHists.AddMCStatShapes(
                     self.df, self.binnings,
                     threshold      = self.options.mcstats_threshold,            # Effective events threshold below which to implement per-process nuisances (default 10)
                     include_signal = self.options.mcstats_include_signal,       # Whether to implement MC stats nuisances for signal. Defaults False, since this isn't usually done.
                     excluded_procs = self.options.mcstats_exclude_processes,    # Processes for which MC statistical uncertainty should not be calculated. 
-                    alpha_min      = self.options.mcstats_alpha_min             # Threshold for alpha below which MC statistical uncertainty histograms are not generated.
+                    alpha_min      = self.options.mcstats_alpha_min,            # Threshold for alpha below which MC statistical uncertainty histograms are not generated.
+                    sparse         = self.options.mcstats_sparse                # Store (nominal, bin, factor) and only build the templates in the sub-region of the bin.
                 )
                 if mcstat_rows:
                     self.df = pandas.concat([self.df, pandas.DataFrame(mcstat_rows)], ignore_index=True)
@@ -71,10 +80,14 @@ class TwoDAlphabet:
             self.workspace = self._makeWorkspace()
 
         else:
-            self.binnings = pickle.load(open(self.tag+'/binnings.p','rb'))
+            if os.path.exists(self.tag+'/binnings.json'):
+                self.binnings = load_binnings(self.tag+'/binnings.json')
+            else: # project directories made before binnings.json
+                self.binnings = pickle.load(open(self.tag+'/binnings.p','rb'))
             self.organizedHists = OrganizedHists(
                 self.tag+'/', self.binnings,
-                self.GetHistMap(), readOnly=True
+                self.GetHistMap(), readOnly=True,
+                backend=self.options.histBackend
             )
             # Does not contain the RooFit objects - just meta info
             self.ledger = LoadLedger(self.tag+'/')
@@ -91,6 +104,7 @@ class TwoDAlphabet:
             ROOT.gROOT.SetBatch(True)
 
         config.SaveOut(self.tag+'/')
+        config.SaveCache()
 
 
     def _setupProjDir(self):
@@ -125,6 +139,18 @@ class TwoDAlphabet:
             help="Delete project directory if it exists. Defaults to False.")
         parser.add_argument('debugDraw', default=False, type=bool, nargs='?',
             help="Draw all canvases while running for the sake of debugging. Useful for developers only. Defaults to False.")
+        parser.add_argument('nworkers', default=1, type=int, nargs='?',
+            help="Number of processes used to read and rebin the input histograms (one input file per process). Defaults to 1.")
+        parser.add_argument('histBackend', default='root', type=str, nargs='?',
+            help='Storage for the organized histograms. Either "root" (organized_hists.root) or "mmap" (memory-mapped arrays in organized_hists.dat). Defaults to "root".')
+        parser.add_argument('compressionAlgorithm', default='', type=str, nargs='?',
+            help='Compression algorithm for organized_hists.root and base.root. One of "zlib", "lzma", "lz4" (fast), or "zstd". Defaults to "" in which case the ROOT default is used.')
+        parser.add_argument('compressionLevel', default=None, type=int, nargs='?',
+            help='Compression level (0 for no compression to 9) for organized_hists.root and base.root. Defaults to None in which case the ROOT default is used.')
+        parser.add_argument('lazySubregions', default=False, type=bool, nargs='?',
+            help='Only store the histograms over the full X axis and make the sub-region histograms when they are first requested (ex. when making the workspace). Defaults to False.')
+        parser.add_argument('ledgerExports', default=[], type=str, nargs='*',
+            help='Human-readable copies of the ledgers to write next to the Parquet files. Any of "csv" and "markdown". Defaults to [].')
         # Blinding
         parser.add_argument('blindedPlots', default=[], type=str, nargs='*',
             help='List of regions in which to blind plots of x-axis SIG. Does not blind fit.')
@@ -141,6 +167,10 @@ class TwoDAlphabet:
             help='Whether to include signal in calculation of MC statistical uncertainties. Defaults to False.')
         parser.add_argument('mcstats_exclude_processes', default=[], type=str, nargs='*',
             help='List of processes for which MC statistical uncertainty templates should not be produced. NOTE: they will still be used in the calculation of the MC statistical uncertainty for other processes.')
+        parser.add_argument('mcstats_sparse', default=False, type=bool, nargs='?',
+            help='Store MC statistical uncertainty templates as (nominal histogram, bin, factor) and only build them in the sub-region containing the bin when making the workspace. The nuisance is only applied to that sub-region in the card. Defaults to False.')
+        parser.add_argument('mcstats_native', default=False, type=bool, nargs='?',
+            help='Use Combine\'s native autoMCStats (written to the card) for regions with only template processes instead of making MC statistical uncertainty templates. Templates are still made (in Save()) for regions with an alpha object since they cannot use the native treatment. NOTE: mcstats_alpha_min and mcstats_exclude_processes do not apply to the native treatment. Defaults to False.')
         # Plotting
         parser.add_argument('haddSignals', default=True, type=bool, nargs='?',
             help='Combine signals into one histogram for the sake of plotting. Still treated as separate in fit. Defaults to True.')
@@ -163,16 +193,23 @@ class TwoDAlphabet:
 
     def Save(self):
         '''Save to project directory:
-        - the full model table in csv (and markdown if py3)
-        - the binnings dictionary (with objects)
+        - the workspace (with the source of compiled Generic2D classes, if any)
+        - the full model table in Parquet (and the exports in the ledgerExports option)
+        - the binnings dictionary (edges and slices only, in JSON)
         - the alphaObjs and alphaParams dictionaries (without objects)
+
+        With the mcstats_native option, the MC statistical uncertainty templates of the regions
+        with an alpha object are made first (see _finalizeMCStats()).
         '''
-        fworkspace = ROOT.TFile.Open(self.tag+'/base.root','RECREATE')
+        self._finalizeMCStats()
+        import_category_func_code(self.workspace)
+        fworkspace = open_tfile_for_writing(self.tag+'/base.root', 'RECREATE', **self._compression)
         fworkspace.cd()
         self.workspace.Write()
+        fworkspace.Close()
 
-        pickle.dump(self.binnings,open(self.tag+'/binnings.p','wb'))
-        self.ledger.Save(self.tag)
+        save_binnings(self.binnings, self.tag+'/binnings.json')
+        self.ledger.Save(self.tag, self.options.ledgerExports)
         if self.options.plotTemplateComparisons:
             plot.make_systematic_plots(self)
 
@@ -220,6 +257,46 @@ class TwoDAlphabet:
             print ('Adding RooParametricHist norm... %s'%norm_cat.GetName())
             getattr(self.workspace,'import')(norm_cat,ROOT.RooFit.RecycleConflictNodes(),ROOT.RooFit.Silence())
 
+    def _finalizeMCStats(self):
+        '''Decide, once all alpha objects are added, which regions cannot use Combine's native
+        autoMCStats (see the mcstats_native option) because they have an alpha object and
+        make the MC statistical uncertainty templates for them. Regions that already have
+        templates are skipped so calling this more than once is safe.
+
+        Returns:
+            None
+        '''
+        if not self.options.mcstats:
+            return
+        for region in self.ledger.alphaObjs.region.unique():
+            if region not in self._mcstatRegions:
+                self._addFallbackMCStatShapes(region)
+
+    def _addFallbackMCStatShapes(self, region):
+        '''Make the MC statistical uncertainty templates for a region that has an alpha object.
+        The templates are imported into the workspace and the new rows are added to the ledger.
+
+        Args:
+            region (str): Region name.
+
+        Returns:
+            None
+        '''
+        self._mcstatRegions.add(region)
+        existing = set(self.organizedHists.GetHistNames())
+        mcstat_rows = self.organizedHists.AddMCStatShapes(
+            self.df[self.df.region.eq(region)], self.binnings,
+            threshold      = self.options.mcstats_threshold,
+            include_signal = self.options.mcstats_include_signal,
+            excluded_procs = self.options.mcstats_exclude_processes,
+            alpha_min      = self.options.mcstats_alpha_min,
+            sparse         = self.options.mcstats_sparse
+        )
+        if mcstat_rows:
+            self.df = pandas.concat([self.df, pandas.DataFrame(mcstat_rows)], ignore_index=True)
+            self.ledger.df = pandas.concat([self.ledger.df, pandas.DataFrame(mcstat_rows)], ignore_index=True)
+            self._importHists(self.workspace, [h for h in self.organizedHists.GetHistNames() if h not in existing])
+
 # --------------- GETTERS --------------- #
     def InitQCDHists(self):
         '''Loop over all regions and for a given region's data histogram, subtract the list of background histograms,
@@ -233,13 +310,17 @@ class TwoDAlphabet:
             data_hist = self.organizedHists.Get(process='data_obs',region=region,systematic='')
             qcd = data_hist.Clone(data_hist.GetName().replace('data_obs','qcd'))
             qcd.SetDirectory(0)
+            dtype = hist2array(qcd).dtype
+            content, sumw2 = self.organizedHists.GetArrays(process='data_obs',region=region,include_overflow=True)
 
             bkg_sources = group.loc[group.process_type.eq('BKG') & group.variation.eq('nominal')]['process']
             for process_name in bkg_sources.to_list():
-                bkg_hist = self.organizedHists.Get(process=process_name,region=region,systematic='')
-                qcd.Add(bkg_hist,-1)
+                bkg_content, bkg_sumw2 = self.organizedHists.GetArrays(process=process_name,region=region,include_overflow=True)
+                # Same as TH1::Add(bkg,-1), including rounding to the storage type after each subtraction
+                content = numpy.subtract(content, bkg_content, dtype=numpy.float64).astype(dtype)
+                sumw2 = sumw2 + bkg_sumw2
 
-            out[region] = qcd
+            out[region] = array2hist(qcd, content, sumw2, include_overflow=True)
             
         return out
 
@@ -309,15 +390,29 @@ class TwoDAlphabet:
 
 # ---------- FIRST STEP CONSTRUCTION ------ #
     def _makeWorkspace(self):
+        print ("Making workspace...")
+        workspace = ROOT.RooWorkspace("w")
+        self._importHists(workspace, self.organizedHists.GetHistNames())
+        return workspace
+
+    def _importHists(self, workspace, hnames):
+        '''Make RooDataHists from the sub-region histograms in `hnames` and import them into `workspace`.
+        Histograms over the full X axis are skipped.
+
+        Args:
+            workspace (RooWorkspace): Workspace to import into.
+            hnames (list(str)): Names of histograms in organized_hists.root.
+
+        Returns:
+            None
+        '''
         var_lists = {}
         for binningName in self.binnings.keys():
             var_lists[binningName] = {
                 c:ROOT.RooArgList(self.binnings[binningName].xVars[c], self.binnings[binningName].yVar) for c in self.binnings[binningName].xbinByCat
             }
 
-        print ("Making workspace...")
-        workspace = ROOT.RooWorkspace("w")
-        for hname in self.organizedHists.GetHistNames():
+        for hname in hnames:
             cat = self._getCatNameRobust(hname)
             if cat == 'FULL':
                 continue
@@ -328,13 +423,12 @@ class TwoDAlphabet:
             rdh = make_RDH(self.organizedHists.Get(hname), var_lists[binningName][cat])
             getattr(workspace,'import')(rdh, ROOT.RooFit.Silence())
 
-        return workspace
-
     def MakeCard(self, subledger, subtag, workspaceDir='../'):
         with cd(self.tag):
             _runDirSetup(subtag)
             #MakeCard(subledger, subtag, workspaceDir)
-            MakeCard(subledger, self._subregionMap, subtag, workspaceDir)
+            autoMCStats = (self.options.mcstats_threshold, self.options.mcstats_include_signal) if self.options.mcstats and self.options.mcstats_native else None
+            MakeCard(subledger, self._subregionMap, subtag, workspaceDir, autoMCStats, self.options.ledgerExports)
 
 # -------- STAT METHODS ------------------ #
     def MLfit(self, subtag, cardOrW='card.txt', rInit=1, rMin=-1, rMax=10, setParams={}, verbosity=0, usePreviousFit=False, defMinStrat=0, extra=''):
@@ -684,27 +778,58 @@ class Ledger():
     def append(self, toAppend):
         self.df.concat(toAppend, ignore_index=True if isinstance(toAppend, dict) else False)
 
-    def select(self,f,*args):
-        def _kept_owner(row, owner_names):
-            if row.owner in owner_names:
-                return True
-            else:
-                return False
+    def select(self,f=None,*args,**filters):
+        '''Create a subset of the Ledger. Rows are kept with either a function evaluated on every
+        row (`f`) or, much faster, keyword filters on the columns that are evaluated as boolean masks.
+        Every filter must pass for a row to be kept. A filter on a column that a table does not
+        have (ex. "variation" for alphaObjs) does not drop any rows of that table.
+        The alphaParams are kept if their owner alpha object is kept.
+
+        Ex. `ledger.select(process_type='SIGNAL', process=re.compile('MX_2000'))`
 
-        eval_lambda = lambda row: f(row,args)
-        df = self.df.loc[self.df.apply(eval_lambda, axis=1)]
-        new_ledger = Ledger(df)
-        new_ledger.alphaObjs = self.alphaObjs.loc[self.alphaObjs.apply(eval_lambda, axis=1)]
-        owner_names = new_ledger.alphaObjs.apply(lambda owner_row: owner_row.process+'_'+owner_row.region, axis=1).to_list()
+        Args:
+            f (callable, optional): Function taking the row (pandas.Series) and `args`
+                and returning True to keep the row. Defaults to None.
+            *args: Extra arguments passed to `f`.
+            **filters: Column name to the value(s) to keep. Each value can be a string or number (exact match),
+                a list/tuple/set (any of), a compiled regular expression (search), or a callable taking
+                the column (pandas.Series) and returning a boolean mask.
 
+        Raises:
+            ValueError: If both or neither of `f` and `filters` are given.
+
+        Returns:
+            Ledger: New Ledger with the selected rows.
+        '''
+        if (f == None) == (len(filters) == 0):
+            raise ValueError('Ledger.select() needs either a function or keyword filters (not both).')
+
+        if f != None:
+            eval_lambda = lambda row: f(row,args)
+            _keep = lambda df: df.apply(eval_lambda, axis=1)
+        else:
+            _keep = lambda df: _filter_mask(df, filters)
+
+        new_ledger = Ledger(self.df.loc[_keep(self.df)])
+        new_ledger.alphaObjs = self.alphaObjs.loc[_keep(self.alphaObjs)]
+        owner_names = new_ledger.alphaObjs.process+'_'+new_ledger.alphaObjs.region
         new_ledger.alphaParams = self.alphaParams.loc[ # Keep params if owner object was kept
-                                        self.alphaParams.apply(
-                                            lambda row: _kept_owner(row, owner_names),
-                                            axis=1
-                                        )
+                                        self.alphaParams.owner.isin(owner_names)
                                     ]
         return new_ledger
 
+    def IndexSignals(self, key=None):
+        '''Index the rows of the Ledger by signal group (see SignalIndex).
+
+        Args:
+            key (str, optional): Regular expression that maps a signal process name to its group name.
+                Defaults to None in which case each signal process is its own group.
+
+        Returns:
+            SignalIndex: Index of the Ledger as it is now.
+        '''
+        return SignalIndex(self, key)
+
     def GetRegions(self):
         return list(self.df.region.unique())
 
@@ -796,27 +921,219 @@ class Ledger():
         out = pandas.concat([signal_map, bkg_map])
         return out
 
-    def _saveAlphas(self,outDir=''):
-        self.alphaObjs.to_csv(outDir+'/ledger_alphaObjs.csv')
-        self.alphaParams.to_csv(outDir+'/ledger_alphaParams.csv')
+    def Save(self, outDir, exports=[]):
+        '''Save the df, alphaObjs, and alphaParams tables to Parquet files (ledger_<table>.parquet)
+        with the dtypes from _normalize_ledger_dtypes() so that LoadLedger() reproduces them exactly.
 
-    def Save(self, outDir):
-        if 'index' in self.df.columns:
-               df = self.df.reset_index(drop=True).drop('index',axis=1)
-        else:  df = self.df
+        Args:
+            outDir (str): Directory in which to save.
+            exports (list(str), optional): Extra human-readable copies to write. "csv" writes ledger_<table>.csv
+                and "markdown" writes ledger_hists.md (df only). Defaults to [].
 
-        self.df.to_csv(outDir+'/ledger_df.csv')
-        if sys.version_info.major == 3:
+        Raises:
+            ValueError: If an export format is not recognized.
+        '''
+        for export in exports:
+            if export not in ['csv','markdown']:
+                raise ValueError('Ledger export format "%s" not accepted. Options are "csv" and "markdown".'%export)
+
+        for tablename, table in [('df',self.df), ('alphaObjs',self.alphaObjs), ('alphaParams',self.alphaParams)]:
+            table = _normalize_ledger_dtypes(table)
+            strings = [c for c in table.columns if table[c].dtype == object]
+            table.astype({c:'category' for c in strings}).to_parquet(outDir+'/ledger_%s.parquet'%tablename)
+            if 'csv' in exports:
+                table.to_csv(outDir+'/ledger_%s.csv'%tablename)
+
+        if 'markdown' in exports:
+            if 'index' in self.df.columns:
+                   df = self.df.reset_index(drop=True).drop('index',axis=1)
+            else:  df = self.df
             df.to_markdown(outDir+'/ledger_hists.md')
 
-        self._saveAlphas(outDir)
+def _normalize_ledger_dtypes(df):
+    '''Give every column of a Ledger table an explicit dtype so that it is stored and
+    loaded the same way regardless of which values the column happens to contain.
+    Columns with no values and numeric columns are float64, columns of flags (ex. "mcstat")
+    are bool with missing values as False, and all other columns are objects holding
+    str with NaN for missing values.
+
+    Args:
+        df (pandas.DataFrame): Table to normalize.
+
+    Returns:
+        pandas.DataFrame: New table with the same index.
+    '''
+    out = {}
+    for col in df.columns:
+        column = df[col]
+        if isinstance(column.dtype, pandas.CategoricalDtype):
+            column = column.astype(object)
+        if column.dtype.kind in 'biuf':
+            out[col] = column.astype(float) if column.dtype.kind in 'iu' else column
+            continue
+
+        notna = column.notna()
+        values = column[notna]
+        kinds = set(type(v) for v in values)
+        if len(values) == 0:
+            out[col] = pandas.Series(numpy.nan, index=df.index, dtype=float)
+        elif kinds <= {bool, numpy.bool_}:
+            out[col] = column.eq(True).astype(bool)
+        elif not any(issubclass(k,(str,bool,numpy.bool_)) for k in kinds) and all(issubclass(k,(int,float,numpy.number)) for k in kinds):
+            out[col] = column.astype(float)
+        else:
+            out[col] = pandas.Series(numpy.where(notna, column.astype(str).astype(object), numpy.nan), index=df.index, dtype=object)
+    return pandas.DataFrame(out, index=df.index, columns=df.columns)
+
+class SignalIndex():
+    '''Row positions of a Ledger's df, alphaObjs, and alphaParams grouped by signal.
+    Rows that do not belong to a signal are shared by every group. The index is
+    built once so getting the Ledger of each of many signals is linear in the number
+    of rows instead of evaluating every row of the Ledger for every signal (as with select()).
+    The index does not follow later changes to the Ledger.
+
+    Signal process names are matched from the start by `key`. The group name is the first
+    group of the pattern (or the whole match if the pattern has no groups).
+    Processes that do not match are their own group.
+    Ex. `key=r'(.*)_\d+$'` groups "MX_2000_16" and "MX_2000_17" into "MX_2000".
+    '''
+    def __init__(self, ledger, key=None):
+        '''Constructor.
+
+        Args:
+            ledger (Ledger): Ledger to index.
+            key (str, optional): Regular expression that maps a signal process name to its group name.
+                Defaults to None in which case each signal process is its own group.
+        '''
+        self.ledger = ledger
+        self.key = key
+        pattern = re.compile(key) if key != None else None
+        def _group_name(process):
+            match = pattern.match(process) if pattern != None else None
+            if match == None:
+                return process
+            return match.group(1) if pattern.groups else match.group(0)
+
+        def _positions(df):
+            is_signal = df.process_type.eq('SIGNAL').to_numpy(dtype=bool)
+            signal_pos = numpy.flatnonzero(is_signal)
+            groups = {}
+            if signal_pos.size:
+                procs = df.process.to_numpy()[signal_pos]
+                group_names = {p:_group_name(p) for p in pandas.unique(procs)}
+                names = numpy.array([group_names[p] for p in procs], dtype=object)
+                for g, idx in pandas.Series(signal_pos).groupby(names, sort=False).indices.items():
+                    groups[g] = signal_pos[idx]
+            return numpy.flatnonzero(~is_signal), groups
+
+        df_shared, df_groups = _positions(ledger.df)
+        obj_shared, obj_groups = _positions(ledger.alphaObjs)
+        owners = (ledger.alphaObjs.process+'_'+ledger.alphaObjs.region).to_numpy()
+        param_pos = pandas.Series(numpy.arange(len(ledger.alphaParams))).groupby(ledger.alphaParams.owner.to_numpy(), sort=False).indices if len(ledger.alphaParams) else {}
+        def _param_positions(obj_positions):
+            found = [param_pos[o] for o in owners[obj_positions] if o in param_pos]
+            return numpy.sort(numpy.concatenate(found)) if found else numpy.array([], dtype=int)
+
+        empty = numpy.array([], dtype=int)
+        self._shared = (df_shared, obj_shared, _param_positions(obj_shared))
+        self._groups = OrderedDict(
+            (g, (df_groups.get(g, empty), obj_groups.get(g, empty), _param_positions(obj_groups.get(g, empty))))
+            for g in list(df_groups.keys())+[g for g in obj_groups.keys() if g not in df_groups]
+        )
+
+    def GetGroups(self):
+        '''
+        Returns:
+            list(str): Signal group names in the order they first appear.
+        '''
+        return list(self._groups.keys())
+
+    def GetLedger(self, signal):
+        '''Create the subset of the indexed Ledger with all non-signal rows and only the rows
+        of one signal group.
+
+        Args:
+            signal (str): Signal group name (see GetGroups()).
+
+        Raises:
+            NameError: If `signal` is not a signal group.
+
+        Returns:
+            Ledger: New Ledger for the signal group.
+        '''
+        if signal not in self._groups:
+            raise NameError('Signal group "%s" does not exist. Options are %s.'%(signal, self.GetGroups()))
+
+        df_pos, obj_pos, param_pos = [
+            numpy.sort(numpy.concatenate([shared, sig])) for shared, sig in zip(self._shared, self._groups[signal])
+        ]
+        new_ledger = Ledger(self.ledger.df.iloc[df_pos])
+        new_ledger.alphaObjs = self.ledger.alphaObjs.iloc[obj_pos]
+        new_ledger.alphaParams = self.ledger.alphaParams.iloc[param_pos]
+        return new_ledger
+
+    def __iter__(self):
+        '''
+        Yields:
+            tuple: (0) Signal group name and (1) its Ledger from GetLedger().
+        '''
+        for signal in self._groups:
+            yield signal, self.GetLedger(signal)
+
+def _filter_mask(df, filters):
+    '''Evaluate the keyword filters of Ledger.select() on a DataFrame.
+
+    Args:
+        df (pandas.DataFrame): Table to evaluate.
+        filters (dict): Column name to the value(s) to keep.
+
+    Raises:
+        TypeError: If a callable filter does not return a boolean mask of the same length as `df`.
+
+    Returns:
+        numpy.ndarray: Boolean mask of the rows to keep.
+    '''
+    mask = numpy.ones(len(df), dtype=bool)
+    for col, value in filters.items():
+        if col not in df.columns:
+            continue
+        column = df[col]
+        if isinstance(value, re.Pattern):
+            this_mask = column.astype(str).str.contains(value, regex=True)
+        elif callable(value):
+            this_mask = value(column)
+        elif isinstance(value, (list, tuple, set, frozenset, numpy.ndarray, pandas.Series)):
+            this_mask = column.isin(list(value))
+        else:
+            this_mask = column.eq(value)
+
+        this_mask = numpy.asarray(this_mask)
+        if this_mask.dtype != bool or this_mask.shape != (len(df),):
+            raise TypeError('Filter on column "%s" did not evaluate to a boolean mask of length %s.'%(col, len(df)))
+        mask &= this_mask
+    return mask
 
 def LoadLedger(indir=''):
-    df = pandas.read_csv(indir+'ledger_df.csv', index_col=0)
-    ledger = Ledger(df)
-    ledger.alphaObjs = pandas.read_csv(indir+'ledger_alphaObjs.csv', index_col=0)
-    ledger.alphaParams = pandas.read_csv(indir+'ledger_alphaParams.csv', index_col=0)
+    '''Load a Ledger saved by Ledger.Save(). Project directories made before the
+    Parquet files existed are loaded from their CSVs.
+
+    Args:
+        indir (str, optional): Directory (with trailing slash) holding the ledger files. Defaults to ''.
+
+    Returns:
+        Ledger: Loaded Ledger.
+    '''
+    tables = {}
+    for tablename in ['df','alphaObjs','alphaParams']:
+        if os.path.exists(indir+'ledger_%s.parquet'%tablename):
+            table = pandas.read_parquet(indir+'ledger_%s.parquet'%tablename)
+            tables[tablename] = table.astype({c:object for c in table.columns if isinstance(table[c].dtype, pandas.CategoricalDtype)})
+        else:
+            tables[tablename] = _normalize_ledger_dtypes(pandas.read_csv(indir+'ledger_%s.csv'%tablename, index_col=0))
 
+    ledger = Ledger(intern_strings(tables['df']))
+    ledger.alphaObjs = tables['alphaObjs']
+    ledger.alphaParams = tables['alphaParams']
     return ledger
 
 def _runDirSetup(runDir):
@@ -834,7 +1151,19 @@ def _runDirSetup(runDir):
     return runDir
 
 #def MakeCard(ledger, subtag, workspaceDir):
-def MakeCard(ledger, subregionMap, subtag, workspaceDir):
+def MakeCard(ledger, subregionMap, subtag, workspaceDir, autoMCStats=None, ledgerExports=[]):
+    '''Write the Combine card for the processes and systematics in the ledger.
+
+    Args:
+        ledger (Ledger): Ledger of processes, systematics, and alpha objects.
+        subregionMap (dict): Region name to list of sub-region names.
+        subtag (str): Directory in which to write card.txt.
+        workspaceDir (str): Path of base.root relative to subtag.
+        autoMCStats (tuple, optional): (threshold, include_signal) for a native autoMCStats line
+            for every channel of a region with only template processes and no explicit MC statistical
+            uncertainty templates. Defaults to None in which case no autoMCStats lines are written.
+        ledgerExports (list(str), optional): Extra formats in which to save the ledger (see Ledger.Save()). Defaults to [].
+    '''
     combine_idx_map = ledger._getCombineIdxMap()
 
     card_new = open('%s/card.txt'%subtag,'w')
@@ -913,7 +1242,11 @@ def MakeCard(ledger, subregionMap, subtag, workspaceDir):
 
             for syst in syst_lines.keys():
                 if syst in group.variation.unique():
-                    syst_effect = group.loc[group.variation.eq(syst)].apply(lambda row: row[row.syst_type],axis=1).iloc[0]
+                    syst_group = group.loc[group.variation.eq(syst)]
+                    if 'subregion' in syst_group.columns and isinstance(syst_group.subregion.iloc[0], str) and syst_group.subregion.iloc[0] != cat:
+                        syst_effect = '-' # sparse MC stat template only exists in one sub-region
+                    else:
+                        syst_effect = syst_group.apply(lambda row: row[row.syst_type],axis=1).iloc[0]
                 else:
                     syst_effect = '-'
 
@@ -944,6 +1277,15 @@ def MakeCard(ledger, subregionMap, subtag, workspaceDir):
     for line_key in syst_lines.keys():
         card_new.write(syst_lines[line_key]+'\n')
 
+    if autoMCStats != None:
+        threshold, include_signal = autoMCStats
+        explicit = ledger.df[ledger.df.mcstat.eq(True)].region.unique() if 'mcstat' in ledger.df.columns else []
+        for region in ledger.GetRegions():
+            if region in ledger.alphaObjs.region.unique() or region in explicit:
+                continue
+            for cat in subregionMap[region]:
+                card_new.write('{0:40} autoMCStats {1} {2}\n'.format(region+'_'+cat, threshold, int(include_signal)))
+
     ######################################################
     # Mark floating values as flatParams                 #
     # We float just the rpf params and the failing bins. #
@@ -952,7 +1294,7 @@ def MakeCard(ledger, subregionMap, subtag, workspaceDir):
         card_new.write('{0:40} {1}\n'.format(param.name, param.constraint))
     
     card_new.close()
-    ledger.Save(subtag)
+    ledger.Save(subtag, ledgerExports)
 
 def _runMLfit(cardOrW, blinding, verbosity, rInit, rMin, rMax, setParams, defMinStrat, usePreviousFit=False, extra=''):
     '''
@@ -222,8 +222,9 @@ def test_fit(SRorCR):
 
     # Make card reads the ledger and creates a Combine card from it.
     # The second argument specifices the sub-directory to save the card in.
-    # MakeCard() will also save the corresponding Ledger DataFrames as csvs
-    # in the sub-directory for later reference/debugging. By default, MakeCard()
+    # MakeCard() will also save the corresponding Ledger DataFrames (as Parquet files
+    # plus any formats in the ledgerExports option, ex. "csv") in the sub-directory
+    # for later reference/debugging. By default, MakeCard()
     # will reference the base.root workspace in the first level of the project directory
     # (../ relative to the card). However, one can specify another path if a different
     # workspace is desired. Additionally, a different dataset can be supplied via
@@ -264,13 +265,18 @@ def test_limit(SRorCR):
     # can loop over the list values without worrying if the config has changed over time
     # (necessitating remembering that it changed and having to hard-code the list here).
     print ('Possible signals: %s'%twoD.iterWorkspaceObjs['SIGNAME'])
+    # Pick the TF once (an empty signal name keeps every signal). The per-signal
+    # subsets are then taken from a SignalIndex which finds the rows of every signal once
+    # instead of evaluating every row of the Ledger for every signal.
+    # Signals are grouped by their name without the "_18" suffix.
+    signals = twoD.ledger.select(_select_signal, '', poly_order).IndexSignals(key=r'(.*)_18$')
     for signame in twoD.iterWorkspaceObjs['SIGNAME']:
         # signame is going too look like <what we want>_18 so drop the last three characters
         signame = signame[:-3]
         print ('Performing limit for %s'%signame)
 
         # Make a subset and card as in test_fit()
-        subset = twoD.ledger.select(_select_signal, signame, poly_order)
+        subset = signals.GetLedger(signame)
         twoD.MakeCard(subset, signame+'_area')
         # Run the blinded limit with our dictionary of TF parameters
         twoD.Limit(
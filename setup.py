@@ -5,6 +5,7 @@ import setuptools, sys
 requires = [
       'pandas',
       'Pillow',
+      'pyarrow',
       'tabulate'
 ]
 if sys.version_info.major == 3:
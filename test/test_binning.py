@@ -0,0 +1,202 @@
+import array
+import pickle
+import numpy as np
+import pytest
+ROOT = pytest.importorskip('ROOT')
+from TwoDAlphabet.binning import Binning, save_binnings, load_binnings, rebin_hist_2d, split_hist_in_x
+from TwoDAlphabet.helpers import hist2array
+
+_binning_dicts = {
+    'uniform': {
+        'X': {'NAME': 'xaxis', 'TITLE': 'X', 'MIN': 60, 'MAX': 260, 'NBINS': 10, 'SIGSTART': 100, 'SIGEND': 140},
+        'Y': {'NAME': 'yaxis', 'TITLE': 'Y', 'MIN': 800, 'MAX': 3000, 'NBINS': 11},
+    },
+    'variable': {
+        'X': {'NAME': 'xaxis', 'TITLE': 'X', 'BINS': [60, 70, 85, 100, 120, 140, 170, 200, 230, 260], 'BOUNDARIES': [100, 140]},
+        'Y': {'NAME': 'yaxis', 'TITLE': 'Y', 'BINS': [800, 900, 1100, 1500, 2200, 3000]},
+    },
+    'single': {
+        'X': {'NAME': 'xaxis', 'TITLE': 'X', 'MIN': 60, 'MAX': 260, 'NBINS': 8},
+        'Y': {'NAME': 'yaxis', 'TITLE': 'Y', 'MIN': 800, 'MAX': 3000, 'NBINS': 4},
+    },
+}
+_tables = ['_xbinList', '_xedges', '_yedges', '_xcats', '_xcatEnds', '_xoffsets',
+           '_xcenters', '_xcentersMapped', '_ycenters', '_ycentersMapped']
+
+'''--------------------------Helper functions---------------------------'''
+def _make_binnings():
+    template = ROOT.TH2D('template', 'template', 20, 60, 260, 22, 800, 3000)
+    template.SetDirectory(0)
+    return {name: Binning(name, d, template) for name, d in _binning_dicts.items()}
+
+def _assert_same_value(a, b, what):
+    if isinstance(a, np.ndarray):
+        assert isinstance(b, np.ndarray) and not b.flags.writeable, what
+        assert np.array_equal(a, b), what
+    elif isinstance(a, dict):
+        assert list(a) == list(b), what
+        for k in a:
+            _assert_same_value(a[k], b[k], '%s[%s]'%(what, k))
+    else:
+        assert a == b, what
+
+def _assert_same_binning(a, b):
+    assert a.ToDict() == b.ToDict()
+    assert a.boundaries == b.boundaries
+    assert a.xbinByCat == b.xbinByCat
+    assert a.ybinList == b.ybinList
+    for t in _tables:
+        _assert_same_value(getattr(a, t), getattr(b, t), '%s %s'%(a.name, t))
+
+'''--------------------------Persistence---------------------------'''
+def test_json_round_trip(tmp_path):
+    binnings = _make_binnings()
+    save_binnings(binnings, str(tmp_path/'binnings.json'))
+    loaded = load_binnings(str(tmp_path/'binnings.json'))
+    assert list(loaded) == list(binnings)
+    for name in binnings:
+        _assert_same_binning(binnings[name], loaded[name])
+        assert loaded[name]._xVars is None
+
+def test_from_dict_missing_key():
+    d = _make_binnings()['variable'].ToDict()
+    del d['boundaries']
+    with pytest.raises(KeyError, match='boundaries'):
+        Binning.FromDict(d)
+
+def test_pickle_round_trip():
+    for b in _make_binnings().values():
+        _assert_same_binning(b, pickle.loads(pickle.dumps(b)))
+
+def test_setstate_old_pickle():
+    for b in _make_binnings().values():
+        # State of a Binning pickled before the tables existed and the RooRealVars were made lazily
+        state = {k: v for k, v in b.__dict__.items() if k not in _tables and k not in ['_xVars', '_yVar']}
+        state['xVars'], state['yVar'] = None, None
+        old = Binning.__new__(Binning)
+        old.__setstate__(state)
+        _assert_same_binning(b, old)
+        assert old._xVars is None and old._yVar is None
+        assert 'xVars' not in old.__dict__
+
+'''--------------------------Global X bins---------------------------'''
+def test_global_xbin_round_trip():
+    for b in _make_binnings().values():
+        nbins = len(b.xbinList)-1
+        seen = []
+        for g in range(1, nbins+1):
+            local, c = b.xcatFromGlobal(g)
+            assert 1 <= local <= len(b.xbinByCat[c])-1, (b.name, g)
+            assert b.GlobalXbinIdx(local, c) == g, (b.name, g)
+            # Same bin edges in the category as in the full axis
+            assert b.xbinByCat[c][local-1] == b.xbinList[g-1] and b.xbinByCat[c][local] == b.xbinList[g], (b.name, g)
+            seen.append((c, local))
+        # Every (category, local bin) is reached once and in order
+        assert seen == [(c, i) for c in b.xbinByCat for i in range(1, len(b.xbinByCat[c]))]
+        for c, edges in b.xbinByCat.items():
+            assert b.xcatFromGlobal(b.GlobalXbinIdx(1, c)) == (1, c)
+            assert b.xcatFromGlobal(b.GlobalXbinIdx(-1, c)) == (len(edges)-1, c)
+        for g in [0, nbins+1]:
+            with pytest.raises(ValueError):
+                b.xcatFromGlobal(g)
+
+def test_global_xbin_category_boundaries():
+    b = _make_binnings()['variable']
+    assert list(b.xbinByCat) == ['Region0', 'Region1', 'Region2']
+    # Region0 has 3 bins, Region1 has 2, and Region2 has 4
+    expected = {1: (1, 'Region0'), 3: (3, 'Region0'), 4: (1, 'Region1'), 5: (2, 'Region1'), 6: (1, 'Region2'), 9: (4, 'Region2')}
+    for g, (local, c) in expected.items():
+        assert b.xcatFromGlobal(g) == (local, c)
+        assert b.GlobalXbinIdx(local, c) == g
+
+'''--------------------------Rebinning---------------------------'''
+_input_xbins = [60, 65, 70, 80, 85, 100, 110, 120, 140, 150, 170, 200, 215, 230, 260]
+_input_ybins = [800, 850, 900, 1000, 1100, 1300, 1500, 1800, 2200, 2600, 3000]
+_xbinByCat = {'Region0': [60, 70, 85, 100], 'Region1': [100, 120, 140], 'Region2': [140, 170, 200, 230, 260]}
+_ybins = [800, 900, 1100, 1500, 2200, 3000]
+
+def _make_input_hist(name):
+    h = ROOT.TH2D(name, name, len(_input_xbins)-1, array.array('d', _input_xbins),
+                  len(_input_ybins)-1, array.array('d', _input_ybins))
+    h.SetDirectory(0)
+    h.Sumw2()
+    rng = np.random.default_rng(7)
+    for ix in range(1, len(_input_xbins)):
+        for iy in range(1, len(_input_ybins)):
+            c = rng.uniform(-5, 20) # includes negative bins which are zeroed after rebinning
+            h.SetBinContent(ix, iy, c)
+            h.SetBinError(ix, iy, rng.uniform(0.5, 4))
+    return h
+
+def _loop_rebin(content, sumw2, old_xbins, old_ybins, new_xbins, new_ybins):
+    '''Rebin with the per-bin loop of copy_hist_with_new_bins() before it used arrays
+    (Y then X for the axes that change, keeping only positive new bins).
+
+    Returns:
+        tuple: (0) content and (1) sum of weights squared indexed as [y, x].
+    '''
+    def loop(content, sumw2, old_bins, new_bins, axis):
+        shape = list(content.shape)
+        shape[axis] = len(new_bins)-1
+        new_content, new_sumw2 = np.zeros(shape), np.zeros(shape)
+        for static in range(content.shape[1-axis]):
+            for inew in range(len(new_bins)-1):
+                total, errsq = 0.0, 0.0
+                for iold in range(len(old_bins)-1):
+                    if old_bins[iold] >= new_bins[inew] and old_bins[iold+1] <= new_bins[inew+1]:
+                        idx = (iold, static) if axis == 0 else (static, iold)
+                        total += content[idx]
+                        errsq += sumw2[idx]
+                if total > 0:
+                    idx = (inew, static) if axis == 0 else (static, inew)
+                    new_content[idx], new_sumw2[idx] = total, errsq
+        return new_content, new_sumw2
+    if list(old_ybins) != list(new_ybins):
+        content, sumw2 = loop(content, sumw2, old_ybins, new_ybins, 0)
+    if list(old_xbins) != list(new_xbins):
+        content, sumw2 = loop(content, sumw2, old_xbins, new_xbins, 1)
+    return content, sumw2
+
+def _assert_hist_matches(h, content, sumw2, xbins, ybins):
+    h_content, h_errors = hist2array(h, return_errors=True)
+    assert h_content == pytest.approx(content, rel=1e-6)
+    assert h_errors**2 == pytest.approx(sumw2, rel=1e-5)
+    for axis, edges in [(h.GetXaxis(), xbins), (h.GetYaxis(), ybins)]:
+        assert [axis.GetBinLowEdge(i) for i in range(1, axis.GetNbins()+2)] == pytest.approx(edges)
+
+@pytest.mark.parametrize('rebinX,rebinY', [(True, True), (True, False), (False, True)])
+def test_rebin_matches_loop(rebinX, rebinY):
+    h = _make_input_hist('h_rebin')
+    content, errors = hist2array(h, return_errors=True)
+    xbinByCat = _xbinByCat if rebinX else {'Region0': _input_xbins[:6], 'Region1': _input_xbins[5:9], 'Region2': _input_xbins[8:]}
+    xbins = xbinByCat['Region0'] + xbinByCat['Region1'][1:] + xbinByCat['Region2'][1:]
+    ybins = _ybins if rebinY else _input_ybins
+
+    full, cats = rebin_hist_2d('proc_SR_FULL', h, xbinByCat, ybins)
+    ref_content, ref_sumw2 = _loop_rebin(content, errors**2, _input_xbins, _input_ybins, xbins, ybins)
+    _assert_hist_matches(full, ref_content, ref_sumw2, xbins, ybins)
+
+    assert list(cats) == list(xbinByCat)
+    for cat, catbins in xbinByCat.items():
+        assert cats[cat].GetName() == 'proc_SR_'+cat
+        cat_content, cat_sumw2 = _loop_rebin(ref_content, ref_sumw2, xbins, ybins, catbins, ybins)
+        _assert_hist_matches(cats[cat], cat_content, cat_sumw2, catbins, ybins)
+
+def test_split_matches_loop():
+    h = _make_input_hist('h_split_FULL')
+    content, errors = hist2array(h, return_errors=True)
+    # Categories that also merge bins of the full axis
+    xbinByCat = {'Region0': [60, 80, 100], 'Region1': [100, 140], 'Region2': [140, 150, 200, 260]}
+    cats = split_hist_in_x(h, xbinByCat)
+    for cat, catbins in xbinByCat.items():
+        cat_content, cat_sumw2 = _loop_rebin(content, errors**2, _input_xbins, _input_ybins, catbins, _input_ybins)
+        _assert_hist_matches(cats[cat], cat_content, cat_sumw2, catbins, _input_ybins)
+
+def test_rebin_misaligned_edge():
+    h = _make_input_hist('h_misaligned')
+    with pytest.raises(ValueError, match='does not align'):
+        rebin_hist_2d('proc_SR_FULL', h, dict(_xbinByCat, Region0=[60, 75, 85, 100]), _ybins)
+    with pytest.raises(ValueError, match='does not align'):
+        rebin_hist_2d('proc_SR_FULL', h, _xbinByCat, [800, 950, 1100, 1500, 2200, 3000])
+    with pytest.raises(ValueError, match='does not align'):
+        split_hist_in_x(h, {'Region0': [60, 90, 100], 'Region1': [100, 140, 260]})
@@ -0,0 +1,60 @@
+import subprocess
+import sys
+import pytest
+ROOT = pytest.importorskip('ROOT')
+from TwoDAlphabet.twoDalphabet import TwoDAlphabet
+from TwoDAlphabet.alphawrap import BinnedDistribution, ParametricFunction
+
+_form = '0.1*(@0+@1*x+@2*y+@3*x*y)'
+_constraints = {0:{'MIN':0,'MAX':1}, 1:{'MIN':-5,'MAX':5}, 2:{'MIN':-5,'MAX':5}, 3:{'MIN':-5,'MAX':5}}
+
+'''--------------------------Helper functions---------------------------'''
+def _setup(tag):
+    twoD = TwoDAlphabet(tag, 'twoDtest_cicd.json', loadPrevious=False)
+    qcd_hists = twoD.InitQCDHists()
+    binning_f, _ = twoD.GetBinningFor('CR_fail')
+    qcd_f = BinnedDistribution('Background_CR_fail', qcd_hists['CR_fail'], binning_f, constant=False)
+    return twoD, binning_f, qcd_f
+
+def _bin_vals(obj):
+    return [obj.getBinVal(xbin,ybin)
+            for ybin in range(1,len(obj.binning.ybinList))
+            for xbin in range(1,len(obj.binning.xbinList))]
+
+'''--------------------------Compiled Generic2D---------------------------'''
+def test_compiled_matches_uncompiled():
+    _, binning_f, qcd_f = _setup('compiled_cicd')
+    plain = ParametricFunction('Background_CR_rpf_plain', binning_f, _form, constraints=_constraints)
+    compiled = ParametricFunction('Background_CR_rpf_compiled', binning_f, _form, constraints=_constraints, compiled=True)
+    pairs = [
+        (plain, compiled),
+        (qcd_f.Multiply('Background_CR_pass_plain', plain), qcd_f.Multiply('Background_CR_pass_compiled', compiled)),
+        (plain.Add('Background_CR_diff_plain', qcd_f, factor='-1'), compiled.Add('Background_CR_diff_compiled', qcd_f, factor='-1')),
+    ]
+    assert all(out.compiled for _, out in pairs)
+
+    for values in [[0.1, 0, 0, 0], [0.5, 1.2, -0.7, 0.3], [0.9, -4, 2.5, -1]]:
+        for i, value in enumerate(values):
+            plain.setFuncParam(i, value)
+            compiled.setFuncParam(i, value)
+        for uncompiled_obj, compiled_obj in pairs:
+            assert _bin_vals(compiled_obj) == pytest.approx(_bin_vals(uncompiled_obj)), compiled_obj.name
+
+def test_compiled_workspace_reloads():
+    twoD, binning_f, qcd_f = _setup('compiled_save_cicd')
+    rpf = ParametricFunction('Background_CR_rpf', binning_f, _form, constraints=_constraints, compiled=True)
+    qcd_p = qcd_f.Multiply('Background_CR_pass', rpf)
+    twoD.AddAlphaObj('Background', 'CR_fail', qcd_f)
+    twoD.AddAlphaObj('Background', 'CR_pass', qcd_p)
+    twoD.Save()
+
+    # A fresh process has not loaded the classes so they must be compiled from the workspace
+    check = '\n'.join([
+        "import math, ROOT",
+        "w = ROOT.TFile.Open('compiled_save_cicd/base.root').Get('w')",
+        "objs = [arg for arg in w.components() if arg.ClassName().startswith('TwoDAlphabetCategory')]",
+        "assert objs",
+        "assert all(math.isfinite(arg.getVal()) for arg in objs)",
+    ])
+    result = subprocess.run([sys.executable, '-c', check], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,124 @@
+import copy
+import json
+import os
+import pandas
+import pytest
+from numpy import nan
+ROOT = pytest.importorskip('ROOT')
+from TwoDAlphabet import config as config_module
+from TwoDAlphabet.config import Config, MultiReplacer, config_loop_replace
+from TwoDAlphabet.helpers import replace_multi
+
+'''--------------------------Helper functions---------------------------'''
+def _parse(tmp_path, config):
+    path = tmp_path/'config.json'
+    path.write_text(json.dumps(config))
+    return Config(str(path))
+
+def _loop_replace(config):
+    '''GLOBAL replacement with one config_loop_replace() walk per key,
+    as done before MultiReplacer.'''
+    config = copy.deepcopy(config)
+    for old in list(config['GLOBAL']):
+        if not isinstance(config['GLOBAL'][old], list):
+            config = config_loop_replace(config, old, config['GLOBAL'][old])
+    return config
+
+def _apply_keyword_replace(df, col_strs):
+    '''Row-by-row _keyword_replace() as done before it was vectorized.'''
+    def _batch_replace(row, s=None):
+        if pandas.isna(row[s]):
+            return nan
+        return replace_multi(row[s], {'$process': row.alias, '$region': row.region, '$syst': row.variation_alias})
+    for col_str in col_strs:
+        df[col_str] = df.apply(_batch_replace, axis='columns', s=col_str)
+    return df
+
+def _apply_condense_nameinfo(df, baseColName):
+    '''Row-by-row _df_condense_nameinfo() as done before it was vectorized.'''
+    df[baseColName] = df.apply(lambda row: row[baseColName+'_syst'] if pandas.notna(row[baseColName+'_syst']) else row[baseColName], axis='columns')
+    df.drop(baseColName+'_syst', axis='columns', inplace=True)
+    return df
+
+'''--------------------------MultiReplacer---------------------------'''
+def test_chained_globals(tmp_path):
+    config = {
+        'GLOBAL': {'year': '16', 'tag': 'pass-year', 'path': 'data/tag'},
+        'PROCESSES': {'ttbar': {'LOC': 'path/ttbar-year.root:hist-tag'}}
+    }
+    parsed = _parse(tmp_path, config).config
+    assert parsed['PROCESSES']['ttbar']['LOC'] == 'data/pass-16/ttbar-16.root:hist-pass-16'
+    assert parsed == _loop_replace(config)
+
+def test_chained_globals_later_key(tmp_path):
+    # A value that uses a later GLOBAL key is substituted when that key is applied
+    config = {
+        'GLOBAL': {'path': 'data/tag', 'tag': 'pass'},
+        'PROCESSES': {'ttbar': {'LOC': 'path/ttbar.root'}}
+    }
+    parsed = _parse(tmp_path, config).config
+    assert parsed['PROCESSES']['ttbar']['LOC'] == 'data/pass/ttbar.root'
+    assert parsed == _loop_replace(config)
+
+def test_numeric_globals(tmp_path):
+    config = {
+        'GLOBAL': {'xsec': 1.5, 'proc': 'ttbar'},
+        'PROCESSES': {'ttbar': {'SCALE': 'xsec', 'TITLE': 'xsec-proc', 'COLOR': 2}}
+    }
+    parsed = _parse(tmp_path, config).config
+    # Non-string replacements only replace values that match in their entirety
+    assert parsed['PROCESSES']['ttbar'] == {'SCALE': 1.5, 'TITLE': 'xsec-ttbar', 'COLOR': 2}
+    assert parsed == _loop_replace(config)
+
+def test_list_globals(tmp_path):
+    config = {
+        'GLOBAL': {'signal': ['TprimeB-1800', 'TprimeB-1200'], 'year': '16'},
+        'PROCESSES': {'ttbar': {'SYSTEMATICS': ['lumi-year', 'year', 'signal']}}
+    }
+    parsed = _parse(tmp_path, config)
+    assert parsed.iterWorkspaceObjs == {'signal': ['TprimeB-1800', 'TprimeB-1200']}
+    assert parsed.config['PROCESSES']['ttbar']['SYSTEMATICS'] == ['lumi-16', '16', 'signal']
+    assert parsed.config == _loop_replace(config)
+
+def test_keys_containing_globals(tmp_path):
+    config = {
+        'GLOBAL': {'year': '16'},
+        'REGIONS': {'SR-year': {'BINNING': 'year'}, 'SR_year': {}, 'CR': {}}
+    }
+    parsed = _parse(tmp_path, config).config
+    # Keys are renamed in place (whole words only) and GLOBAL keys are kept
+    assert list(parsed['REGIONS']) == ['SR-16', 'SR_year', 'CR']
+    assert parsed['REGIONS']['SR-16'] == {'BINNING': '16'}
+    assert parsed['GLOBAL'] == {'year': '16'}
+
+def test_dict_valued_globals(tmp_path):
+    # Any dict-valued GLOBAL falls back to config_loop_replace()
+    config = {
+        'GLOBAL': {'lumidef': {'VAL': 1.02}, 'procname': 'ttbar', 'sigs': ['a', 'b']},
+        'SYSTEMATICS': {'lumi': 'lumidef'},
+        'PROCESSES': {'x': {'LOC': 'procname.root'}}
+    }
+    parsed = _parse(tmp_path, config)
+    assert parsed.config['SYSTEMATICS']['lumi'] == {'VAL': 1.02}
+    assert parsed.config['PROCESSES']['x']['LOC'] == 'ttbar.root'
+    assert parsed.iterWorkspaceObjs == {'sigs': ['a', 'b']}
+    assert parsed.config == _loop_replace(config)
+
+def test_finds_are_literal():
+    replacer = MultiReplacer()
+    replacer.Add('a.b', 'X')
+    assert replacer.Replace('a.b acb') == 'X acb'
+    assert replacer.Replace(3) == 3
+    with pytest.raises(TypeError):
+        replacer.ReplaceInConfig('a.b')
+
+'''--------------------------FullTable---------------------------'''
+def test_full_table_matches_apply(monkeypatch):
+    json_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'twoDtest_cicd.json')
+    table = Config(json_path).FullTable()
+    assert table.source_filename.str.contains(r'\$').sum() == 0
+    assert table.source_histname.str.contains(r'\$').sum() == 0
+
+    monkeypatch.setattr(config_module, '_keyword_replace', _apply_keyword_replace)
+    monkeypatch.setattr(config_module, '_df_condense_nameinfo', _apply_condense_nameinfo)
+    pandas.testing.assert_frame_equal(table, Config(json_path).FullTable())
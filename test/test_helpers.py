@@ -0,0 +1,42 @@
+import os
+import pytest
+ROOT = pytest.importorskip('ROOT')
+from TwoDAlphabet.helpers import open_tfile_for_writing, _compression_algorithms
+
+'''--------------------------Output files---------------------------'''
+def _write(path, **kwargs):
+    f = open_tfile_for_writing(path, **kwargs)
+    h = ROOT.TH1D('h', 'h', 10, 0, 1)
+    h.SetDirectory(0)
+    for i in range(1, 11):
+        h.SetBinContent(i, i)
+    f.WriteTObject(h, 'h')
+    f.Close()
+
+@pytest.mark.parametrize('algorithm', list(_compression_algorithms))
+@pytest.mark.parametrize('level', [1, 9])
+def test_compression_settings(tmp_path, algorithm, level):
+    path = str(tmp_path/'out.root')
+    _write(path, algorithm=algorithm, level=level)
+    f = ROOT.TFile.Open(path)
+    assert f.GetCompressionAlgorithm() == _compression_algorithms[algorithm]
+    assert f.GetCompressionLevel() == level
+    assert f.Get('h').GetBinContent(10) == 10
+    f.Close()
+
+def test_default_compression(tmp_path):
+    # Without options, the file keeps the ROOT default settings
+    _write(str(tmp_path/'default.root'))
+    f = ROOT.TFile.Open(str(tmp_path/'plain.root'), 'RECREATE')
+    f.Close()
+    default, plain = ROOT.TFile.Open(str(tmp_path/'default.root')), ROOT.TFile.Open(str(tmp_path/'plain.root'))
+    assert default.GetCompressionSettings() == plain.GetCompressionSettings()
+    assert default.Get('h').GetBinContent(10) == 10
+    default.Close()
+    plain.Close()
+
+def test_unknown_compression(tmp_path):
+    path = str(tmp_path/'bad.root')
+    with pytest.raises(ValueError, match='Compression algorithm "gzip" not accepted'):
+        open_tfile_for_writing(path, algorithm='gzip')
+    assert not os.path.exists(path)
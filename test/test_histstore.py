@@ -0,0 +1,83 @@
+import array
+import numpy as np
+import pytest
+ROOT = pytest.importorskip('ROOT')
+from TwoDAlphabet.histstore import ArrayStore
+from TwoDAlphabet.helpers import hist2array, hist2sumw2
+from TwoDAlphabet.binning import get_bins_from_hist
+
+'''--------------------------Helper functions---------------------------'''
+def _make_hist(name, cls='TH2F'):
+    xbins = array.array('d', [0, 1, 3, 6, 10])
+    ybins = array.array('d', [0, 5, 10, 20])
+    h = getattr(ROOT, cls)(name, name+' title', len(xbins)-1, xbins, len(ybins)-1, ybins)
+    h.SetDirectory(0)
+    h.Sumw2()
+    h.GetXaxis().SetName('mx')
+    h.GetYaxis().SetName('my')
+    h.SetFillColor(632)
+    for ix in range(0, h.GetNbinsX()+2): # including under/overflow
+        for iy in range(0, h.GetNbinsY()+2):
+            h.SetBinContent(ix, iy, 1.5*ix + 10*iy)
+            h.SetBinError(ix, iy, 0.25*(ix+iy+1))
+    return h
+
+def _assert_same_hist(a, b):
+    assert a.ClassName() == b.ClassName()
+    assert a.GetTitle() == b.GetTitle()
+    assert a.GetFillColor() == b.GetFillColor()
+    assert a.GetEntries() == b.GetEntries()
+    for axis in ['X', 'Y']:
+        assert get_bins_from_hist(axis, a) == get_bins_from_hist(axis, b)
+        assert getattr(a, 'Get%saxis'%axis)().GetName() == getattr(b, 'Get%saxis'%axis)().GetName()
+    assert np.array_equal(hist2array(a, include_overflow=True), hist2array(b, include_overflow=True))
+    assert np.array_equal(hist2sumw2(a, include_overflow=True), hist2sumw2(b, include_overflow=True))
+
+'''--------------------------ArrayStore---------------------------'''
+@pytest.mark.parametrize('cls', ['TH2F', 'TH2D'])
+def test_write_get_arrays(tmp_path, cls):
+    h = _make_hist('h', cls)
+    store = ArrayStore(str(tmp_path/'store.dat'), 'w')
+    store.WriteHist(h)
+    for include_overflow in [False, True]:
+        content, sumw2 = store.GetArrays('h', include_overflow)
+        assert np.array_equal(content, hist2array(h, include_overflow))
+        assert np.array_equal(sumw2, hist2sumw2(h, include_overflow))
+    assert store.GetEdges('h') == (get_bins_from_hist('X', h), get_bins_from_hist('Y', h))
+    store.Close()
+
+@pytest.mark.parametrize('cls', ['TH2F', 'TH2D'])
+def test_get_rebuilds_hist(tmp_path, cls):
+    h = _make_hist('h', cls)
+    assert h.GetEntries() > 0
+    store = ArrayStore(str(tmp_path/'store.dat'), 'w')
+    store.WriteHist(h)
+    store.WriteHist(h, 'renamed')
+    rebuilt = store.Get('h')
+    assert rebuilt.GetName() == 'h'
+    _assert_same_hist(rebuilt, h)
+    assert store.Get('renamed').GetName() == 'renamed'
+    store.Close()
+
+def test_reopen_after_close(tmp_path):
+    filename = str(tmp_path/'store.dat')
+    first, second = _make_hist('first'), _make_hist('second', 'TH2D')
+    second.Scale(3)
+
+    store = ArrayStore(filename, 'w')
+    store.WriteHist(first)
+    store.Close()
+
+    store = ArrayStore(filename, 'a')
+    store.WriteHist(second)
+    store.Close()
+
+    store = ArrayStore(filename, 'r')
+    assert store.GetNames() == ['first', 'second']
+    _assert_same_hist(store.Get('first'), first)
+    _assert_same_hist(store.Get('second'), second)
+    content, _ = store.GetArrays('second')
+    assert not content.flags.writeable
+    with pytest.raises(IOError):
+        store.WriteHist(first)
+    store.Close()
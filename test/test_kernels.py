@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+from TwoDAlphabet import kernels
+
+'''--------------------------Rebinning---------------------------'''
+def test_rebin_positions_aligned():
+    old = [0, 1, 2, 3, 4]
+    assert kernels.rebin_positions(old, [0, 2, 4]).tolist() == [0, 2, 4]
+    assert kernels.rebin_positions(old, [1, 3]).tolist() == [1, 3]
+
+def test_rebin_positions_clamps_out_of_range():
+    old = [0, 1, 2, 3, 4]
+    # Edges below/above the old axis map to its first/last edge so those bins stay empty
+    assert kernels.rebin_positions(old, [-2, -1, 0, 2, 6]).tolist() == [0, 0, 0, 2, 4]
+    assert kernels.rebin_positions(old, [2, 5, 6]).tolist() == [2, 4, 4]
+
+def test_rebin_positions_split_bin():
+    with pytest.raises(ValueError, match=r'Cannot split input bin \[1.0,2.0\]'):
+        kernels.rebin_positions([0, 1, 2, 3], [0, 1.5, 3], 'Y')
+
+def test_rebin_positions_float32_edges():
+    # Edges read back from a TH2F axis are the float32 values of the requested edges
+    old = np.array([0, 0.1, 0.2, 0.3], dtype=np.float32).astype(float).tolist()
+    new = list(np.array([0, 0.2, 0.3], dtype=np.float32))
+    assert kernels.rebin_positions(old, new).tolist() == [0, 2, 3]
+    with pytest.raises(ValueError):
+        kernels.rebin_positions(old, [0, 0.2, 0.3]) # float64 0.2 is not an edge
+
+def test_rebin_arrays():
+    content = np.arange(12, dtype=np.float32).reshape(3, 4) # [y, x]
+    sumw2 = np.ones((3, 4))
+    positions = kernels.rebin_positions([0, 1, 2, 3, 4], [0, 1, 3, 4])
+    new_content, new_sumw2 = kernels.rebin_arrays([content, sumw2], positions, axis=1)
+    assert new_content.dtype == np.float64
+    assert new_content.tolist() == [[0, 3, 3], [4, 11, 7], [8, 19, 11]]
+    assert new_sumw2.tolist() == [[1, 2, 1]]*3
+
+    positions = kernels.rebin_positions([0, 1, 2, 3], [0, 3])
+    new_content, = kernels.rebin_arrays([content], positions, axis=0)
+    assert new_content.tolist() == [[12, 15, 18, 21]]
+
+def test_rebin_arrays_out_of_range_bins_empty():
+    content = np.ones((1, 4))
+    positions = kernels.rebin_positions([0, 1, 2, 3, 4], [-1, 0, 2, 4, 5])
+    new_content, = kernels.rebin_arrays([content], positions, axis=1)
+    assert new_content.tolist() == [[0, 2, 2, 0]]
+
+'''--------------------------Stitching and blinding---------------------------'''
+def test_stitch():
+    contents = [np.array([[1, 2], [3, 4]], dtype=np.float32), np.array([[5], [6]]), np.array([[7, 8], [9, 10]])]
+    sumw2s = [c*2 for c in contents]
+    content, sumw2 = kernels.stitch(contents, sumw2s)
+    assert content.dtype == np.float64
+    assert content.tolist() == [[1, 2, 5, 7, 8], [3, 4, 6, 9, 10]]
+    assert sumw2.tolist() == [[2, 4, 10, 14, 16], [6, 8, 12, 18, 20]]
+
+    content, sumw2 = kernels.stitch(contents, sumw2s, blinded=[1])
+    assert content.tolist() == [[1, 2, 0, 7, 8], [3, 4, 0, 9, 10]]
+    assert sumw2.tolist() == [[2, 4, 0, 14, 16], [6, 8, 0, 18, 20]]
+
+def test_stitch_shape_mismatch():
+    with pytest.raises(ValueError):
+        kernels.stitch([np.ones((2, 2)), np.ones((3, 1))], [np.ones((2, 2)), np.ones((3, 1))])
+
+def test_blind():
+    content = np.array([[1, -1, 3, 4], [0, 2, 5, -2]])
+    content, sumw2 = kernels.blind(content, np.ones((2, 4)), [0, 1, 2, 3, 4], [1, 3])
+    # X bins 1 and 2 are in [1,3] and bins without positive content are emptied
+    assert content.tolist() == [[1, 0, 0, 4], [0, 0, 0, 0]]
+    assert sumw2.tolist() == [[1, 0, 0, 1], [0, 0, 0, 0]]
+
+'''--------------------------Bin manipulations---------------------------'''
+def test_zero_negative():
+    content, sumw2 = kernels.zero_negative(np.array([1, -2, 0, 3]), np.array([1, 4, 0, 9]))
+    assert content.dtype == np.float64 and sumw2.dtype == np.float64
+    assert content.tolist() == [1, 0, 0, 3]
+    assert sumw2.tolist() == [1, 0, 0, 9]
+
+def test_remap_edges():
+    assert kernels.remap_edges([60, 110, 160, 260]).tolist() == [0, 0.25, 0.5, 1]
+    assert kernels.remap_edges([60, 110, 160, 260], -1, 1).tolist() == [-1, -0.5, 0, 1]
+
+def test_events_per_unit():
+    content, sumw2 = kernels.events_per_unit(np.array([2, 4, 9]), np.array([1, 1, 1]), np.array([1, 2, 3]), 1)
+    assert content.tolist() == [2, 2, 3]
+    assert sumw2.tolist() == pytest.approx([1, 0.25, 1/9.])
+
+def test_min_bin_width():
+    assert kernels.min_bin_width(np.array([2.5, 1.7, 3])) == 1
+    assert kernels.min_bin_width(np.array([5e6])) == 10**6
+    assert kernels.min_bin_width(np.array([5]), cap=3) == 3
+    assert kernels.min_bin_width(np.array([])) == 10**6
@@ -0,0 +1,151 @@
+import re
+import numpy as np
+import pandas
+import pytest
+ROOT = pytest.importorskip('ROOT')
+from TwoDAlphabet.twoDalphabet import Ledger, LoadLedger, _normalize_ledger_dtypes
+
+'''--------------------------Helper functions---------------------------'''
+def _make_ledger():
+    rows = []
+    for region in ['SR_pass', 'SR_fail']:
+        for process, ptype in [('data_obs','DATA'), ('ttbar_16','BKG'), ('TprimeB-1800_16','SIGNAL'), ('TprimeB-1200_16','SIGNAL')]:
+            for variation in ['nominal', 'lumi'] if ptype != 'DATA' else ['nominal']:
+                rows.append({'process': process, 'region': region, 'process_type': ptype,
+                             'variation': variation, 'scale': 1.0 if region == 'SR_pass' else 0.5})
+    ledger = Ledger(pandas.DataFrame(rows))
+    ledger.alphaObjs = pandas.DataFrame([
+        {'process': 'Background_1x1', 'region': 'SR_pass', 'process_type': 'BKG', 'color': 'yellow', 'title': 'Background'},
+        {'process': 'Background_2x1', 'region': 'SR_pass', 'process_type': 'BKG', 'color': 'yellow', 'title': 'Background'},
+        {'process': 'Background', 'region': 'SR_fail', 'process_type': 'BKG', 'color': 'yellow', 'title': 'Background'},
+    ])
+    ledger.alphaParams = pandas.DataFrame([
+        {'name': 'p0', 'constraint': 'flatParam', 'owner': 'Background_1x1_SR_pass'},
+        {'name': 'p1', 'constraint': 'flatParam', 'owner': 'Background_2x1_SR_pass'},
+        {'name': 'f0', 'constraint': 'flatParam', 'owner': 'Background_SR_fail'},
+    ])
+    return ledger
+
+def _plain(df):
+    return df.astype({c:object for c in df.columns if isinstance(df[c].dtype, pandas.CategoricalDtype)})
+
+def _mixed_ledger():
+    ledger = _make_ledger()
+    df = _plain(ledger.df)
+    df['color'] = ['black', 2, 'red', np.nan, 4.0, 'red', 2]*2
+    ledger.df = df
+    ledger.alphaObjs = ledger.alphaObjs.assign(color=['yellow', 5, np.nan], combine_idx=[1, 2, np.nan])
+    return ledger
+
+def _rows(df, col):
+    return sorted(map(str, df[col]))
+
+def _select_signal(row, args):
+    signame, poly_order = args
+    if row.process_type == 'SIGNAL':
+        return signame in row.process
+    elif 'Background_' in row.process:
+        return row.process == 'Background_'+poly_order
+    return True
+
+'''--------------------------Ledger.select()---------------------------'''
+def test_select_regex():
+    subset = _make_ledger().select(process=re.compile('1800'))
+    assert set(subset.df.process) == {'TprimeB-1800_16'}
+    assert len(subset.df) == 4
+    assert subset.alphaObjs.empty and subset.alphaParams.empty
+
+def test_select_callable():
+    subset = _make_ledger().select(scale=lambda col: col > 0.75)
+    assert set(subset.df.region) == {'SR_pass'}
+    assert len(subset.df) == 7
+    assert len(subset.alphaObjs) == 3 # no scale column: no alpha object is dropped
+
+def test_select_list_and_set():
+    ledger = _make_ledger()
+    for value in [['ttbar_16', 'Background'], {'ttbar_16', 'Background'}, ('ttbar_16', 'Background')]:
+        subset = ledger.select(process=value)
+        assert set(subset.df.process) == {'ttbar_16'}
+        assert _rows(subset.alphaObjs, 'process') == ['Background']
+        assert _rows(subset.alphaParams, 'owner') == ['Background_SR_fail']
+
+def test_select_scalar():
+    subset = _make_ledger().select(region='SR_fail', process_type='BKG')
+    assert _rows(subset.df, 'process') == ['ttbar_16', 'ttbar_16']
+    assert _rows(subset.alphaObjs, 'process') == ['Background']
+    assert _rows(subset.alphaParams, 'name') == ['f0']
+
+def test_select_column_missing_from_alphaObjs():
+    subset = _make_ledger().select(variation='lumi')
+    assert set(subset.df.variation) == {'lumi'}
+    assert len(subset.df) == 6
+    assert len(subset.alphaObjs) == 3 and len(subset.alphaParams) == 3
+
+def test_select_bad_mask():
+    with pytest.raises(TypeError):
+        _make_ledger().select(scale=lambda col: col.sum())
+    with pytest.raises(ValueError):
+        _make_ledger().select()
+    with pytest.raises(ValueError):
+        _make_ledger().select(_select_signal, 'TprimeB-1800', '1x1', region='SR_pass')
+
+def test_select_function():
+    ledger = _make_ledger()
+    subset = ledger.select(_select_signal, 'TprimeB-1800', '1x1')
+    # Same rows as the row-by-row selection done before the keyword filters existed
+    keep = lambda df: df.loc[df.apply(lambda row: _select_signal(row, ('TprimeB-1800', '1x1')), axis=1)]
+    assert subset.df.index.tolist() == keep(ledger.df).index.tolist()
+    assert subset.alphaObjs.index.tolist() == keep(ledger.alphaObjs).index.tolist()
+    assert _rows(subset.alphaParams, 'name') == ['f0', 'p0']
+    assert 'TprimeB-1200_16' not in set(subset.df.process)
+    # ...and the same rows as the equivalent keyword filters
+    filtered = ledger.select(process=lambda col: ~col.astype(str).str.contains('TprimeB-1200|Background_2x1'))
+    assert subset.df.index.tolist() == filtered.df.index.tolist()
+    assert subset.alphaObjs.index.tolist() == filtered.alphaObjs.index.tolist()
+
+'''--------------------------Save and LoadLedger()---------------------------'''
+def test_save_load_parquet(tmp_path):
+    ledger = _mixed_ledger()
+    ledger.Save(str(tmp_path))
+    loaded = LoadLedger(str(tmp_path)+'/')
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['ledger_alphaObjs.parquet', 'ledger_alphaParams.parquet', 'ledger_df.parquet']
+
+    for original, table in [(ledger.df, loaded.df), (ledger.alphaObjs, loaded.alphaObjs), (ledger.alphaParams, loaded.alphaParams)]:
+        pandas.testing.assert_frame_equal(_plain(table), _normalize_ledger_dtypes(original))
+    # Mixed-type columns are read back as str (or NaN) and numbers as float
+    assert _plain(loaded.df).color.fillna('NaN').tolist()[:7] == ['black', '2', 'red', 'NaN', '4.0', 'red', '2']
+    assert loaded.alphaObjs.color.fillna('NaN').tolist() == ['yellow', '5', 'NaN']
+    assert loaded.alphaObjs.combine_idx.dtype == float
+    assert loaded.alphaObjs.combine_idx.tolist()[:2] == [1.0, 2.0]
+
+def test_load_csv_fallback(tmp_path):
+    ledger = _mixed_ledger()
+    ledger.Save(str(tmp_path), exports=['csv'])
+    from_parquet = LoadLedger(str(tmp_path)+'/')
+    for p in tmp_path.glob('*.parquet'):
+        p.unlink()
+    from_csv = LoadLedger(str(tmp_path)+'/')
+
+    for parquet_table, csv_table in [(from_parquet.df, from_csv.df), (from_parquet.alphaObjs, from_csv.alphaObjs), (from_parquet.alphaParams, from_csv.alphaParams)]:
+        pandas.testing.assert_frame_equal(_plain(csv_table), _plain(parquet_table))
+
+'''--------------------------Getters---------------------------'''
+def test_getters_follow_inplace_edits():
+    ledger = _make_ledger()
+    assert 'ttbar_17' not in ledger.GetProcesses()
+    ledger.df.loc[ledger.df.process.eq('ttbar_16'), 'process'] = 'ttbar_17'
+    ledger.df.loc[0, 'region'] = 'SR_new'
+    assert 'ttbar_17' in ledger.GetProcesses('BKG') and 'ttbar_16' not in ledger.GetProcesses('BKG')
+    assert 'SR_new' in ledger.GetRegions()
+    assert ('ttbar_17', 'SR_pass') in ledger.GetProcRegPairs()
+
+def test_load_interns_strings(tmp_path):
+    _make_ledger().Save(str(tmp_path), exports=['csv'])
+    for p in tmp_path.glob('*.parquet'):
+        p.unlink()
+    loaded = LoadLedger(str(tmp_path)+'/')
+    processes = loaded.df.process.tolist()
+    assert processes[1] == processes[2] == 'ttbar_16'
+    assert processes[1] is processes[2]
+    # Subsets share the strings of the loaded table
+    assert loaded.select(region='SR_fail').df.process.tolist()[1] is processes[1]
@@ -0,0 +1,17 @@
+import numpy as np
+import pytest
+ROOT = pytest.importorskip('ROOT')
+from TwoDAlphabet.twoDalphabet import TwoDAlphabet
+
+def test_sparse_templates_match_dense():
+    dense = TwoDAlphabet('mcstat_dense_cicd', 'twoDtest_cicd.json', loadPrevious=False, externalOpts={'mcstats_sparse': False})
+    sparse = TwoDAlphabet('mcstat_sparse_cicd', 'twoDtest_cicd.json', loadPrevious=False, externalOpts={'mcstats_sparse': True})
+
+    templates = sparse.organizedHists._sparse
+    assert templates
+    assert not dense.organizedHists._sparse
+    for histname in templates:
+        sparse_content, sparse_sumw2 = sparse.organizedHists.GetArrays(histname, include_overflow=True)
+        dense_content, dense_sumw2 = dense.organizedHists.GetArrays(histname, include_overflow=True)
+        assert np.array_equal(sparse_content, dense_content), histname
+        assert np.array_equal(sparse_sumw2, dense_sumw2), histname
@@ -0,0 +1,303 @@
+import math
+import os
+import numpy as np
+import pandas
+import pytest
+ROOT = pytest.importorskip('ROOT')
+from TwoDAlphabet.config import OrganizedHists
+from TwoDAlphabet.binning import Binning
+
+_binning_dict = {
+    'X': {'NAME': 'xaxis', 'TITLE': 'X', 'MIN': 60, 'MAX': 260, 'NBINS': 10, 'SIGSTART': 100, 'SIGEND': 140},
+    'Y': {'NAME': 'yaxis', 'TITLE': 'Y', 'MIN': 800, 'MAX': 3000, 'NBINS': 11},
+}
+_inputs = {'a.root': ['ttbar', 'wjets'], 'b.root': ['qcd']}
+
+'''--------------------------Helper functions---------------------------'''
+def _make_hist(name, seed):
+    rng = np.random.default_rng(seed)
+    h = ROOT.TH2D(name, name, 20, 60, 260, 22, 800, 3000)
+    h.SetDirectory(0)
+    h.Sumw2()
+    for ix in range(1, 21):
+        for iy in range(1, 23):
+            c = rng.uniform(1, 20)
+            h.SetBinContent(ix, iy, c)
+            h.SetBinError(ix, iy, np.sqrt(c)*rng.uniform(0.5, 2))
+    return h
+
+def _setup(tmp_path):
+    '''Write the input files and make the binnings and histogram map (as from TwoDAlphabet.GetHistMap()).'''
+    hist_map = {}
+    for seed, (filename, procs) in enumerate(_inputs.items()):
+        path = str(tmp_path/filename)
+        f = ROOT.TFile.Open(path, 'RECREATE')
+        for i, p in enumerate(procs):
+            f.WriteTObject(_make_hist('h_'+p, 10*seed+i), 'h_'+p)
+        f.Close()
+        hist_map[(path,)] = pandas.DataFrame({
+            'source_histname': ['h_'+p for p in procs],
+            'out_histname': [p+'_SR_FULL' for p in procs],
+            'scale': [1.0]*len(procs),
+            'color': ['red']*len(procs),
+            'binning': ['default']*len(procs),
+        })
+    binnings = {'default': Binning('default', _binning_dict, _make_hist('template', 99))}
+    projPath = str(tmp_path/'proj')+'/'
+    os.makedirs(projPath)
+    return projPath, binnings, hist_map
+
+def _arrays(hists):
+    return {n: [np.array(a) for a in hists.GetArrays(n)] for n in hists.GetHistNames()}
+
+def _assert_same_arrays(a, b):
+    assert sorted(a) == sorted(b)
+    for n in a:
+        assert np.array_equal(a[n][0], b[n][0]), n
+        assert np.array_equal(a[n][1], b[n][1]), n
+
+def _record_ingested(monkeypatch):
+    '''Record the output names of the rows ingested by each OrganizedHists.Add().'''
+    ingested = []
+    addSerial = OrganizedHists._addSerial
+    def _addSerial(self, hist_map, edges, infiles):
+        ingested.append(sorted(n for histdf in hist_map.values() for n in histdf.out_histname))
+        return addSerial(self, hist_map, edges, infiles)
+    monkeypatch.setattr(OrganizedHists, '_addSerial', _addSerial)
+    return ingested
+
+'''--------------------------Incremental rebuild---------------------------'''
+@pytest.mark.parametrize('backend', ['root', 'mmap'])
+def test_rebuild_unchanged(tmp_path, monkeypatch, backend):
+    projPath, binnings, hist_map = _setup(tmp_path)
+    ingested = _record_ingested(monkeypatch)
+    first = OrganizedHists(projPath, binnings, hist_map, backend=backend)
+    before = _arrays(first)
+    first.file.Close()
+
+    second = OrganizedHists(projPath, binnings, hist_map, backend=backend)
+    assert ingested == [['qcd_SR_FULL', 'ttbar_SR_FULL', 'wjets_SR_FULL'], []]
+    _assert_same_arrays(_arrays(second), before)
+    assert not any('_prev' in f for f in os.listdir(projPath))
+
+@pytest.mark.parametrize('backend', ['root', 'mmap'])
+def test_rebuild_one_changed_entry(tmp_path, monkeypatch, backend):
+    projPath, binnings, hist_map = _setup(tmp_path)
+    ingested = _record_ingested(monkeypatch)
+    first = OrganizedHists(projPath, binnings, hist_map, backend=backend)
+    before = _arrays(first)
+    first.file.Close()
+
+    key = (str(tmp_path/'a.root'),)
+    hist_map[key] = hist_map[key].assign(scale=[1.0, 2.0]) # wjets only
+    second = OrganizedHists(projPath, binnings, hist_map, backend=backend)
+    assert ingested[-1] == ['wjets_SR_FULL']
+
+    after = _arrays(second)
+    assert sorted(after) == sorted(before)
+    for n in after:
+        if n.startswith('wjets_'):
+            assert after[n][0] == pytest.approx(2*before[n][0])
+        else:
+            assert np.array_equal(after[n][0], before[n][0]), n
+
+@pytest.mark.parametrize('backend', ['root', 'mmap'])
+def test_failed_rebuild_restores_previous(tmp_path, monkeypatch, backend):
+    projPath, binnings, hist_map = _setup(tmp_path)
+    first = OrganizedHists(projPath, binnings, hist_map, backend=backend)
+    before = _arrays(first)
+    first.file.Close()
+    files = sorted(os.listdir(projPath))
+
+    key = (str(tmp_path/'b.root'),)
+    bad_map = dict(hist_map)
+    bad_map[key] = hist_map[key].assign(source_histname=['h_missing'])
+    with pytest.raises(NameError):
+        OrganizedHists(projPath, binnings, bad_map, backend=backend)
+
+    # The last good store (and its manifest) is back in place...
+    assert sorted(os.listdir(projPath)) == files
+    _assert_same_arrays(_arrays(OrganizedHists(projPath, binnings, hist_map, readOnly=True, backend=backend)), before)
+    # ...and is reused by the next rebuild
+    ingested = _record_ingested(monkeypatch)
+    OrganizedHists(projPath, binnings, hist_map, backend=backend)
+    assert ingested == [[]]
+
+'''--------------------------Parallel ingestion---------------------------'''
+@pytest.mark.parametrize('backend', ['root', 'mmap'])
+@pytest.mark.parametrize('lazy', [False, True])
+def test_parallel_matches_serial(tmp_path, monkeypatch, backend, lazy):
+    projPath, binnings, hist_map = _setup(tmp_path)
+    serial = OrganizedHists(projPath, binnings, hist_map, backend=backend, lazy=lazy)
+
+    used = []
+    addParallel = OrganizedHists._addParallel
+    def _addParallel(self, hist_map, edges):
+        used.append(self.nworkers)
+        return addParallel(self, hist_map, edges)
+    monkeypatch.setattr(OrganizedHists, '_addParallel', _addParallel)
+    parallelPath = str(tmp_path/'parallel')+'/'
+    os.makedirs(parallelPath)
+    parallel = OrganizedHists(parallelPath, binnings, hist_map, nworkers=2, backend=backend, lazy=lazy)
+
+    assert used == [2]
+    assert parallel.GetHistNames() == serial.GetHistNames()
+    _assert_same_arrays(_arrays(parallel), _arrays(serial))
+    for n in serial.GetHistNames():
+        assert parallel.Get(n).GetFillColor() == serial.Get(n).GetFillColor(), n
+
+'''--------------------------MC statistical uncertainties---------------------------'''
+_mcstat_binning_dict = {
+    'X': {'NAME': 'xaxis', 'TITLE': 'X', 'MIN': 0, 'MAX': 40, 'NBINS': 4, 'SIGSTART': 10, 'SIGEND': 30},
+    'Y': {'NAME': 'yaxis', 'TITLE': 'Y', 'MIN': 0, 'MAX': 20, 'NBINS': 2},
+}
+# (content, error) indexed as [y][x]. Covers a bin where every process is empty (x=2, y=1), a bin with
+# alpha < alpha_min (x=3, y=1), BB-lite bins, and per-process bins with one empty process (x=4, y=2).
+_mcstat_inputs = {
+    'ttbar': [[(100, 10), (0, 0), (4, 0.1), (50, 5)], [(2, 1.5), (30, 3), (0, 0), (8, 4)]],
+    'qcd':   [[(20, 4), (0, 0), (1, 0.05), (0, 0)], [(0.5, 0.5), (10, 5), (0, 0), (0, 0)]],
+    'data_obs': [[(120, 11), (0, 0), (5, 2.2), (50, 7)], [(3, 1.7), (40, 6.3), (0, 0), (8, 2.8)]],
+}
+
+def _setup_mcstat(tmp_path):
+    path = str(tmp_path/'mcstat.root')
+    f = ROOT.TFile.Open(path, 'RECREATE')
+    for p, bins in _mcstat_inputs.items():
+        h = ROOT.TH2D('h_'+p, 'h_'+p, 4, 0, 40, 2, 0, 20)
+        h.SetDirectory(0)
+        h.Sumw2()
+        for iy, row in enumerate(bins):
+            for ix, (c, e) in enumerate(row):
+                h.SetBinContent(ix+1, iy+1, c)
+                h.SetBinError(ix+1, iy+1, e)
+        f.WriteTObject(h, h.GetName())
+    f.Close()
+    hist_map = {(path,): pandas.DataFrame({
+        'source_histname': ['h_'+p for p in _mcstat_inputs],
+        'out_histname': [p+'_SR_FULL' for p in _mcstat_inputs],
+        'scale': [1.0]*3, 'color': ['red', 'yellow', 'black'], 'binning': ['default']*3,
+    })}
+    df = pandas.DataFrame({
+        'process': list(_mcstat_inputs), 'region': ['SR']*3, 'process_type': ['BKG', 'BKG', 'DATA'],
+        'variation': ['nominal']*3, 'binning': ['default']*3, 'color': ['red', 'yellow', 'black'],
+    })
+    template = ROOT.TH2D('template', 'template', 4, 0, 40, 2, 0, 20)
+    template.SetDirectory(0)
+    binnings = {'default': Binning('default', _mcstat_binning_dict, template)}
+    projPath = str(tmp_path/'proj')+'/'
+    os.makedirs(projPath)
+    return projPath, binnings, hist_map, df
+
+def _loop_mcstat(nominal, region, threshold, alpha_min, name_prefix='mcstat'):
+    '''MC-stat templates from the per-bin loop used before AddMCStatShapes() was vectorized.
+
+    Returns:
+        list(tuple): (process, variation, direction, bx, by, templated bin content) in the order they are made.
+    '''
+    out = []
+    sample = next(iter(nominal.values()))
+    for bx in range(1, sample.GetNbinsX()+1):
+        for by in range(1, sample.GetNbinsY()+1):
+            n_tot = sum(h.GetBinContent(bx, by) for h in nominal.values())
+            e_tot = math.sqrt(sum(h.GetBinError(bx, by)**2 for h in nominal.values()))
+            if e_tot == 0.0:
+                continue
+            N_eff_tot = int(round(n_tot*n_tot/(e_tot*e_tot)))
+            alpha = n_tot/N_eff_tot if N_eff_tot > 0 else 0.0
+            if alpha < alpha_min:
+                continue
+            templates = []
+            if N_eff_tot > threshold:
+                templates = [(p, '%s_%s_bx%d_by%d'%(name_prefix, region, bx, by), e_tot/n_tot) for p in nominal]
+            else:
+                for p, h in nominal.items():
+                    c, e = h.GetBinContent(bx, by), h.GetBinError(bx, by)
+                    if c > 0.0 and e > 0.0:
+                        templates.append((p, '%s_%s_%s_bx%d_by%d'%(name_prefix, region, p, bx, by), e/c))
+            for p, variation, rel in templates:
+                c = nominal[p].GetBinContent(bx, by)
+                for direction, factor in (('Up', 1.0+rel), ('Down', max(0.0, 1.0-rel))):
+                    out.append((p, variation, direction, bx, by, c*factor))
+    return out
+
+@pytest.mark.parametrize('verbose', [False, True])
+def test_mcstat_matches_loop(tmp_path, verbose):
+    projPath, binnings, hist_map, df = _setup_mcstat(tmp_path)
+    hists = OrganizedHists(projPath, binnings, hist_map)
+    nominal = {p: hists.Get(p+'_SR_FULL') for p in ['ttbar', 'qcd']}
+    expected = _loop_mcstat(nominal, 'SR', threshold=10, alpha_min=0.1)
+    # The hand-built bins give both kinds of templates
+    assert any('_ttbar_' in t[1] for t in expected) and any('_qcd_' in t[1] for t in expected)
+    assert any('_ttbar_' not in t[1] and '_qcd_' not in t[1] for t in expected)
+
+    rows = hists.AddMCStatShapes(df, binnings, threshold=10, alpha_min=0.1, verbose=verbose)
+    assert [(r['process'], r['variation'], r['direction']) for r in rows] == [t[:3] for t in expected]
+    for p, variation, direction, bx, by, content in expected:
+        template = np.array(hists.GetArrays('%s_SR_FULL_%s%s'%(p, variation, direction))[0])
+        nominal_content = np.array(hists.GetArrays(p+'_SR_FULL')[0])
+        assert template[by-1, bx-1] == pytest.approx(content)
+        template[by-1, bx-1] = nominal_content[by-1, bx-1]
+        assert np.array_equal(template, nominal_content)
+
+'''--------------------------Lazy sub-regions---------------------------'''
+def _subregion_names(hists):
+    return sorted(n for n in hists.GetHistNames() if not n.endswith('_FULL'))
+
+def test_lazy_matches_eager(tmp_path):
+    built = {}
+    for lazy in [False, True]:
+        path = tmp_path/('lazy' if lazy else 'eager')
+        path.mkdir()
+        projPath, binnings, hist_map = _setup(path)
+        built[lazy] = OrganizedHists(projPath, binnings, hist_map, lazy=lazy)
+    eager, lazy = built[False], built[True]
+
+    assert sorted(lazy._lazy) == _subregion_names(eager)
+    assert sorted(lazy.GetHistNames()) == sorted(eager.GetHistNames())
+    for n in _subregion_names(eager):
+        for include_overflow in [False, True]:
+            _assert_same_arrays({n: lazy.GetArrays(n, include_overflow=include_overflow)},
+                                {n: eager.GetArrays(n, include_overflow=include_overflow)})
+        h_lazy, h_eager = lazy.Get(n), eager.Get(n)
+        for axis in ['GetXaxis', 'GetYaxis']:
+            a_lazy, a_eager = getattr(h_lazy, axis)(), getattr(h_eager, axis)()
+            assert a_lazy.GetNbins() == a_eager.GetNbins(), n
+            assert [a_lazy.GetBinLowEdge(i) for i in range(1, a_lazy.GetNbins()+2)] == \
+                   [a_eager.GetBinLowEdge(i) for i in range(1, a_eager.GetNbins()+2)], n
+        assert h_lazy.GetFillColor() == h_eager.GetFillColor(), n
+
+def test_lazy_cache_evicts(tmp_path, monkeypatch):
+    import TwoDAlphabet.config as config
+    monkeypatch.setattr(config, '_lazy_cache_size', 2)
+    splits = []
+    def counting_split(h, xbinByCat):
+        splits.append(h.GetName())
+        return split_hist_in_x(h, xbinByCat)
+    split_hist_in_x = config.split_hist_in_x
+    monkeypatch.setattr(config, 'split_hist_in_x', counting_split)
+
+    projPath, binnings, hist_map = _setup(tmp_path)
+    hists = OrganizedHists(projPath, binnings, hist_map, lazy=True)
+    first, second, third = _subregion_names(hists)[:3]
+    expected = np.array(hists.GetArrays(first)[0])
+
+    hists.Get(first)
+    hists.Get(second)
+    assert list(hists._lazyCache) == [first, second]
+    # A cache hit is not split again and becomes the most recently used
+    hists.Get(first)
+    assert len(splits) == 2
+    assert list(hists._lazyCache) == [second, first]
+    # Over the limit, the least recently used is dropped
+    hists.Get(third)
+    assert list(hists._lazyCache) == [first, third]
+    hists.Get(second)
+    assert list(hists._lazyCache) == [third, second]
+    assert len(splits) == 4
+
+    # Changing a returned histogram does not change the cached split
+    h = hists.Get(third)
+    h.Scale(0)
+    assert np.any(np.array(hists.GetArrays(third)[0]) != 0)
+    hists.Get(first)
+    assert np.array_equal(np.array(hists.GetArrays(first)[0]), expected)
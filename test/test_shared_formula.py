@@ -0,0 +1,44 @@
+import re
+import pytest
+ROOT = pytest.importorskip('ROOT')
+from TwoDAlphabet.twoDalphabet import TwoDAlphabet
+from TwoDAlphabet.alphawrap import ParametricFunction
+
+_constraints = {i:{'MIN':-5,'MAX':5} for i in range(3)}
+
+'''--------------------------Helper functions---------------------------'''
+@pytest.fixture(scope='module')
+def binning():
+    twoD = TwoDAlphabet('shared_formula_cicd', 'twoDtest_cicd.json', loadPrevious=False)
+    binning_f, _ = twoD.GetBinningFor('CR_fail')
+    return binning_f
+
+def _bin_vals(obj):
+    return [obj.getBinVal(xbin,ybin)
+            for ybin in range(1,len(obj.binning.ybinList))
+            for xbin in range(1,len(obj.binning.xbinList))]
+
+'''--------------------------sharedFormula---------------------------'''
+@pytest.mark.parametrize('name,formula', [
+    ('x', '0.1*(@0+@1*x+@2*x*x)'),
+    ('y', '0.1*(@0+@1*y+@2*y*y)'),
+    ('xy', '0.1*(@0+@1*x+@2*y)'),
+    ('xy_unordered', '0.1*(@2*x+@0+@1*y*y)'), # highest index comes first
+    ('x_gap', '0.1*(@0+@2*x)'), # @1 is not used
+])
+def test_shared_formula_matches_default(binning, name, formula):
+    default = ParametricFunction('rpf_default_'+name, binning, formula, constraints=_constraints, forcePositive=False)
+    shared = ParametricFunction('rpf_shared_'+name, binning, formula, constraints=_constraints, forcePositive=False, sharedFormula=True)
+
+    # The used parameters are renumbered in order and "x" and "y" take the indices that follow
+    shared_formula, params, use_x, use_y = shared._sharedFormula()
+    assert params == sorted({int(i) for i in re.findall(r'@(\d+)', formula)})
+    assert (use_x, use_y) == ('x' in name, 'y' in name)
+    assert not re.search(r'\b[xy]\b', shared_formula)
+    assert {int(i) for i in re.findall(r'@(\d+)', shared_formula)} == set(range(len(params)+use_x+use_y))
+
+    for values in [[0.1, 0.1, 0.1], [1, -2, 0.5], [-0.3, 4, -1.5]]:
+        for i, value in enumerate(values):
+            default.setFuncParam(i, value)
+            shared.setFuncParam(i, value)
+        assert _bin_vals(shared) == pytest.approx(_bin_vals(default))